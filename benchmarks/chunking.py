@@ -0,0 +1,90 @@
+"""
+Benchmark of the number of chunks touched per read for every access profile.
+
+For a synthetic volume, the chunk shapes of every pyramid level are derived for each access profile
+(and zarr's default guess) and the reads of typical access patterns are replayed on the chunk grid:
+random 3D patches, axial slices and coronal slices. Optionally, the reads are also timed on a saved file.
+
+Usage:
+    python benchmarks/chunking.py --shape 512 512 512 --dtype uint16 [--timed]
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+from typing import Tuple, List, Dict
+import numpy as np
+from mzarr import Mzarr
+from mzarr.pyramid import level_shape
+from mzarr.chunking import pyramid_chunks, chunks_touched, random_regions
+from zarr.util import guess_chunks
+
+
+def read_patterns(shape: Tuple[int, ...], count: int) -> Dict[str, List[Tuple[slice, ...]]]:
+    """
+    Generate the regions of typical access patterns of a volume.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the volume.
+        count (int): The number of regions per pattern.
+
+    Returns:
+        Dict[str, List[Tuple[slice, ...]]]: The regions of random 3D patches ('patch3d'), of axial slices ('axial')
+            and of coronal slices ('coronal').
+    """
+
+    patterns = {
+        "patch3d": random_regions(shape, tuple(min(128, s) for s in shape), count),
+        "axial": [(slice(z, z + 1), slice(None), slice(None)) for z in np.linspace(0, shape[0] - 1, count).astype(int)],
+        "coronal": [(slice(None), slice(y, y + 1), slice(None)) for y in np.linspace(0, shape[1] - 1, count).astype(int)],
+    }
+    return patterns
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shape", nargs=3, type=int, default=[512, 512, 512], help="Shape of the synthetic volume.")
+    parser.add_argument("--dtype", default="uint16", help="Dtype of the synthetic volume.")
+    parser.add_argument("--levels", type=int, default=3, help="Number of coarser pyramid levels.")
+    parser.add_argument("--reads", type=int, default=50, help="Number of reads per access pattern.")
+    parser.add_argument("--chunk-bytes", type=int, default=1024 ** 2, help="Target bytes of a base level chunk.")
+    parser.add_argument("--timed", action="store_true", help="Also save the volume and time the reads of the base level.")
+    args = parser.parse_args()
+
+    shape, dtype = tuple(args.shape), np.dtype(args.dtype)
+    shapes = [shape]
+    for _ in range(args.levels):
+        shapes.append(level_shape(shapes[-1], None))
+
+    profiles = {"default": [tuple(guess_chunks(s, dtype.itemsize)) for s in shapes]}
+    for access in ("patch3d", "slice"):
+        profiles[access] = pyramid_chunks(shapes, dtype.itemsize, access, args.chunk_bytes)
+
+    print("{:<10} {:<6} {:<18} {:<10} {:>14} {:>14}".format("profile", "level", "chunks", "pattern", "chunks/read", "amplification"))
+    for name, level_chunks in profiles.items():
+        for p, (s, c) in enumerate(zip(shapes, level_chunks)):
+            # The same physical region is read from every level, see `Mzarr.read`
+            for pattern, regions in read_patterns(shapes[0], args.reads).items():
+                level_regions = [tuple(slice(k.indices(n)[0] // 2 ** p, max(k.indices(n)[0] // 2 ** p + 1, math.ceil(k.indices(n)[1] / 2 ** p))) for k, n in zip(region, shapes[0])) for region in regions]
+                result = chunks_touched(s, c, level_regions)
+                print("{:<10} {:<6} {:<18} {:<10} {:>14.2f} {:>14.2f}".format(name, p, "x".join(map(str, c)), pattern, result["chunks_per_read"], result["amplification"]))
+
+    if args.timed:
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 1000, shape).astype(dtype)
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in profiles:
+                path = os.path.join(tmp, "{}.mzarr".format(name))
+                Mzarr(image).save(path, num_pyramids=args.levels, access=None if name == "default" else name, chunk_bytes=args.chunk_bytes)
+                mzarr = Mzarr(path, mode='r')
+                for pattern, regions in read_patterns(shape, args.reads).items():
+                    start = time.perf_counter()
+                    for region in regions:
+                        mzarr[region]
+                    print("{:<10} {:<10} {:>10.2f} ms/read".format(name, pattern, (time.perf_counter() - start) / len(regions) * 1000))
+                mzarr.close()
+
+
+if __name__ == "__main__":
+    main()
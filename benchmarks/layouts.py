@@ -0,0 +1,137 @@
+"""
+Benchmark of the storage layouts of Mzarr files.
+
+A synthetic 3D volume is written into every layout ('zip', 'directory' and 'sharded') by a number of parallel
+writers, each of which writes its own chunk-aligned slabs through zarr. The zip store serializes all writes,
+while the directory layouts write different files in parallel. The files are then opened with mode 'r' and random
+patches are read to measure the read latency. The number of files and the size of every layout are reported too.
+
+Usage:
+    python benchmarks/layouts.py --shape 256 512 512 --writers 1 4 [--chunks 64 64 64] [--patch 96 96 96]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import zarr
+from typing import Tuple
+from numcodecs import Blosc
+from mzarr import Mzarr
+from mzarr.storage import open_store, consolidate, LAYOUTS
+
+
+def write(path: str, layout: str, volume: np.ndarray, chunks: Tuple[int, ...], writers: int) -> float:
+    """
+    Write a volume to a store of the given layout, with the slabs of chunks distributed over parallel writers.
+
+    Args:
+        path (str): The path of the store.
+        layout (str): The storage layout, one of LAYOUTS.
+        volume (np.ndarray): The volume to write.
+        chunks (Tuple[int, ...]): The chunk shape.
+        writers (int): The number of writer threads.
+
+    Returns:
+        float: The duration of the write in seconds, including the consolidation of the metadata.
+    """
+
+    store = open_store(path, 'w', layout)
+    array = zarr.group(store).create_dataset("base", shape=volume.shape, chunks=chunks, dtype=volume.dtype, compressor=Blosc(cname="zstd", clevel=3))
+    slabs = [slice(start, min(start + chunks[0], volume.shape[0])) for start in range(0, volume.shape[0], chunks[0])]
+
+    def writer(index: int) -> None:
+        for slab in slabs[index::writers]:
+            array[slab] = volume[slab]
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    consolidate(store)
+    store.close()
+    return time.perf_counter() - start
+
+
+def read_latencies(path: str, patch: Tuple[int, ...], count: int, seed: int) -> np.ndarray:
+    """
+    Measure the latencies of reading random patches of a file.
+
+    Args:
+        path (str): The path to the Mzarr file.
+        patch (Tuple[int, ...]): The shape of the patches.
+        count (int): The number of patches.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        np.ndarray: The latency in milliseconds of every read.
+    """
+
+    mzarr = Mzarr(path, mode='r')
+    rng = np.random.default_rng(seed)
+    latencies = []
+    for _ in range(count):
+        start = [int(rng.integers(0, size - p + 1)) for size, p in zip(mzarr.shape, patch)]
+        region = tuple(slice(s, s + p) for s, p in zip(start, patch))
+        begin = time.perf_counter()
+        mzarr[region]
+        latencies.append(time.perf_counter() - begin)
+    mzarr.close()
+    return np.array(latencies) * 1000
+
+
+def disk_usage(path: str) -> Tuple[int, int]:
+    """
+    Measure the disk usage of a store.
+
+    Args:
+        path (str): The path of the store, a file or a directory.
+
+    Returns:
+        Tuple[int, int]: The number of files and their total size in bytes.
+    """
+
+    if os.path.isfile(path):
+        return 1, os.path.getsize(path)
+    files = [os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names]
+    return len(files), sum(os.path.getsize(file) for file in files)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shape", nargs=3, type=int, default=[256, 512, 512], help="Shape of the synthetic volume.")
+    parser.add_argument("--chunks", nargs=3, type=int, default=[64, 64, 64], help="Chunk shape.")
+    parser.add_argument("--patch", nargs=3, type=int, default=[96, 96, 96], help="Shape of the random patches.")
+    parser.add_argument("--writers", nargs="+", type=int, default=[1, 4], help="Numbers of parallel writers.")
+    parser.add_argument("--reads", type=int, default=200, help="Number of random patch reads.")
+    args = parser.parse_args()
+
+    # A smooth volume with noise compresses like an image rather than like random data
+    rng = np.random.default_rng(0)
+    z, y, x = np.ogrid[:args.shape[0], :args.shape[1], :args.shape[2]]
+    volume = (1000 + 500 * np.sin(z / 17) * np.cos(y / 23) * np.sin(x / 29)).astype(np.uint16)
+    volume += rng.integers(0, 32, volume.shape, dtype=np.uint16)
+    megabytes = volume.nbytes / 1e6
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print("{:<10} {:>8} {:>10}".format("layout", "writers", "MB/s"))
+        for layout in LAYOUTS:
+            for writers in args.writers:
+                seconds = write(os.path.join(tmp, "{}_{}.mzarr".format(layout, writers)), layout, volume, tuple(args.chunks), writers)
+                print("{:<10} {:>8} {:>10.1f}".format(layout, writers, megabytes / seconds))
+
+        print()
+        print("{:<10} {:>8} {:>10} {:>10} {:>10} {:>10}".format("layout", "files", "MB", "p50 ms", "p99 ms", "max ms"))
+        for layout in LAYOUTS:
+            path = os.path.join(tmp, "{}_{}.mzarr".format(layout, args.writers[0]))
+            latencies = read_latencies(path, tuple(args.patch), args.reads, 0)
+            files, size = disk_usage(path)
+            print("{:<10} {:>8} {:>10.1f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                layout, files, size / 1e6, np.percentile(latencies, 50), np.percentile(latencies, 99), latencies.max()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark of reading the metadata of many Mzarr files, e.g. to fingerprint a dataset.
+
+A small synthetic volume is saved once and copied to the requested number of files. The shape, dtype, levels and
+spacing of all files are then read by opening every file (`Mzarr(path, mode='r')`), with `Mzarr.inspect` from the
+consolidated metadata at the end of the file and with `Mzarr.inspect` on files without consolidated metadata.
+
+Usage:
+    python benchmarks/metadata.py --files 10000 [--workers 8]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+import numpy as np
+from typing import Tuple, Optional
+from mzarr import Mzarr
+
+
+def open_file(path: str) -> Tuple[Tuple[int, ...], np.dtype, int, Optional[Tuple[float, ...]], Tuple[int, ...]]:
+    """
+    Read the metadata of a file by opening it.
+
+    Args:
+        path (str): The path to the Mzarr file.
+
+    Returns:
+        Tuple[Tuple[int, ...], np.dtype, int, Optional[Tuple[float, ...]], Tuple[int, ...]]: The shape, dtype,
+            number of levels, spacing and chunk shape of the file.
+    """
+
+    mzarr = Mzarr(path, mode='r')
+    info = (mzarr.shape, mzarr.dtype, mzarr.num_levels(), mzarr.spacing(), mzarr.chunks)
+    mzarr.close()
+    return info
+
+
+def strip_consolidated(src: str, dst: str) -> None:
+    """
+    Copy a file without its consolidated metadata, i.e. with the layout of files saved by older versions.
+
+    Args:
+        src (str): The path to the Mzarr file.
+        dst (str): The path to the copy.
+    """
+
+    with zipfile.ZipFile(src) as zin, zipfile.ZipFile(dst, "w") as zout:
+        for info in zin.infolist():
+            if info.filename != ".zmetadata":
+                zout.writestr(info, zin.read(info))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10000, help="Number of files.")
+    parser.add_argument("--shape", nargs=3, type=int, default=[64, 128, 128], help="Shape of the synthetic volume.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of threads of inspect_many.")
+    args = parser.parse_args()
+
+    # A smooth volume keeps the files small, so the copies of many files fit into the page cache
+    rng = np.random.default_rng(0)
+    grid = np.indices(tuple(args.shape)).sum(axis=0)
+    image = (grid * 4 + rng.integers(0, 4, tuple(args.shape))).astype(np.uint16)
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.mzarr")
+        Mzarr(image).save(template, attrs={"spacing": [0.8, 0.8, 2.5]}, chunks=(32, 64, 64))
+        legacy_template = os.path.join(tmp, "legacy.mzarr")
+        strip_consolidated(template, legacy_template)
+        paths, legacy_paths = [], []
+        for i in range(args.files):
+            paths.append(os.path.join(tmp, "{:06d}.mzarr".format(i)))
+            shutil.copyfile(template, paths[-1])
+            legacy_paths.append(os.path.join(tmp, "{:06d}_legacy.mzarr".format(i)))
+            shutil.copyfile(legacy_template, legacy_paths[-1])
+
+        runs = [
+            ("open", lambda: [open_file(path) for path in paths]),
+            ("inspect (no consolidated)", lambda: Mzarr.inspect_many(legacy_paths)),
+            ("inspect", lambda: Mzarr.inspect_many(paths)),
+        ]
+        if args.workers:
+            runs.append(("inspect_many ({} threads)".format(args.workers), lambda: Mzarr.inspect_many(paths, workers=args.workers)))
+
+        print("{:<30} {:>10} {:>14}".format("method", "total s", "us/file"))
+        for name, run in runs:
+            start = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - start
+            print("{:<30} {:>10.2f} {:>14.1f}".format(name, seconds, seconds / args.files * 1e6))
+
+
+if __name__ == "__main__":
+    main()
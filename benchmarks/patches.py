@@ -0,0 +1,72 @@
+"""
+Benchmark of reading random training patches from many Mzarr files.
+
+Synthetic 3D volumes are saved as separate files. The same random patches are then read naively with
+`Mzarr.__getitem__`, one patch after the other, and with a `PatchSampler`, which decodes every chunk once per group
+of patches in a thread pool while the next groups are read ahead. For the sampler, the consumer can simulate the
+work of a training step per patch, which the prefetching overlaps with reading.
+
+Usage:
+    python benchmarks/patches.py --files 8 --shape 128 192 192 --patch 96 96 96 --patches 200 [--workers 4] [--step-ms 0]
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from mzarr import Mzarr, PatchSampler
+from mzarr.chunk_io import iter_chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=8, help="Number of files.")
+    parser.add_argument("--shape", nargs=3, type=int, default=[128, 192, 192], help="Shape of the synthetic volumes.")
+    parser.add_argument("--chunks", nargs=3, type=int, default=[64, 64, 64], help="Chunk shape.")
+    parser.add_argument("--patch", nargs=3, type=int, default=[96, 96, 96], help="Patch shape.")
+    parser.add_argument("--patches", type=int, default=200, help="Number of patches.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of decoding threads of the sampler.")
+    parser.add_argument("--group-size", type=int, default=32, help="Number of patches planned together.")
+    parser.add_argument("--step-ms", type=float, default=0.0, help="Simulated work of the consumer per patch.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    z, y, x = np.ogrid[:args.shape[0], :args.shape[1], :args.shape[2]]
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for index in range(args.files):
+            # A smooth volume with noise compresses like an image rather than like random data
+            volume = (1000 + 500 * np.sin(z / (11 + index)) * np.cos(y / 23) * np.sin(x / 29)).astype(np.uint16)
+            volume += rng.integers(0, 32, volume.shape, dtype=np.uint16)
+            path = os.path.join(tmp, "volume_{}.mzarr".format(index))
+            Mzarr(volume).save(path, chunks=tuple(args.chunks))
+            paths.append(path)
+
+        # Both methods read the same patches
+        sampler = PatchSampler(paths, tuple(args.patch), num_patches=args.patches, seed=0, workers=args.workers, group_size=args.group_size)
+        plan = sampler.plan(args.patches)
+        sampler = PatchSampler(paths, tuple(args.patch), num_patches=args.patches, seed=0, workers=args.workers, group_size=args.group_size)
+
+        print("{:<12} {:>12} {:>10}".format("method", "patches/s", "decodes"))
+        mzarrs = [Mzarr(path, mode='r') for path in paths]
+        start = time.perf_counter()
+        for index, region in plan:
+            mzarrs[index][region]
+            time.sleep(args.step_ms / 1000)
+        seconds = time.perf_counter() - start
+        # zarr decodes every chunk a patch overlaps
+        decodes = sum(len(list(iter_chunks(mzarrs[index].shape, mzarrs[index].chunks, region))) for index, region in plan)
+        print("{:<12} {:>12.1f} {:>10}".format("__getitem__", args.patches / seconds, decodes))
+        for mzarr in mzarrs:
+            mzarr.close()
+
+        start = time.perf_counter()
+        with sampler:
+            for _ in sampler:
+                time.sleep(args.step_ms / 1000)
+            seconds = time.perf_counter() - start
+            print("{:<12} {:>12.1f} {:>10}".format("sampler", args.patches / seconds, sampler.decoded))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+Reproducible benchmark suite of the Mzarr format, used to gate upgrades of zarr, numcodecs and imagecodecs.
+
+Synthetic volumes (2D, 3D and multichannel in uint8, uint16, float16 and float32) are generated from a fixed seed.
+For every volume, the suite measures `Mzarr.save` with a subsampled and a gaussian pyramid, opening a file with
+`load`, reading the full base level with `numpy`, random patch reads and reads of the coarser pyramid levels, and
+for the 3D volumes the NIfTI and TIFF converters. Every case runs in a fresh process, which reports the median
+duration of its repeats after an untimed warm-up (short cases are run repeatedly within every repeat), the
+throughput and the peak memory of the repeats on top of the memory after the warm-up.
+
+The results are written as JSON together with the versions of the environment. Given a baseline written by an
+earlier run (e.g. before an upgrade), every case is compared against it and the suite exits with status 1 if the
+throughput of a case dropped or its peak memory grew by more than the tolerance.
+
+Usage:
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --output results.json --baseline baseline.json [--tolerance 0.2] [--memory-tolerance 0.2]
+    python benchmarks/suite.py --cases "save_.*/3d_uint16" --scale 0.5 --repeat 1
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple, List, Dict, Any
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, the peak memory is then only read from /proc or not reported at all
+    resource = None
+
+# Volumes of the suite: shape, dtype and channel axis
+VOLUMES = {
+    "2d_uint8": ((2048, 2048), "uint8", None),
+    "2d_uint16": ((2048, 2048), "uint16", None),
+    "rgb_uint8": ((1024, 1024, 3), "uint8", 2),
+    "3d_uint8": ((128, 256, 256), "uint8", None),
+    "3d_uint16": ((128, 256, 256), "uint16", None),
+    "3d_float16": ((128, 256, 256), "float16", None),
+    "3d_float32": ((128, 256, 256), "float32", None),
+}
+OPERATIONS = ("save_subsampled", "save_gaussian", "load", "numpy", "patches", "levels", "nifti2mzarr", "tiff2mzarr")
+# The converters only apply to 3D volumes without channels of the dtypes their formats support
+CONVERTER_DTYPES = {"nifti2mzarr": ("uint8", "uint16", "float32"), "tiff2mzarr": ("uint8", "uint16", "float16", "float32")}
+# Number of random patches per repeat and the spatial size of the patches
+NUM_PATCHES = 50
+PATCH_SIZE = {2: 256, 3: 64}
+# Number of times a file is opened per repeat of the load case
+NUM_LOADS = 20
+# Short operations are run repeatedly within a repeat until it takes at least this many seconds
+MIN_REPEAT_SECONDS = 0.2
+# Peak memory differences below this number of MB are never regressions, as they are within the noise
+MEMORY_SLACK_MB = 16
+
+
+def synthetic_volume(shape: Tuple[int, ...], dtype: str, channel_axis: Optional[int], seed: int = 0) -> np.ndarray:
+    """
+    Generate a smooth volume with noise, which compresses like an image rather than like random data.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the volume.
+        dtype (str): The dtype of the volume.
+        channel_axis (int, optional): The channel axis, whose channels are shifted copies of the same image.
+        seed (int, optional): The seed of the noise. Defaults to 0.
+
+    Returns:
+        np.ndarray: The volume.
+    """
+
+    rng = np.random.default_rng(seed)
+    spatial = [size for axis, size in enumerate(shape) if axis != channel_axis]
+    grids = np.ogrid[tuple(slice(0, size) for size in spatial)]
+    smooth = sum(np.sin(grid / (17 + 6 * axis)) for axis, grid in enumerate(grids)) / len(grids)
+    if channel_axis is not None:
+        smooth = np.stack([np.roll(smooth, 32 * c, axis=0) for c in range(shape[channel_axis])], axis=channel_axis)
+    noise = rng.random(shape, dtype=np.float32)
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        maximum = np.iinfo(dtype).max
+        return ((0.45 + 0.45 * smooth) * maximum + 0.05 * maximum * noise).astype(dtype)
+    return (smooth + 0.05 * noise).astype(dtype)
+
+
+def scaled_shape(shape: Tuple[int, ...], channel_axis: Optional[int], scale: float) -> Tuple[int, ...]:
+    """
+    Scale the spatial axes of a shape, keeping at least 8 elements per axis.
+
+    Args:
+        shape (Tuple[int, ...]): The shape.
+        channel_axis (int, optional): The channel axis, which is not scaled.
+        scale (float): The factor applied to the spatial axes.
+
+    Returns:
+        Tuple[int, ...]: The scaled shape.
+    """
+
+    return tuple(size if axis == channel_axis else max(8, int(round(size * scale))) for axis, size in enumerate(shape))
+
+
+def list_cases(pattern: Optional[str]) -> List[Tuple[str, str, str]]:
+    """
+    List the cases of the suite, i.e. every operation that applies to a volume.
+
+    Args:
+        pattern (str, optional): A regular expression that selects the cases by name (e.g. 'save_.*/3d'), or None
+            for all cases.
+
+    Returns:
+        List[Tuple[str, str, str]]: The name, the operation and the volume of every case.
+    """
+
+    cases = []
+    for volume, (shape, dtype, channel_axis) in VOLUMES.items():
+        for operation in OPERATIONS:
+            if operation in CONVERTER_DTYPES and (len(shape) != 3 or channel_axis is not None or dtype not in CONVERTER_DTYPES[operation]):
+                continue
+            name = "{}/{}".format(operation, volume)
+            if pattern is None or re.search(pattern, name):
+                cases.append((name, operation, volume))
+    return cases
+
+
+def prepare(volume: str, scale: float, tmp: str) -> Dict[str, str]:
+    """
+    Write the inputs of all cases of a volume: the array, a saved Mzarr file and for 3D volumes a NIfTI file and a
+    directory of TIFF slices.
+
+    Args:
+        volume (str): The name of the volume, see VOLUMES.
+        scale (float): The factor applied to the spatial size of the volume.
+        tmp (str): The directory the inputs are written to.
+
+    Returns:
+        Dict[str, str]: The paths of the inputs keyed by 'array', 'mzarr', 'nifti' and 'tiff'.
+    """
+
+    from mzarr import Mzarr
+    shape, dtype, channel_axis = VOLUMES[volume]
+    array = synthetic_volume(scaled_shape(shape, channel_axis, scale), dtype, channel_axis)
+    inputs = {"array": os.path.join(tmp, volume + ".npy"), "mzarr": os.path.join(tmp, volume + ".mzarr")}
+    np.save(inputs["array"], array)
+    Mzarr(array).save(inputs["mzarr"], channel_axis=channel_axis)
+    if len(shape) == 3 and channel_axis is None:
+        import SimpleITK as sitk
+        import tifffile
+        if dtype in CONVERTER_DTYPES["nifti2mzarr"]:
+            inputs["nifti"] = os.path.join(tmp, volume + ".nii.gz")
+            sitk.WriteImage(sitk.GetImageFromArray(array), inputs["nifti"])
+        inputs["tiff"] = os.path.join(tmp, volume + "_tiff")
+        os.makedirs(inputs["tiff"])
+        for z in range(array.shape[0]):
+            tifffile.imwrite(os.path.join(inputs["tiff"], "slice_{:04d}.tif".format(z)), array[z])
+    return inputs
+
+
+def run_case(operation: str, volume: str, inputs: Dict[str, str], repeat: int, warmup: int, tmp: str) -> Dict[str, Any]:
+    """
+    Run a case in the current process and measure its duration and peak memory. Runs in a fresh worker process.
+
+    Args:
+        operation (str): The operation, see OPERATIONS.
+        volume (str): The name of the volume, see VOLUMES.
+        inputs (Dict[str, str]): The paths of the inputs of the volume, see `prepare`.
+        repeat (int): The number of timed repeats.
+        warmup (int): The number of untimed runs before the repeats.
+        tmp (str): The directory the outputs are written to.
+
+    Returns:
+        Dict[str, Any]: The median 'seconds' of a run, the 'throughput' in its 'unit', the 'peak_rss_mb' of the
+            repeats on top of the memory after the warm-up (None if the platform cannot measure it) and the 'repeat',
+            'warmup' and 'iterations' per repeat.
+    """
+
+    from mzarr import Mzarr
+    from mzarr.chunking import access_patch, random_regions
+    # The converters are imported before the measurement, as SimpleITK takes a lot of memory on import
+    from mzarr.nifti2mzarr import nifti2mzarr
+    from mzarr.tiff2mzarr import tiffdir2mzarr
+    _, _, channel_axis = VOLUMES[volume]
+    output = os.path.join(tmp, "{}_{}.mzarr".format(operation, volume))
+    array = np.load(inputs["array"]) if operation.startswith("save_") else None
+    mzarr = Mzarr(inputs["mzarr"], mode='r')
+    base_nbytes = mzarr.level(0).nbytes
+    level_nbytes = sum(mzarr.level(p).nbytes for p in range(1, mzarr.num_levels()))
+    ndim = mzarr.ndim - (channel_axis is not None)
+    patch = access_patch(mzarr.shape, (PATCH_SIZE[ndim],) * ndim, channel_axis)
+    regions = random_regions(mzarr.shape, patch, NUM_PATCHES)
+
+    def save(pyramid_type: str) -> None:
+        Mzarr(array).save(output, channel_axis=channel_axis, type=pyramid_type)
+
+    def load() -> None:
+        for _ in range(NUM_LOADS):
+            Mzarr(inputs["mzarr"], mode='r').close()
+
+    def levels() -> None:
+        for p in range(1, mzarr.num_levels()):
+            mzarr.level(p)[...]
+
+    def nifti() -> None:
+        nifti2mzarr(inputs["nifti"], output, is_seg=False, lossy=False)
+
+    def tiff() -> None:
+        tiffdir2mzarr(inputs["tiff"], output, is_seg=False, lossy=False)
+
+    # The function of every operation and the amount of work it does in the unit of its throughput
+    operations = {
+        "save_subsampled": (lambda: save("subsampled"), base_nbytes / 1e6, "MB/s"),
+        "save_gaussian": (lambda: save("gaussian"), base_nbytes / 1e6, "MB/s"),
+        "load": (load, NUM_LOADS, "opens/s"),
+        "numpy": (lambda: mzarr.numpy(), base_nbytes / 1e6, "MB/s"),
+        "patches": (lambda: [mzarr[region] for region in regions], NUM_PATCHES, "patches/s"),
+        "levels": (levels, level_nbytes / 1e6, "MB/s"),
+        "nifti2mzarr": (nifti, base_nbytes / 1e6, "MB/s"),
+        "tiff2mzarr": (tiff, base_nbytes / 1e6, "MB/s"),
+    }
+    function, work, unit = operations[operation]
+
+    start = time.perf_counter()
+    for _ in range(warmup):
+        function()
+    iterations = max(1, math.ceil(MIN_REPEAT_SECONDS / max((time.perf_counter() - start) / max(warmup, 1), 1e-6)))
+    baseline_rss = _reset_peak_rss()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        durations.append((time.perf_counter() - start) / iterations)
+    peak_rss = _peak_rss()
+    mzarr.close()
+    seconds = statistics.median(durations)
+    return {
+        "seconds": seconds,
+        "throughput": work / seconds,
+        "unit": unit,
+        "peak_rss_mb": max(peak_rss - baseline_rss, 0) / 1e6 if peak_rss is not None and baseline_rss is not None else None,
+        "repeat": repeat,
+        "warmup": warmup,
+        "iterations": iterations,
+    }
+
+
+def _reset_peak_rss() -> Optional[int]:
+    """
+    Reset the peak resident memory of the process to its current resident memory, which is only possible on Linux.
+    Elsewhere, the peak since the start of the process is used.
+
+    Returns:
+        Optional[int]: The current resident memory in bytes, the baseline of the peak, or None if the peak memory
+            cannot be measured.
+    """
+
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _proc_status("VmRSS")
+    except OSError:
+        return _peak_rss()
+
+
+def _peak_rss() -> Optional[int]:
+    """
+    Get the peak resident memory of the process.
+
+    Returns:
+        Optional[int]: The peak resident memory in bytes or None if neither /proc nor the resource module exist.
+    """
+
+    try:
+        return _proc_status("VmHWM")
+    except OSError:
+        if resource is None:
+            return None
+        # ru_maxrss is in bytes on macOS and in KiB elsewhere
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _proc_status(field: str) -> int:
+    """
+    Read a memory field of /proc/self/status.
+
+    Args:
+        field (str): The name of the field, e.g. 'VmRSS'.
+
+    Returns:
+        int: The value in bytes.
+
+    Raises:
+        OSError: If /proc/self/status does not exist or does not contain the field.
+    """
+
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise OSError("{} is not in /proc/self/status".format(field))
+
+
+def environment() -> Dict[str, Any]:
+    """
+    Get the versions of the libraries and the platform the suite runs on.
+
+    Returns:
+        Dict[str, Any]: The versions and the platform.
+    """
+
+    import zarr
+    import numcodecs
+    import imagecodecs
+    import mzarr
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "zarr": zarr.__version__,
+        "numcodecs": numcodecs.__version__,
+        "imagecodecs": imagecodecs.__version__,
+        "mzarr": mzarr.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: Dict[str, dict], baseline: dict, tolerance: float, memory_tolerance: float) -> List[str]:
+    """
+    Compare the results against a baseline and print a table of the changes.
+
+    Args:
+        results (Dict[str, dict]): The results of the cases keyed by their name, see `run_case`.
+        baseline (dict): The report of an earlier run with its 'environment' and 'results'.
+        tolerance (float): The allowed relative drop of the throughput.
+        memory_tolerance (float): The allowed relative growth of the peak memory on top of MEMORY_SLACK_MB.
+
+    Returns:
+        List[str]: The names of the cases that regressed.
+    """
+
+    for key, value in environment().items():
+        if baseline["environment"].get(key) != value:
+            print("{}: {} -> {}".format(key, baseline["environment"].get(key), value))
+    print()
+    print("{:<28} {:>12} {:>12} {:>8} {:>10} {:>10} {:>8}".format("case", "throughput", "baseline", "change", "peak MB", "baseline", "status"))
+    regressions = []
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print("{:<28} {:>12.1f} {:>12} {:>8} {:>10} {:>10} {:>8}".format(name, result["throughput"], "-", "-", _format_mb(result["peak_rss_mb"]), "-", "new"))
+            continue
+        change = result["throughput"] / base["throughput"] - 1
+        slower = change < -tolerance
+        # The memory is only compared if both runs could measure it
+        larger = result["peak_rss_mb"] is not None and base["peak_rss_mb"] is not None and \
+            result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + memory_tolerance) + MEMORY_SLACK_MB
+        status = "slower" if slower else "memory" if larger else "ok"
+        if slower or larger:
+            regressions.append(name)
+        print("{:<28} {:>12.1f} {:>12.1f} {:>+7.1f}% {:>10} {:>10} {:>8}".format(
+            name, result["throughput"], base["throughput"], 100 * change, _format_mb(result["peak_rss_mb"]), _format_mb(base["peak_rss_mb"]), status))
+    return regressions
+
+
+def _format_mb(value: Optional[float]) -> str:
+    """
+    Format a memory in MB for the tables.
+
+    Args:
+        value (Optional[float]): The memory in MB or None if it was not measured.
+
+    Returns:
+        str: The memory with one decimal or '-'.
+    """
+
+    return "-" if value is None else "{:.1f}".format(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=None, help="Path of the JSON file the results are written to.")
+    parser.add_argument("--baseline", default=None, help="Path of the JSON results of an earlier run to compare against.")
+    parser.add_argument("--cases", default=None, help="Regular expression that selects the cases by name, e.g. 'save_.*/3d'.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Factor applied to the spatial size of all volumes.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of repeats of every case, the median is reported.")
+    parser.add_argument("--warmup", type=int, default=1, help="Number of untimed runs of every case before the repeats.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative drop of the throughput.")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="Allowed relative growth of the peak memory.")
+    parser.add_argument("--list", action="store_true", help="Only list the cases.")
+    args = parser.parse_args()
+
+    cases = list_cases(args.cases)
+    if args.list:
+        print("\n".join(name for name, _, _ in cases))
+        return
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = {}
+        print("{:<28} {:>10} {:>12} {:>10}".format("case", "seconds", "throughput", "peak MB"))
+        for name, operation, volume in cases:
+            if volume not in inputs:
+                inputs[volume] = prepare(volume, args.scale, tmp)
+            # A fresh process per case, so the peak memory of a case is not hidden by an earlier case
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_case, operation, volume, inputs[volume], args.repeat, args.warmup, tmp).result()
+            results[name] = result
+            print("{:<28} {:>10.3f} {:>12} {:>10}".format(name, result["seconds"], "{:.1f} {}".format(result["throughput"], result["unit"]), _format_mb(result["peak_rss_mb"])))
+
+    report = {"environment": environment(), "scale": args.scale, "results": results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline is not None:
+        print()
+        if baseline.get("scale") != args.scale:
+            print("The baseline was measured with scale {}, not {}.".format(baseline.get("scale"), args.scale))
+        regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+        if regressions:
+            print()
+            print("{} regressions: {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark of the read throughput of a single Mzarr file with an increasing number of threads.
+
+Two patterns are measured for the locked ZipStore (mode 'a') and the memory-mapped store (mode 'r'):
+A single multi-chunk read whose chunks are decoded by a pool of workers, and many threads that read
+independent patches from one shared Mzarr instance, like the threads of a data loader.
+JpegXl and Blosc release the GIL, so the throughput scales with the number of cores.
+
+Usage:
+    python benchmarks/threads.py --shape 256 256 256 --threads 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from mzarr import Mzarr
+from mzarr.chunking import random_regions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shape", nargs=3, type=int, default=[256, 256, 256], help="Shape of the synthetic volume.")
+    parser.add_argument("--chunks", nargs=3, type=int, default=[64, 64, 64], help="Chunk shape of the file.")
+    parser.add_argument("--patch", nargs=3, type=int, default=[96, 96, 96], help="Shape of the patches read by the threads.")
+    parser.add_argument("--reads", type=int, default=32, help="Number of patches read per measurement.")
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4, 8], help="Numbers of threads to measure.")
+    args = parser.parse_args()
+
+    shape = tuple(args.shape)
+    rng = np.random.default_rng(0)
+    image = (np.add.outer(np.add.outer(np.arange(shape[0]), np.arange(shape[1])), np.arange(shape[2])) % 512).astype(np.uint16)
+    image += rng.integers(0, 16, shape, dtype=np.uint16)
+    regions = random_regions(shape, tuple(args.patch), args.reads)
+    nbytes = sum(np.prod([r.stop - r.start for r in region]) for region in regions) * image.itemsize
+
+    print("os.cpu_count() = {}".format(os.cpu_count()))
+    print("{:<8} {:<14} {:>8} {:>12}".format("mode", "pattern", "threads", "MB/s"))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image.mzarr")
+        Mzarr(image).save(path, num_pyramids=0, chunks=tuple(args.chunks))
+        for mode in ("a", "r"):
+            for threads in args.threads:
+                # A single read of the full volume, decoded by a pool of workers
+                mzarr = Mzarr(path, mode=mode, workers=threads)
+                start = time.perf_counter()
+                mzarr[...]
+                seconds = time.perf_counter() - start
+                print("{:<8} {:<14} {:>8} {:>12.1f}".format(mode, "single read", threads, image.nbytes / 1e6 / seconds))
+                mzarr.close()
+
+                # Independent patches read by many threads from one shared instance
+                mzarr = Mzarr(path, mode=mode)
+                with ThreadPoolExecutor(threads) as executor:
+                    start = time.perf_counter()
+                    list(executor.map(lambda region, mzarr=mzarr: mzarr[region], regions))
+                    seconds = time.perf_counter() - start
+                print("{:<8} {:<14} {:>8} {:>12.1f}".format(mode, "shared patches", threads, nbytes / 1e6 / seconds))
+                mzarr.close()
+
+
+if __name__ == "__main__":
+    main()
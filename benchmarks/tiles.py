@@ -0,0 +1,170 @@
+"""
+Benchmark of the latency of concurrent tile requests, as a tile server for a web viewer would issue them.
+
+A synthetic 2D image is saved with a pyramid. Bursts of concurrent requests for random tiles of random pyramid
+levels are then served with `Mzarr.aread` from a single event loop and, for comparison, with blocking reads from a
+thread pool with one thread per request. Viewers request overlapping tiles, so a fraction of the requests target a
+few hot tiles, which the async API loads only once. The latency of every request is measured from the start of
+the burst until its tile is available.
+
+Usage:
+    python benchmarks/tiles.py --shape 8192 8192 --requests 500 [--workers 4]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from typing import Tuple, List, Sequence
+from mzarr import Mzarr
+
+
+def tile_requests(mzarr: Mzarr, tile: Tuple[int, ...], count: int, hot_fraction: float, seed: int) -> List[Tuple[int, Tuple[slice, ...]]]:
+    """
+    Generate the tile requests of a burst of viewers, a fraction of which request the same few hot tiles.
+
+    Args:
+        mzarr (Mzarr): The Mzarr file.
+        tile (Tuple[int, ...]): The shape of the tiles.
+        count (int): The number of requests.
+        hot_fraction (float): The fraction of the requests for the hot tiles.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        List[Tuple[int, Tuple[slice, ...]]]: The level and region of every request.
+    """
+
+    rng = np.random.default_rng(seed)
+    hot = []
+    for _ in range(4):
+        level = int(rng.integers(0, mzarr.num_levels()))
+        hot.append((level, random_tile(mzarr.level(level).shape, tile, rng)))
+    requests = []
+    for _ in range(count):
+        if rng.random() < hot_fraction:
+            requests.append(hot[int(rng.integers(0, len(hot)))])
+        else:
+            level = int(rng.integers(0, mzarr.num_levels()))
+            requests.append((level, random_tile(mzarr.level(level).shape, tile, rng)))
+    return requests
+
+
+def random_tile(shape: Tuple[int, ...], tile: Tuple[int, ...], rng: np.random.Generator) -> Tuple[slice, ...]:
+    """
+    Draw a random tile of a level.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the level.
+        tile (Tuple[int, ...]): The shape of the tiles.
+        rng (np.random.Generator): The random generator.
+
+    Returns:
+        Tuple[slice, ...]: The region of the tile, clipped to the level.
+    """
+
+    # Tiles are aligned to the tile grid like the tiles of a viewer
+    starts = [int(rng.integers(0, max(1, -(-size // t)))) * t for size, t in zip(shape, tile)]
+    return tuple(slice(start, min(start + t, size)) for start, t, size in zip(starts, tile, shape))
+
+
+async def serve_async(mzarr: Mzarr, requests: Sequence[Tuple[int, Tuple[slice, ...]]]) -> List[float]:
+    """
+    Serve all requests concurrently with the async API.
+
+    Args:
+        mzarr (Mzarr): The Mzarr file.
+        requests (Sequence[Tuple[int, Tuple[slice, ...]]]): The level and region of every request.
+
+    Returns:
+        List[float]: The latency in seconds of every request, in the order of completion.
+    """
+
+    start = time.perf_counter()
+    latencies = []
+
+    async def serve(level: int, region: Tuple[slice, ...]) -> None:
+        await mzarr.aread(level, region)
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(serve(level, region) for level, region in requests))
+    return latencies
+
+
+def serve_threads(mzarr: Mzarr, requests: Sequence[Tuple[int, Tuple[slice, ...]]]) -> List[float]:
+    """
+    Serve all requests concurrently with one thread per request.
+
+    Args:
+        mzarr (Mzarr): The Mzarr file.
+        requests (Sequence[Tuple[int, Tuple[slice, ...]]]): The level and region of every request.
+
+    Returns:
+        List[float]: The latency in seconds of every request, in the order of the requests.
+    """
+
+    start = time.perf_counter()
+
+    def serve(request: Tuple[int, Tuple[slice, ...]]) -> float:
+        level, region = request
+        mzarr.level(level)[region]
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+        return list(pool.map(serve, requests))
+
+
+def report(name: str, latencies: Sequence[float], seconds: float) -> None:
+    """
+    Print the latency percentiles and the throughput of a method.
+
+    Args:
+        name (str): The name of the method.
+        latencies (Sequence[float]): The latency in seconds of every request.
+        seconds (float): The total duration in seconds.
+    """
+
+    latencies = np.array(latencies) * 1000
+    print("{:<16} {:>10.1f} {:>10.1f} {:>10.1f} {:>12.0f}".format(name, np.percentile(latencies, 50), np.percentile(latencies, 99), latencies.max(), len(latencies) / seconds))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shape", nargs=2, type=int, default=[8192, 8192], help="Shape of the synthetic image.")
+    parser.add_argument("--tile", nargs=2, type=int, default=[256, 256], help="Shape of the tiles and chunks.")
+    parser.add_argument("--requests", type=int, default=500, help="Number of concurrent requests per burst.")
+    parser.add_argument("--bursts", type=int, default=3, help="Number of bursts.")
+    parser.add_argument("--hot", type=float, default=0.3, help="Fraction of the requests for a few hot tiles.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of decoding threads of the async API.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    grid = np.add.outer(np.arange(args.shape[0]), np.arange(args.shape[1]))
+    image = ((grid % 256) + rng.integers(0, 16, tuple(args.shape))).astype(np.uint8)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image.mzarr")
+        Mzarr(image).save(path, chunks=tuple(args.tile))
+        del image
+
+        print("{:<16} {:>10} {:>10} {:>10} {:>12}".format("method", "p50 ms", "p99 ms", "max ms", "requests/s"))
+        for burst in range(args.bursts):
+            requests = tile_requests(Mzarr(path, mode='r'), tuple(args.tile), args.requests, args.hot, burst)
+
+            mzarr = Mzarr(path, mode='r', workers=args.workers)
+            start = time.perf_counter()
+            latencies = asyncio.run(serve_async(mzarr, requests))
+            report("aread", latencies, time.perf_counter() - start)
+            reader = mzarr._async()
+            print("{:<16} {} chunk loads, {} merged".format("", reader.loads, reader.merged))
+            mzarr.close()
+
+            mzarr = Mzarr(path, mode='r')
+            start = time.perf_counter()
+            latencies = serve_threads(mzarr, requests)
+            report("threads", latencies, time.perf_counter() - start)
+            mzarr.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
 from mzarr.mzarr import *
+from mzarr.cache import ChunkCache
+from mzarr.profiling import IOStats, profile
+from mzarr.sampler import PatchSampler
 
 __version__ = "0.0.8"
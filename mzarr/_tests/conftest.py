@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from mzarr import Mzarr
+
+
+def random_volume(shape, dtype=np.uint8, seed=0):
+    rng = np.random.default_rng(seed)
+    if np.issubdtype(dtype, np.floating):
+        return rng.random(shape).astype(dtype)
+    return rng.integers(0, np.iinfo(dtype).max, shape, dtype=dtype, endpoint=True)
+
+
+def smooth_volume(shape, dtype=np.uint16, seed=0):
+    # Compresses like an image rather than like random data
+    rng = np.random.default_rng(seed)
+    grids = np.ogrid[tuple(slice(0, size) for size in shape)]
+    smooth = sum(np.sin(grid / (7 + 3 * axis)) for axis, grid in enumerate(grids))
+    return (1000 + 300 * smooth + rng.integers(0, 32, shape)).astype(dtype)
+
+
+@pytest.fixture
+def save_image(tmp_path):
+    """
+    Save an image to a file in the temporary directory of the test.
+
+    The returned function takes the image or the shape, dtype and seed of a random (or smooth) volume, the name of
+    the file and the arguments of `Mzarr.save`, and returns the path of the file and the image.
+    """
+
+    def save(image=None, shape=(32, 64, 64), dtype=np.uint8, seed=0, smooth=False, name="image.mzarr", **kwargs):
+        if image is None:
+            image = (smooth_volume if smooth else random_volume)(shape, dtype, seed)
+        path = str(tmp_path / name)
+        Mzarr(image).save(path, **kwargs)
+        return path, image
+
+    return save
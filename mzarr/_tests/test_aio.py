@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pytest
+from mzarr import Mzarr, ChunkCache
+
+
+@pytest.fixture
+def mzarr(save_image):
+    path, _ = save_image(shape=(300, 260), chunks=(64, 64))
+    mzarr = Mzarr(path, mode='r', workers=2, cache=ChunkCache())
+    yield mzarr
+    mzarr.close()
+
+
+def test_aread_equals_sync_read(mzarr):
+    keys = [Ellipsis, (slice(10, 200), slice(30, 250)), (5, slice(None)), (slice(0, 1), 0)]
+
+    async def read_all():
+        return [[await mzarr.aread(p, key) for key in keys] for p in range(mzarr.num_levels())]
+
+    results = asyncio.run(read_all())
+    for p, level_results in enumerate(results):
+        for key, result in zip(keys, level_results):
+            np.testing.assert_array_equal(result, mzarr.level(p)[key])
+
+
+def test_concurrent_areads_share_chunk_loads(mzarr):
+    async def read_concurrently():
+        return await asyncio.gather(*[mzarr.aread(0, (slice(0, 64), slice(0, 64))) for _ in range(8)])
+
+    results = asyncio.run(read_concurrently())
+    for result in results:
+        np.testing.assert_array_equal(result, mzarr.level(0)[:64, :64])
+    reader = mzarr._async()
+    # A single chunk is loaded once, all other requests wait for the same load or hit the cache
+    assert reader.loads == 1
+
+
+@pytest.mark.parametrize("region", [None, (slice(50, 290), slice(10, 100))])
+def test_iter_tiles_equals_sync_read(mzarr, region):
+    async def collect():
+        return [(tile, data) async for tile, data in mzarr.iter_tiles(0, (100, 100), region, prefetch=3)]
+
+    tiles = asyncio.run(collect())
+    level = mzarr.level(0)[...]
+    covered = np.zeros(level.shape, dtype=np.int64)
+    for tile, data in tiles:
+        np.testing.assert_array_equal(data, level[tile])
+        covered[tile] += 1
+    expected = np.zeros(level.shape, dtype=np.int64)
+    expected[region if region is not None else Ellipsis] = 1
+    np.testing.assert_array_equal(covered, expected)
+
+
+@pytest.mark.parametrize("mode", ["r", "a"])
+def test_aread_decodes_in_process_pool(save_image, mode):
+    path, image = save_image(shape=(300, 260), chunks=(64, 64))
+    with ProcessPoolExecutor(2) as executor:
+        mzarr = Mzarr(path, mode=mode, workers=executor, cache=ChunkCache())
+        np.testing.assert_array_equal(asyncio.run(mzarr.aread(0, (slice(10, 200), slice(30, 250)))), image[10:200, 30:250])
+        # The decoded chunks are cached in the calling process
+        np.testing.assert_array_equal(asyncio.run(mzarr.aread(0)), image)
+        assert mzarr._async().loads == 25
+        mzarr.close()
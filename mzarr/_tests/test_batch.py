@@ -0,0 +1,106 @@
+import json
+import os
+import time
+import pytest
+from mzarr.batch import convert_all, load_manifest, _next_job
+
+
+def convert(load_filepath, save_filepath):
+    # Records when the conversion ran, so the tests can check which conversions overlapped
+    with open(load_filepath) as f:
+        text = f.read()
+    if text == "fail":
+        raise ValueError("cannot convert {}".format(os.path.basename(load_filepath)))
+    start = time.time()
+    time.sleep(0.2)
+    with open(save_filepath, "w") as f:
+        json.dump({"text": text, "start": start, "stop": time.time()}, f)
+
+
+def write_inputs(tmp_path, texts):
+    jobs = []
+    for index, text in enumerate(texts):
+        load_filepath = tmp_path / "input_{}.txt".format(index)
+        load_filepath.write_text(text)
+        jobs.append((str(load_filepath), str(tmp_path / "output_{}.json".format(index))))
+    return jobs
+
+
+def max_overlap(jobs):
+    intervals = []
+    for _, save_filepath in jobs:
+        with open(save_filepath) as f:
+            output = json.load(f)
+        intervals.append((output["start"], output["stop"]))
+    return max(sum(start <= t < stop for start, stop in intervals) for t, _ in intervals)
+
+
+def test_convert_all_skips_up_to_date_outputs(tmp_path):
+    jobs = write_inputs(tmp_path, ["a", "b", "c"])
+    manifest_filepath = str(tmp_path / "manifest.jsonl")
+    results = convert_all(jobs, convert, processes=2, manifest_filepath=manifest_filepath)
+    assert [result["status"] for result in results] == ["converted"] * 3
+    assert all(result["seconds"] > 0 and result["output_nbytes"] > 0 for result in results)
+
+    # A restart only converts the inputs that changed since their output was written
+    time.sleep(0.05)
+    with open(jobs[1][0], "w") as f:
+        f.write("B")
+    results = convert_all(jobs, convert, processes=2, manifest_filepath=manifest_filepath)
+    assert [result["status"] for result in results] == ["skipped", "converted", "skipped"]
+    with open(jobs[1][1]) as f:
+        assert json.load(f)["text"] == "B"
+
+    # The manifest has an entry of every conversion, the latest entry of an output wins
+    with open(manifest_filepath) as f:
+        assert len(f.readlines()) == 4
+    manifest = load_manifest(manifest_filepath)
+    assert set(manifest) == {save_filepath for _, save_filepath in jobs}
+    assert manifest[jobs[1][1]]["seconds"] == results[1]["seconds"]
+
+    results = convert_all(jobs, convert, overwrite=True)
+    assert [result["status"] for result in results] == ["converted"] * 3
+
+
+def test_convert_all_records_failures(tmp_path):
+    jobs = write_inputs(tmp_path, ["a", "fail", "c"])
+    manifest_filepath = str(tmp_path / "manifest.jsonl")
+    results = convert_all(jobs, convert, processes=2, manifest_filepath=manifest_filepath)
+    assert [result["status"] for result in results] == ["converted", "failed", "converted"]
+    assert results[1]["error"] == "ValueError: cannot convert input_1.txt"
+    # A failed conversion leaves neither an output nor a partial output behind
+    assert not os.path.exists(jobs[1][1])
+    assert not os.path.exists(jobs[1][1] + ".partial")
+    assert load_manifest(manifest_filepath)[jobs[1][1]]["status"] == "failed"
+    # The failed conversion is retried on a restart
+    results = convert_all(jobs, convert, processes=2)
+    assert [result["status"] for result in results] == ["skipped", "failed", "skipped"]
+
+
+@pytest.mark.parametrize("processes", [0, -1])
+def test_convert_all_runs_one_process_for_fewer_processes(tmp_path, processes):
+    jobs = write_inputs(tmp_path, ["a", "b"])
+    results = convert_all(jobs, convert, processes=processes)
+    assert [result["status"] for result in results] == ["converted"] * 2
+    assert max_overlap(jobs) == 1
+
+
+@pytest.mark.parametrize("memory_budget, expected_overlap", [(250, 2), (50, 1)])
+def test_convert_all_limits_memory(tmp_path, memory_budget, expected_overlap):
+    jobs = write_inputs(tmp_path, ["a", "b", "c", "d", "e"])
+    results = convert_all(jobs, convert, processes=4, nbytes=lambda path: 100, memory_budget=memory_budget, memory_factor=1.0)
+    assert [result["status"] for result in results] == ["converted"] * 5
+    assert all(result["compression_ratio"] == 100 / result["output_nbytes"] for result in results)
+    assert max_overlap(jobs) <= expected_overlap
+
+
+def test_next_job_fits_the_memory_budget():
+    todo = [(0, "a", "a.mzarr", 300), (1, "b", "b.mzarr", 200), (2, "c", "c.mzarr", 100)]
+    assert _next_job(todo, {}, None, 1.0) == todo[0]
+    assert _next_job(todo, {}, 250, 1.0) == todo[1]
+    assert _next_job(todo, {"future": todo[1]}, 250, 1.0) is None
+    assert _next_job(todo, {"future": todo[2]}, 250, 1.0) == todo[2]
+    assert _next_job(todo, {"future": todo[2]}, 300, 1.0) == todo[1]
+    # A job that exceeds the budget on its own runs alone
+    assert _next_job(todo, {}, 50, 1.0) == todo[0]
+    assert _next_job(todo, {"future": todo[2]}, 50, 1.0) is None
@@ -0,0 +1,57 @@
+import numpy as np
+from mzarr import Mzarr
+from mzarr.cache import ChunkCache
+
+
+def test_cache_counts_hits_and_misses(save_image):
+    path, image = save_image(num_pyramids=0, chunks=(16, 32, 32))
+    cache = ChunkCache()
+    mzarr = Mzarr(path, mode='r', cache=cache)
+    # The region overlaps 2 of the 8 chunks
+    np.testing.assert_array_equal(mzarr[:16, :32, :64], image[:16, :32, :64])
+    assert (cache.hits, cache.misses, len(cache)) == (0, 2, 2)
+    np.testing.assert_array_equal(mzarr[:16, :32, :64], image[:16, :32, :64])
+    assert (cache.hits, cache.misses, len(cache)) == (2, 2, 2)
+    # One cached and one new chunk
+    np.testing.assert_array_equal(mzarr[:16, :64, :32], image[:16, :64, :32])
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["chunks"]) == (3, 3, 3)
+    assert stats["hit_rate"] == 0.5
+    assert stats["nbytes"] == 3 * 16 * 32 * 32
+    mzarr.close()
+
+
+def test_cache_is_shared_between_instances(save_image):
+    path, image = save_image(num_pyramids=0, chunks=(16, 32, 32))
+    cache = ChunkCache()
+    first, second = Mzarr(path, mode='r', cache=cache), Mzarr(path, mode='r', cache=cache)
+    first[...]
+    np.testing.assert_array_equal(second[...], image)
+    assert (cache.hits, cache.misses) == (8, 8)
+    first.close()
+    second.close()
+
+
+def test_cache_evicts_least_recently_used_chunks():
+    cache = ChunkCache(max_bytes=2 * 1024)
+    chunks = {key: np.full(1024, key, dtype=np.uint8) for key in range(3)}
+    cache.put(0, chunks[0])
+    cache.put(1, chunks[1])
+    cache.get(0)
+    cache.put(2, chunks[2])
+    assert cache.get(1) is None
+    assert cache.get(0) is chunks[0]
+    assert cache.evictions == 1
+    assert cache.nbytes == 2 * 1024
+    # Cached chunks are read-only
+    assert not chunks[0].flags.writeable
+
+
+def test_cache_is_invalidated_by_writes(save_image):
+    path, image = save_image(num_pyramids=0, chunks=(16, 32, 32))
+    cache = ChunkCache()
+    mzarr = Mzarr(path, mode='a', cache=cache)
+    mzarr[:16, :32, :32]
+    mzarr[:16, :32, :32] = 7
+    np.testing.assert_array_equal(mzarr[:16, :32, :32], 7)
+    mzarr.close()
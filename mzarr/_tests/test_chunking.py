@@ -0,0 +1,72 @@
+import math
+import pytest
+from mzarr.chunking import access_patch, access_chunks, pyramid_chunks, chunks_touched, random_regions, MIN_CHUNK_BYTES
+
+
+@pytest.mark.parametrize("shape, access, channel_axis, patch", [
+    ((200, 300, 400), "patch3d", None, (128, 128, 128)),
+    ((64, 300, 400), "patch3d", None, (64, 128, 128)),
+    ((200, 300, 400), "slice", None, (1, 300, 400)),
+    ((200, 300, 400), (32, 64, 1000), None, (32, 64, 400)),
+    ((3, 200, 300, 400), "patch3d", 0, (3, 128, 128, 128)),
+    ((3, 200, 300, 400), "slice", -4, (3, 1, 300, 400)),
+    ((200, 300, 400, 2), "slice", -1, (1, 300, 400, 2)),
+    # The channel axis always covers all channels, whether the patch includes it or not
+    ((3, 200, 300, 400), (32, 64, 64), 0, (3, 32, 64, 64)),
+    ((3, 200, 300, 400), (1, 32, 64, 64), 0, (3, 32, 64, 64)),
+])
+def test_access_patch(shape, access, channel_axis, patch):
+    assert access_patch(shape, access, channel_axis) == patch
+
+
+@pytest.mark.parametrize("access", ["patch2d", (32, 64)])
+def test_access_patch_rejects_unknown_profiles(access):
+    with pytest.raises(RuntimeError):
+        access_patch((200, 300, 400), access)
+
+
+def test_access_chunks_keeps_the_proportions_of_the_patch():
+    chunks = access_chunks((512, 512, 512), 2, (64, 128, 128), 1024 ** 2)
+    assert chunks[1] == chunks[2] == pytest.approx(2 * chunks[0], abs=1)
+    assert math.prod(chunks) * 2 == pytest.approx(1024 ** 2, rel=0.05)
+
+
+def test_access_chunks_clips_to_the_array():
+    # The slice is clipped to the array and the remaining bytes go to the first axis
+    assert access_chunks((512, 512, 512), 1, (1, 512, 512), 1024 ** 2) == (4, 512, 512)
+    assert access_chunks((10, 20, 30), 4, (128, 128, 128), 1024 ** 2) == (10, 20, 30)
+    # The channel axis always covers all channels
+    chunks = access_chunks((3, 512, 512, 512), 2, (3, 128, 128, 128), 1024 ** 2, channel_axis=-4)
+    assert chunks[0] == 3 and chunks[1] == chunks[2] == chunks[3]
+    assert math.prod(chunks) * 2 == pytest.approx(1024 ** 2, rel=0.05)
+
+
+@pytest.mark.parametrize("channel_axis", [None, 0])
+def test_pyramid_chunks_shrink_with_the_levels(channel_axis):
+    shapes = [(512 // 2 ** p,) * 3 for p in range(5)]
+    if channel_axis is not None:
+        shapes = [(3,) + shape for shape in shapes]
+    level_chunks = pyramid_chunks(shapes, 2, "patch3d", 1024 ** 2, channel_axis)
+    assert len(level_chunks) == len(shapes)
+    for p, (shape, chunks) in enumerate(zip(shapes, level_chunks)):
+        assert all(c <= s for c, s in zip(chunks, shape))
+        spatial = chunks if channel_axis is None else chunks[1:]
+        if channel_axis is not None:
+            assert chunks[0] == 3
+        assert len(set(spatial)) == 1
+        nbytes = math.prod(chunks) * 2
+        if math.prod(shape) * 2 > MIN_CHUNK_BYTES:
+            # The chunks shrink by 8 per level, but not below 64 KiB
+            assert nbytes == pytest.approx(max(1024 ** 2 / 8 ** p, MIN_CHUNK_BYTES), rel=0.1)
+        else:
+            assert chunks == shape
+
+
+def test_pyramid_chunks_touch_the_same_number_of_chunks_on_every_level():
+    shapes = [(512 // 2 ** p,) * 3 for p in range(3)]
+    level_chunks = pyramid_chunks(shapes, 2, "patch3d", 8 * 1024 ** 2)
+    touched = []
+    for p, (shape, chunks) in enumerate(zip(shapes, level_chunks)):
+        regions = random_regions(shape, (128 // 2 ** p,) * 3, 50, seed=p)
+        touched.append(chunks_touched(shape, chunks, regions)["chunks_per_read"])
+    assert max(touched) <= 1.5 * min(touched)
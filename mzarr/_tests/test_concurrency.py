@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+import pytest
+from mzarr import Mzarr
+from mzarr.chunking import random_regions
+from mzarr.storage import MmapZipStore
+
+
+@pytest.fixture
+def image_path(save_image):
+    return save_image(shape=(64, 128, 128), dtype=np.uint16, num_pyramids=0, chunks=(32, 32, 32))
+
+
+def read_in_worker(mzarr, region):
+    opened = mzarr._store is not None
+    return os.getpid(), opened, mzarr[region]
+
+
+def test_pickle_round_trip(image_path):
+    path, image = image_path
+    mzarr = Mzarr(path, mode='r', workers=2)
+    data = pickle.dumps(mzarr)
+    # Only the path and the settings are pickled
+    assert len(data) < 1024
+    restored = pickle.loads(data)
+    assert restored._store is None
+    assert restored.workers == 2
+    np.testing.assert_array_equal(restored[8:40, :, 16:80], image[8:40, :, 16:80])
+    assert restored._store is not None
+    restored.close()
+    mzarr.close()
+
+
+@pytest.mark.parametrize("method", ["spawn", "fork"])
+def test_lazy_reopen_in_worker_process(image_path, method):
+    if method not in multiprocessing.get_all_start_methods():
+        pytest.skip("The start method {} is not available.".format(method))
+    path, image = image_path
+    mzarr = Mzarr(path, mode='r')
+    # The parent has opened the file, the worker must open its own handle
+    mzarr[:1, :1, :1]
+    region = (slice(10, 50), slice(0, 64), slice(32, 128))
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context(method)) as executor:
+        pid, opened, patch = executor.submit(read_in_worker, mzarr, region).result()
+    assert pid != os.getpid()
+    assert not opened
+    np.testing.assert_array_equal(patch, image[region])
+    mzarr.close()
+
+
+@pytest.mark.parametrize("mode", ["r", "a"])
+def test_concurrent_reads_from_threads(image_path, mode):
+    path, image = image_path
+    mzarr = Mzarr(path, mode=mode)
+    regions = random_regions(image.shape, (24, 48, 48), 64)
+    with ThreadPoolExecutor(8) as executor:
+        patches = list(executor.map(lambda region: mzarr[region], regions))
+    for region, patch in zip(regions, patches):
+        np.testing.assert_array_equal(patch, image[region])
+    mzarr.close()
+
+
+@pytest.mark.parametrize("mode", ["r", "a"])
+def test_reads_decoded_in_process_pool(image_path, mode):
+    path, image = image_path
+    with ProcessPoolExecutor(2) as executor:
+        mzarr = Mzarr(path, mode=mode, workers=executor)
+        np.testing.assert_array_equal(mzarr[...], image)
+        np.testing.assert_array_equal(mzarr[10:50, 3:90, 40:41], image[10:50, 3:90, 40:41])
+        mzarr.close()
+
+
+def test_concurrent_reads_are_not_serialized(image_path, monkeypatch):
+    path, image = image_path
+    delay, threads = 0.1, 4
+    getitem = MmapZipStore.__getitem__
+
+    def slow_getitem(self, key):
+        # A slow storage backend, which does not hold the GIL while waiting
+        if not key.rsplit("/", 1)[-1].startswith("."):
+            time.sleep(delay)
+        return getitem(self, key)
+
+    monkeypatch.setattr(MmapZipStore, "__getitem__", slow_getitem)
+    mzarr = Mzarr(path, mode='r')
+    # Every thread reads a different single chunk
+    regions = [(slice(0, 32), slice(0, 32), slice(32 * i, 32 * (i + 1))) for i in range(threads)]
+    with ThreadPoolExecutor(threads) as executor:
+        start = time.perf_counter()
+        patches = list(executor.map(lambda region: mzarr[region], regions))
+        seconds = time.perf_counter() - start
+    for region, patch in zip(regions, patches):
+        np.testing.assert_array_equal(patch, image[region])
+    # Serialized reads would take at least threads * delay
+    assert seconds < threads * delay * 0.6
+    mzarr.close()
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+import mzarr.mzarr as mzarr_module
+from mzarr import Mzarr
+from mzarr.storage import stale_bytes
+
+# The coarser levels are lossy by default, so the levels are saved losslessly to compare them exactly
+LOSSLESS = {"id": "zstd", "level": 3}
+SHAPE = (40, 72, 88)
+
+
+def edit(image):
+    edited = image.copy()
+    edited[3:17, 20:45, 30:31] = 5
+    edited[30:40, 60:72, 70:88] = 4000
+    return edited
+
+
+def assert_same_file(path, expected_path):
+    actual, expected = Mzarr(path, mode='r'), Mzarr(expected_path, mode='r')
+    assert actual.num_levels() == expected.num_levels()
+    for p in range(expected.num_levels()):
+        np.testing.assert_array_equal(actual.level(p)[...], expected.level(p)[...])
+    # The histogram keeps the edges of the original save, so only the summary matches a full save
+    actual_stats, expected_stats = actual.statistics(), expected.statistics()
+    for key in ("count", "nonzero", "min", "max", "mean", "std"):
+        assert actual_stats[key] == pytest.approx(expected_stats[key]), key
+    actual.close()
+    expected.close()
+
+
+@pytest.mark.parametrize("type", ["subsampled", "gaussian", "mode", "mean", "max"])
+def test_flush_equals_full_save(save_image, type):
+    path, image = save_image(shape=SHAPE, dtype=np.uint16, smooth=True, type=type, chunks=(16, 32, 32), compression=LOSSLESS)
+    expected_path, _ = save_image(edit(image), name="expected.mzarr", type=type, chunks=(16, 32, 32), compression=LOSSLESS)
+
+    mzarr = Mzarr(path, mode='a')
+    mzarr[3:17, 20:45, 30:31] = 5
+    mzarr[30:40, 60:72, 70:88] = 4000
+    mzarr.flush()
+    mzarr.close()
+    assert_same_file(path, expected_path)
+
+
+def test_failed_flush_keeps_dirty_regions(save_image, monkeypatch):
+    path, image = save_image(shape=SHAPE, dtype=np.uint16, smooth=True, chunks=(16, 32, 32), compression=LOSSLESS)
+    expected_path, _ = save_image(edit(image), name="expected.mzarr", chunks=(16, 32, 32), compression=LOSSLESS)
+
+    mzarr = Mzarr(path, mode='a')
+    mzarr[3:17, 20:45, 30:31] = 5
+    mzarr[30:40, 60:72, 70:88] = 4000
+
+    def failing_pyramid_region(*args, **kwargs):
+        raise MemoryError("out of memory")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(mzarr_module, "pyramid_region", failing_pyramid_region)
+        with pytest.raises(MemoryError):
+            mzarr.flush()
+    assert len(mzarr._dirty) == 2
+    mzarr.flush()
+    assert mzarr._dirty == []
+    mzarr.close()
+    assert_same_file(path, expected_path)
+
+
+def test_flush_only_reopens_the_store_to_compact(save_image):
+    path, image = save_image(shape=SHAPE, dtype=np.uint16, smooth=True, chunks=(16, 32, 32), compression=LOSSLESS)
+
+    mzarr = Mzarr(path, mode='a')
+    store = mzarr.store.chunk_store
+    mzarr[0:2, 0:2, 0:2] = 0
+    mzarr.flush()
+    # The few rewritten chunks are far below the threshold, so the store stays open
+    assert mzarr.store.chunk_store is store
+    assert stale_bytes(store.zf.infolist()) > 0
+
+    mzarr.flush(compact=True)
+    assert mzarr.store.chunk_store is not store
+    assert stale_bytes(mzarr.store.chunk_store.zf.infolist()) == 0
+    mzarr.close()
+    expected = image.copy()
+    expected[0:2, 0:2, 0:2] = 0
+    np.testing.assert_array_equal(Mzarr(path, mode='r').numpy(), expected)
+
+
+def test_flush_rewrites_every_chunk_once(save_image):
+    path, image = save_image(shape=SHAPE, dtype=np.uint16, smooth=True, type="mean", chunks=(16, 32, 32), compression=LOSSLESS)
+    rng = np.random.default_rng(1)
+    voxels = [tuple(int(i) for i in rng.integers(0, 16, 3)) for _ in range(40)]
+    expected = image.copy()
+    for voxel in voxels:
+        expected[voxel] = 4000
+    expected_path, _ = save_image(expected, name="expected.mzarr", type="mean", chunks=(16, 32, 32), compression=LOSSLESS)
+
+    mzarr = Mzarr(path, mode='a')
+    for voxel in voxels:
+        mzarr[voxel] = 4000
+    num_members = len(mzarr.store.chunk_store.zf.infolist())
+    mzarr.flush(compact=False)
+    # All edits lie in the first chunk of every level, so every coarser level and the statistics append a single chunk
+    names = [info.filename for info in mzarr.store.chunk_store.zf.infolist()[num_members:]]
+    expected_names = ["mean_{}/0.0.0".format(p) for p in range(1, mzarr.num_levels())]
+    assert sorted(names) == sorted(expected_names + ["stats/summary/0.0.0.0", "stats/histogram/0.0.0.0"])
+    mzarr.close()
+    assert_same_file(path, expected_path)
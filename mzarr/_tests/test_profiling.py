@@ -0,0 +1,62 @@
+import threading
+import numpy as np
+from mzarr import Mzarr, profile, PatchSampler
+from mzarr import profiling
+
+
+def test_profile_records_save_and_read(tmp_path):
+    path = str(tmp_path / "image.mzarr")
+    image = np.random.default_rng(0).integers(0, 255, (32, 64, 64), dtype=np.uint8)
+    with profile() as stats:
+        Mzarr(image).save(path, chunks=(16, 32, 32))
+        Mzarr(path, mode='r')[:16, :32, :32]
+    assert profiling.active() is None
+    result = stats.as_dict()
+    assert result["levels"]["base"]["chunks_encoded"] == 8
+    assert result["levels"]["base"]["chunks_decoded"] >= 1
+    assert "read" in result["phases"]
+
+
+def test_overlapping_profiles_in_threads():
+    # Thread A enters s1, thread B enters s2, A exits, B exits
+    s1, s2 = profile(), profile()
+    b_entered, a_exited = threading.Event(), threading.Event()
+    seen = {}
+
+    def thread_a():
+        with s1:
+            b_entered.wait()
+            seen["a"] = profiling.active()
+        a_exited.set()
+
+    def thread_b():
+        with s2:
+            b_entered.set()
+            a_exited.wait()
+            seen["b"] = profiling.active()
+        seen["b_after"] = profiling.active()
+
+    threads = [threading.Thread(target=thread_a), threading.Thread(target=thread_b)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen == {"a": s1, "b": s2, "b_after": None}
+    assert profiling.active() is None
+
+
+def test_profile_is_not_active_in_other_threads():
+    seen = []
+    with profile():
+        thread = threading.Thread(target=lambda: seen.append(profiling.active()))
+        thread.start()
+        thread.join()
+    assert seen == [None]
+
+
+def test_profile_records_sampler_threads(save_image):
+    path, _ = save_image(chunks=(16, 32, 32))
+    with profile() as stats:
+        with PatchSampler([path], (16, 32, 32), num_patches=4, seed=0) as sampler:
+            list(sampler)
+    assert stats.as_dict()["levels"]["base"]["chunks_decoded"] == sampler.decoded
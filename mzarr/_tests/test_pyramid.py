@@ -0,0 +1,55 @@
+import collections
+import numpy as np
+import pytest
+from mzarr import Mzarr
+
+
+def reduce_block(block, type):
+    values = block.ravel()
+    if type == "max":
+        return values.max()
+    if type == "mean":
+        return np.floor(values.astype(np.float64).mean() + 0.5)
+    # Majority vote, ties are resolved to the smallest label
+    counts = collections.Counter(values.tolist())
+    return min(counts, key=lambda label: (-counts[label], label))
+
+
+def brute_force_level(level, type):
+    # Blocks at the border of an odd-sized axis repeat the border element
+    padded = np.pad(level, [(0, size % 2) for size in level.shape], mode="edge")
+    result = np.empty(tuple((size + 1) // 2 for size in level.shape), dtype=level.dtype)
+    for index in np.ndindex(result.shape):
+        block = padded[tuple(slice(2 * i, 2 * i + 2) for i in index)]
+        result[index] = reduce_block(block, type)
+    return result
+
+
+@pytest.mark.parametrize("type, is_seg", [("mode", True), ("mean", False), ("max", False)])
+@pytest.mark.parametrize("streaming", [False, True])
+def test_block_pyramid_matches_brute_force(tmp_path, type, is_seg, streaming):
+    path = str(tmp_path / "image.mzarr")
+    rng = np.random.default_rng(0)
+    shape = (13, 18, 21)
+    image = rng.integers(0, 4, shape, dtype=np.uint8) if is_seg else rng.integers(0, 65535, shape, dtype=np.uint16)
+    Mzarr(image).save(path, type=type, is_seg=is_seg, chunks=(8, 8, 8), streaming=streaming, compression={"id": "zstd", "level": 3})
+
+    mzarr = Mzarr(path, mode='r')
+    expected = image
+    assert mzarr.num_levels() > 2
+    for p in range(1, mzarr.num_levels()):
+        expected = brute_force_level(expected, type)
+        np.testing.assert_array_equal(mzarr.level(p)[...], expected)
+    mzarr.close()
+
+
+def test_mode_pyramid_keeps_labels_with_channel_axis(tmp_path):
+    path = str(tmp_path / "image.mzarr")
+    image = np.random.default_rng(0).integers(0, 3, (2, 10, 12), dtype=np.uint8)
+    Mzarr(image).save(path, type="mode", is_seg=True, channel_axis=0, compression={"id": "zstd", "level": 3})
+    mzarr = Mzarr(path, mode='r')
+    level = mzarr.level(1)[...]
+    assert level.shape == (2, 5, 6)
+    for c in range(2):
+        np.testing.assert_array_equal(level[c], brute_force_level(image[c], "mode"))
+    mzarr.close()
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+from mzarr import Mzarr
+
+
+@pytest.fixture
+def mzarr(save_image):
+    path, _ = save_image(shape=(64, 96), chunks=(16, 16))
+    mzarr = Mzarr(path, mode='r')
+    yield mzarr
+    mzarr.close()
+
+
+def test_level_shapes_and_indexing(mzarr):
+    assert mzarr.num_levels() == 5
+    assert mzarr.level(0) is mzarr.array
+    for p in range(mzarr.num_levels()):
+        assert mzarr.level(p).shape == (64 // 2 ** p, 96 // 2 ** p)
+        assert mzarr.level_scale(p) == (2 ** p, 2 ** p)
+    assert mzarr.level(-1) is mzarr.level(4)
+    with pytest.raises(RuntimeError):
+        mzarr.level(5)
+
+
+@pytest.mark.parametrize("roi, level, level_roi", [
+    (Ellipsis, 2, Ellipsis),
+    ((slice(5, 37), slice(10, 70)), 2, (slice(1, 10), slice(2, 18))),
+    ((7, slice(None)), 1, (3, slice(None))),
+    ((-1, slice(0, 90)), 1, (31, slice(0, 45))),
+    # Steps that are multiples of the scale sample the level exactly
+    ((slice(0, 12, 4), slice(None, None, 8)), 1, (slice(0, 6, 2), slice(None, None, 4))),
+    # Other steps are rounded up to the next multiple of the scale, the base coordinates 0, 4 and 8
+    ((slice(0, 10, 3), slice(None)), 1, (slice(0, 5, 2), slice(None))),
+    ((slice(0, 10, 3), slice(1, 2)), 2, (slice(0, 3, 1), slice(0, 1))),
+    ((slice(3, 40, 5), 50), -1, (slice(0, 3, 1), 3)),
+])
+def test_read_equals_slicing_the_level(mzarr, roi, level, level_roi):
+    np.testing.assert_array_equal(mzarr.read(roi, level=level), mzarr.level(level)[level_roi])
+
+
+def test_read_rejects_negative_steps(mzarr):
+    with pytest.raises(RuntimeError):
+        mzarr.read((slice(None, None, -1), slice(None)), level=1)
+
+
+def test_select_level(mzarr):
+    roi = (slice(0, 64), slice(0, 32))
+    assert mzarr.select_level(roi) == 0
+    assert mzarr.select_level(roi, target_shape=(16, None)) == 2
+    assert mzarr.select_level(roi, target_shape=(16, 9)) == 1
+    assert mzarr.select_level(roi, max_bytes=64 * 32) == 0
+    assert mzarr.select_level(roi, max_bytes=64 * 32 // 4) == 1
+    # The coarsest level is selected if no level is small enough
+    assert mzarr.select_level(roi, max_bytes=1) == 4
+    # The number of bytes can only select a coarser level than the target shape
+    assert mzarr.select_level(roi, target_shape=(16, None), max_bytes=64 * 32) == 2
+    assert mzarr.select_level(roi, target_shape=(32, None), max_bytes=64 * 32 // 16) == 2
+    np.testing.assert_array_equal(mzarr.read(roi, target_shape=(16, None)), mzarr.level(2)[0:16, 0:8])
+
+
+def test_read_with_channel_axis(save_image):
+    path, _ = save_image(shape=(3, 40, 48), channel_axis=0, chunks=(3, 16, 16))
+    mzarr = Mzarr(path, mode='r')
+    assert mzarr.level_scale(2) == (1, 4, 4)
+    assert mzarr.level(2).shape == (3, 10, 12)
+    np.testing.assert_array_equal(mzarr.read((slice(1, 3), slice(8, 24)), level=2), mzarr.level(2)[1:3, 2:6])
+    np.testing.assert_array_equal(mzarr.read((2, slice(0, 40, 8)), level=1), mzarr.level(1)[2, 0:20:4])
+    mzarr.close()
+
+
+@pytest.fixture
+def spaced(save_image):
+    # The spacing of the attributes is in the order x, y, z, so the base spacing is (1.0, 0.5, 0.5)
+    path, image = save_image(shape=(48, 64, 80), dtype=np.uint16, smooth=True, type="mean", compression={"id": "zstd", "level": 3}, attrs={"spacing": [0.5, 0.5, 1.0]})
+    mzarr = Mzarr(path, mode='r')
+    yield mzarr, image
+    mzarr.close()
+
+
+def test_read_spacing_of_a_level(spaced):
+    mzarr, image = spaced
+    assert mzarr.spacing() == (1.0, 0.5, 0.5)
+    roi = (slice(4, 40), slice(8, 56), slice(10, 70))
+    result = mzarr.read(roi, spacing=(2.0, 1.0, 1.0))
+    # The spacing of the first level is read without interpolation
+    np.testing.assert_array_equal(result, mzarr.level(1)[2:20, 4:28, 5:35])
+    # The full resolution reference averages blocks of 2 x 2 x 2 elements
+    reference = image[roi].reshape(18, 2, 24, 2, 30, 2).mean(axis=(1, 3, 5))
+    np.testing.assert_allclose(result, reference, atol=1)
+    np.testing.assert_array_equal(mzarr.read(roi, spacing=(1.0, 0.5, 0.5)), image[roi])
+
+
+def test_read_spacing_between_levels(spaced):
+    mzarr, image = spaced
+    roi = (slice(4, 40), slice(8, 56), slice(10, 70))
+    spacing = (3.0, 1.5, 1.5)
+    result = mzarr.read(roi, spacing=spacing)
+    assert result.shape == (12, 16, 20) and result.dtype == image.dtype
+    # The full resolution reference averages blocks of 3 x 3 x 3 elements around the centers of the output elements
+    coords = [key.start - 0.5 + (np.arange(size) + 0.5) * 3 for key, size in zip(roi, result.shape)]
+    smoothed = ndimage.uniform_filter(image.astype(np.float64), 3)
+    reference = ndimage.map_coordinates(smoothed, np.meshgrid(*coords, indexing="ij"), order=1)
+    assert np.abs(result - reference).max() < 10
+    # The second level is too coarse for the spacing, but can be selected explicitly
+    coarse = mzarr.read(roi, spacing=spacing, level=2)
+    assert coarse.shape == result.shape
+    assert np.abs(coarse - reference).mean() > np.abs(result - reference).mean()
@@ -0,0 +1,86 @@
+import threading
+import numpy as np
+import pytest
+import mzarr.sampler as sampler_module
+from mzarr import PatchSampler
+from mzarr.chunk_io import iter_chunks
+
+
+@pytest.fixture
+def files(save_image):
+    saved = [
+        save_image(shape=shape, dtype=np.uint16, seed=index, name="image_{}.mzarr".format(index), chunks=(16, 32, 32))
+        for index, shape in enumerate([(40, 64, 64), (32, 80, 48)])
+    ]
+    return [path for path, _ in saved], [image for _, image in saved]
+
+
+@pytest.mark.parametrize("workers", [None, 3])
+def test_sampler_returns_the_patch_contents(files, workers):
+    paths, images = files
+    with PatchSampler(paths, (20, 24, 24), num_patches=50, seed=0, workers=workers, group_size=8) as sampler:
+        patches = list(sampler)
+    assert len(patches) == 50
+    assert {index for index, _, _ in patches} == {0, 1}
+    for index, region, patch in patches:
+        assert patch.shape == (20, 24, 24)
+        np.testing.assert_array_equal(patch, images[index][region])
+
+
+def test_sampler_decodes_every_chunk_once_per_group(files, monkeypatch):
+    paths, images = files
+    group_size, num_patches = 16, 48
+    # A sampler with the same seed plans the same groups
+    planner = PatchSampler(paths, (20, 24, 24), seed=1)
+    groups = [planner.plan(group_size) for _ in range(num_patches // group_size)]
+    planner.close()
+
+    loads, lock = [], threading.Lock()
+    load_chunk = sampler_module.load_chunk
+
+    def counting_load_chunk(array, chunk_coords):
+        with lock:
+            loads.append(chunk_coords)
+        return load_chunk(array, chunk_coords)
+
+    monkeypatch.setattr(sampler_module, "load_chunk", counting_load_chunk)
+    with PatchSampler(paths, (20, 24, 24), num_patches=num_patches, seed=1, workers=2, group_size=group_size, prefetch=0) as sampler:
+        regions = [(index, region) for index, region, _ in sampler]
+
+    assert regions == [patch for group in groups for patch in group]
+    expected = 0
+    for group in groups:
+        chunks = {(index, coords) for index, region in group for coords, _ in iter_chunks(images[index].shape, (16, 32, 32), region)}
+        expected += len(chunks)
+    assert sampler.decoded == len(loads) == expected
+    # Patches of a group overlap, so chunks are reused
+    assert sampler.reused > 0
+
+
+def test_close_cancels_prefetched_groups(files, monkeypatch):
+    paths, _ = files
+    started, release = [], threading.Event()
+    read_group = PatchSampler._read_group
+
+    def blocking_read_group(self, group):
+        started.append(group)
+        release.wait(5)
+        return read_group(self, group)
+
+    monkeypatch.setattr(PatchSampler, "_read_group", blocking_read_group)
+    sampler = PatchSampler(paths, (20, 24, 24), seed=0, group_size=4, prefetch=3)
+    iterator = iter(sampler)
+    thread = threading.Thread(target=next, args=(iterator,))
+    thread.start()
+    while not started:
+        release.wait(0.01)
+    # The first group is being read while the other groups wait in the queue
+    closer = threading.Thread(target=sampler.close)
+    closer.start()
+    while len(sampler._futures) > 1:
+        release.wait(0.01)
+    release.set()
+    closer.join(5)
+    thread.join(5)
+    assert not closer.is_alive()
+    assert len(started) == 1
@@ -0,0 +1,70 @@
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pytest
+import zarr
+from mzarr import Mzarr
+
+
+def read_levels(path):
+    mzarr = Mzarr(path, mode='r')
+    levels = [mzarr.level(p)[...] for p in range(mzarr.num_levels())]
+    mzarr.close()
+    return levels
+
+
+@pytest.mark.parametrize("type", ["subsampled", "gaussian"])
+@pytest.mark.parametrize("channel_axis", [None, 0])
+def test_streaming_save_equals_in_memory_save(save_image, type, channel_axis):
+    shape = (3, 72, 88) if channel_axis == 0 else (40, 72, 88)
+    chunks = (3, 32, 32) if channel_axis == 0 else (16, 32, 32)
+    options = dict(type=type, chunks=chunks, channel_axis=channel_axis)
+    memory_path, image = save_image(shape=shape, dtype=np.uint16, smooth=True, name="memory.mzarr", streaming=False, **options)
+    streaming_path, _ = save_image(image, name="streaming.mzarr", streaming=True, **options)
+    memory, streaming = read_levels(memory_path), read_levels(streaming_path)
+    assert len(memory) == len(streaming) > 1
+    for expected, actual in zip(memory, streaming):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_streaming_save_from_zarr_array(save_image):
+    memory_path, image = save_image(shape=(40, 72, 88), dtype=np.uint16, smooth=True, name="memory.mzarr", chunks=(16, 32, 32), streaming=False)
+    streaming_path, _ = save_image(zarr.array(image, chunks=(8, 72, 88)), name="streaming.mzarr", chunks=(16, 32, 32))
+    for expected, actual in zip(read_levels(memory_path), read_levels(streaming_path)):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def read_members(path):
+    with zipfile.ZipFile(path) as zf:
+        return {info.filename: zf.read(info) for info in zf.infolist()}
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_parallel_save_is_byte_identical(save_image, streaming):
+    serial_path, image = save_image(shape=(40, 72, 88), dtype=np.uint16, smooth=True, name="serial.mzarr", chunks=(16, 32, 32), streaming=streaming)
+    parallel_path, _ = save_image(image, name="parallel.mzarr", chunks=(16, 32, 32), streaming=streaming, workers=4)
+    serial, parallel = read_members(serial_path), read_members(parallel_path)
+    assert serial.keys() == parallel.keys()
+    for name in serial:
+        assert serial[name] == parallel[name], name
+
+
+def test_parallel_read_equals_serial_read(save_image):
+    path, image = save_image(shape=(40, 72, 88), dtype=np.uint16, smooth=True, chunks=(16, 32, 32))
+    mzarr = Mzarr(path, mode='r', workers=4)
+    np.testing.assert_array_equal(mzarr[5:37, 10:70, :], image[5:37, 10:70, :])
+    np.testing.assert_array_equal(mzarr.numpy(), image)
+    mzarr.close()
+
+
+@pytest.mark.parametrize("mode", ["r", "a"])
+def test_process_pool_save_and_read(save_image, mode):
+    serial_path, image = save_image(shape=(40, 72, 88), dtype=np.uint16, smooth=True, name="serial.mzarr", chunks=(16, 32, 32))
+    with ProcessPoolExecutor(2) as executor:
+        path, _ = save_image(image, chunks=(16, 32, 32), workers=executor)
+        assert read_members(path) == read_members(serial_path)
+        mzarr = Mzarr(path, mode=mode, workers=executor)
+        for p, expected in enumerate(read_levels(serial_path)):
+            np.testing.assert_array_equal(mzarr.read(level=p), expected)
+        np.testing.assert_array_equal(mzarr[5:37, 10:70, :], image[5:37, 10:70, :])
+        mzarr.close()
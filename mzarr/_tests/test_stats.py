@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from mzarr import Mzarr
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_statistics_ignore_non_finite_values(save_image, streaming):
+    image = np.random.default_rng(0).random((40, 64, 64)).astype(np.float32)
+    image[0, 0, 0] = np.nan
+    image[1, 1, 1] = np.inf
+    image[2, 2, 2] = -np.inf
+    # Chunks without any finite value
+    image[:, :8] = np.nan
+    path, _ = save_image(image, chunks=(16, 32, 32), streaming=streaming)
+
+    mzarr = Mzarr(path, mode='r')
+    stats = mzarr.statistics()
+    finite = image[np.isfinite(image)]
+    assert stats["count"] == finite.size
+    assert stats["min"] == pytest.approx(finite.min())
+    assert stats["max"] == pytest.approx(finite.max())
+    assert stats["mean"] == pytest.approx(finite.mean(dtype=np.float64))
+    assert stats["histogram"].sum() == finite.size
+    np.testing.assert_array_equal(mzarr.numpy(), image)
+    mzarr.close()
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_histogram_edges_cover_the_whole_array(save_image, streaming):
+    # The values of the center and of the first slab are narrower than the range of the whole array
+    image = np.full((40, 64, 64), 100, dtype=np.uint16)
+    image[20:, :8, :8] = 5000
+    image[0, 0, 0] = 1
+    path, _ = save_image(image, chunks=(16, 32, 32), streaming=streaming)
+
+    mzarr = Mzarr(path, mode='r')
+    stats = mzarr.statistics()
+    assert stats["edges"][0] == 1 and stats["edges"][-1] == 5000
+    assert stats["histogram"][0] == 1 and stats["histogram"][-1] == 20 * 8 * 8
+    mzarr.close()
+
+
+def test_histogram_edges_of_slabs_are_the_range_of_the_first_slab(tmp_path):
+    image = np.full((40, 64, 64), 100, dtype=np.uint16)
+    image[:8, 0, 0] = 200
+    image[20:, :8, :8] = 5000
+    path = str(tmp_path / "image.mzarr")
+    Mzarr.from_slabs((image[start:start + 8] for start in range(0, 40, 8)), image.shape, image.dtype).save(path, chunks=(16, 32, 32), streaming=True)
+
+    mzarr = Mzarr(path, mode='r')
+    stats = mzarr.statistics()
+    assert stats["edges"][0] == 100 and stats["edges"][-1] == 200
+    # Values outside of the edges are counted in the outer bins, while the summary covers all values
+    assert stats["histogram"][-1] == 8 + 20 * 8 * 8
+    assert stats["histogram"].sum() == stats["count"] == image.size
+    assert stats["max"] == 5000
+    mzarr.close()
+
+
+@pytest.fixture
+def mask(save_image):
+    image = np.zeros((32, 64, 64), dtype=np.uint16)
+    image[2:6, 3:9, 40:50] = 3
+    image[20:24, 50:60, 10:20] = 3
+    image[18:20, 0:4, 0:4] = 7
+    image[30, 60, 60] = 300
+    path, _ = save_image(image, chunks=(16, 32, 32), is_seg=True)
+    mzarr = Mzarr(path, mode='r')
+    yield mzarr, image
+    mzarr.close()
+
+
+def test_chunks_with_label(mask):
+    mzarr, image = mask
+    assert mzarr.chunks_with_label(3) == [(slice(0, 16), slice(0, 32), slice(32, 64)), (slice(16, 32), slice(32, 64), slice(0, 32))]
+    assert mzarr.chunks_with_label(7) == [(slice(16, 32), slice(0, 32), slice(0, 32))]
+    assert mzarr.chunks_with_label(5) == []
+    # Labels from MAX_LABEL on share a single bit
+    assert mzarr.chunks_with_label(300) == mzarr.chunks_with_label(1000) == [(slice(16, 32), slice(32, 64), slice(32, 64))]
+    for region in mzarr.chunks_with_label(0):
+        assert (image[region] == 0).any()
+
+
+def test_chunks_with_label_rejects_images(save_image):
+    path, _ = save_image(shape=(16, 32, 32))
+    mzarr = Mzarr(path, mode='r')
+    with pytest.raises(RuntimeError):
+        mzarr.chunks_with_label(1)
+    mzarr.close()
+
+
+def test_sample_patches(mask):
+    mzarr, image = mask
+    patches = mzarr.sample_patches((8, 16, 16), 50, foreground=1.0, label=3, seed=0)
+    assert patches == mzarr.sample_patches((8, 16, 16), 50, foreground=1.0, label=3, seed=0)
+    chunks = mzarr.chunks_with_label(3)
+    for patch in patches:
+        assert [key.stop - key.start for key in patch] == [8, 16, 16]
+        assert all(key.start >= 0 and key.stop <= size for key, size in zip(patch, image.shape))
+        # Every foreground patch is centered in a chunk with the label
+        center = [key.start + (key.stop - key.start) // 2 for key in patch]
+        assert any(all(key.start <= c < key.stop for key, c in zip(chunk, center)) for chunk in chunks)
+
+    # Without a label, the chunks are weighted by their number of nonzero elements
+    patches = mzarr.sample_patches((8, 16, 16), 200, foreground=1.0, seed=1)
+    centers = [tuple(key.start + (key.stop - key.start) // 2 for key in patch) for patch in patches]
+    in_chunk = [sum(all(key.start <= c < key.stop for key, c in zip(chunk, center)) for center in centers) for chunk in chunks]
+    assert sum(in_chunk) > 150 and min(in_chunk) > 0
+
+    # Background patches are drawn uniformly
+    patches = mzarr.sample_patches((8, 16, 16), 200, foreground=0.0, seed=2)
+    starts = {tuple(key.start for key in patch) for patch in patches}
+    assert len(starts) > 100
+    with pytest.raises(RuntimeError):
+        mzarr.sample_patches((8, 16), 1)
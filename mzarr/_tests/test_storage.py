@@ -0,0 +1,95 @@
+import gc
+import pickle
+import tracemalloc
+import warnings
+import zipfile
+import numpy as np
+import pytest
+from mzarr import Mzarr
+from mzarr.storage import read_consolidated, _Shard
+
+
+def test_read_consolidated(save_image):
+    path, _ = save_image(shape=(32, 256, 256))
+    metadata = read_consolidated(path)
+    assert metadata["base/.zarray"]["shape"] == [32, 256, 256]
+    # The metadata is found from the central directory entry even if the tail does not cover the member
+    assert read_consolidated(path, tail_bytes=256) == metadata
+
+
+def test_read_consolidated_legacy_layout_reads_only_the_tail(save_image):
+    path, image = save_image(shape=(64, 256, 256))
+    # A member after the consolidated metadata, like a file after `flush` or a file of an older writer
+    with zipfile.ZipFile(path, "a") as zf:
+        zf.writestr("base/extra", b"0")
+
+    tracemalloc.start()
+    try:
+        metadata = read_consolidated(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert metadata is None
+    assert peak < 4 * 64 * 1024 < image.nbytes
+
+    info = Mzarr.inspect(path)
+    assert info["shape"] == image.shape
+    assert info["dtype"] == "uint8"
+
+
+
+@pytest.mark.parametrize("layout", ["zip", "directory", "sharded"])
+def test_layout_round_trip(save_image, layout):
+    path, image = save_image(shape=(48, 96, 80), dtype=np.uint16, chunks=(16, 32, 32), layout=layout)
+    mzarr = Mzarr(path, mode='r')
+    assert Mzarr.inspect(path)["layout"] == layout
+    np.testing.assert_array_equal(mzarr.numpy(), image)
+    mzarr.close()
+
+
+@pytest.mark.parametrize("layout", ["directory", "sharded"])
+def test_repack(tmp_path, save_image, layout):
+    path, _ = save_image(shape=(48, 96, 80), dtype=np.uint16, chunks=(16, 32, 32))
+    out_path = str(tmp_path / "repacked.mzarr")
+    Mzarr.repack(path, out_path, layout=layout)
+    source, repacked = Mzarr(path, mode='r'), Mzarr(out_path, mode='r')
+    assert Mzarr.inspect(out_path)["layout"] == layout
+    assert repacked.num_levels() == source.num_levels()
+    for p in range(source.num_levels()):
+        np.testing.assert_array_equal(repacked.level(p)[...], source.level(p)[...])
+    source.close()
+    repacked.close()
+
+
+@pytest.mark.parametrize("layout", ["directory", "sharded"])
+def test_edit_and_pickle_directory_layouts(save_image, layout):
+    path, image = save_image(shape=(48, 96, 80), dtype=np.uint16, chunks=(16, 32, 32), layout=layout, compression={"id": "zstd", "level": 3})
+    mzarr = Mzarr(path, mode='a')
+    mzarr[10:20, 5:50, 70:80] = 7
+    mzarr.close()
+    image[10:20, 5:50, 70:80] = 7
+    mzarr = pickle.loads(pickle.dumps(Mzarr(path, mode='r')))
+    np.testing.assert_array_equal(mzarr.numpy(), image)
+    np.testing.assert_array_equal(mzarr.level(1)[...], image[::2, ::2, ::2])
+    mzarr.close()
+
+
+def test_save_refuses_to_replace_foreign_directories(tmp_path):
+    path = tmp_path / "data.mzarr"
+    path.mkdir()
+    (path / "notes.txt").write_text("keep")
+    with pytest.raises(RuntimeError):
+        Mzarr(np.zeros((8, 8, 8), dtype=np.uint8)).save(str(path), layout="directory")
+    assert (path / "notes.txt").read_text() == "keep"
+
+
+@pytest.mark.parametrize("readonly", [True, False])
+def test_shards_without_index_are_rejected_and_closed(tmp_path, readonly):
+    path = tmp_path / "shard"
+    path.write_bytes(b"not a shard" * 100)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        with pytest.raises(RuntimeError):
+            _Shard(str(path), 4, readonly)
+        gc.collect()
+    assert not [warning for warning in caught if issubclass(warning.category, ResourceWarning)]
@@ -0,0 +1,74 @@
+import warnings
+import numpy as np
+import pytest
+import tifffile
+from mzarr import Mzarr
+from mzarr.tiff2mzarr import load_tiff_slabs, tiffdir2mzarr
+
+
+@pytest.mark.parametrize("shape, options", [
+    ((40, 64, 64), {}),
+    # A hyperstack has one page per channel of every slice
+    ((40, 3, 64, 64), {"imagej": True, "metadata": {"axes": "ZCYX"}}),
+])
+def test_compressed_stack_is_read_page_by_page(tmp_path, shape, options):
+    path = str(tmp_path / "image.tif")
+    image = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+    tifffile.imwrite(path, image, compression="packbits", **options)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        slabs, slab_shape, dtype = load_tiff_slabs([path], 8)
+        slabs = list(slabs)
+    assert slab_shape == shape and dtype == image.dtype
+    assert [len(slab) for slab in slabs] == [8] * 5
+    np.testing.assert_array_equal(np.concatenate(slabs), image)
+
+
+def test_volumetric_page_warns_about_loading_the_whole_image(tmp_path):
+    path = str(tmp_path / "image.tif")
+    image = np.random.default_rng(0).integers(0, 255, (40, 64, 64), dtype=np.uint8)
+    tifffile.imwrite(path, image, compression="packbits", tile=(16, 32, 32))
+    with pytest.warns(UserWarning, match="whole image"):
+        slabs, _, _ = load_tiff_slabs([path], 8)
+        slabs = list(slabs)
+    np.testing.assert_array_equal(np.concatenate(slabs), image)
+
+
+def read_levels(path):
+    mzarr = Mzarr(path, mode='r')
+    levels = [mzarr.level(p)[...] for p in range(mzarr.num_levels())]
+    mzarr.close()
+    return levels
+
+
+@pytest.mark.parametrize("type, is_seg", [("subsampled", False), ("gaussian", False), ("mode", True), ("mean", False), ("max", False)])
+def test_slab_streamed_save_equals_in_memory_save(tmp_path, save_image, type, is_seg):
+    shape = (37, 64, 48)
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 4, shape, dtype=np.uint8) if is_seg else rng.integers(0, 65535, shape, dtype=np.uint16)
+    options = dict(type=type, is_seg=is_seg, chunks=(16, 32, 32), compression={"id": "zstd", "level": 3})
+    memory_path, _ = save_image(image, name="memory.mzarr", **options)
+    tiff_path = str(tmp_path / "image.tif")
+    tifffile.imwrite(tiff_path, image, compression="packbits")
+    slabs, slab_shape, dtype = load_tiff_slabs([tiff_path], 8)
+    streaming_path = str(tmp_path / "streaming.mzarr")
+    Mzarr.from_slabs(slabs, slab_shape, dtype).save(streaming_path, **options)
+
+    memory, streaming = read_levels(memory_path), read_levels(streaming_path)
+    assert len(memory) == len(streaming) > 1
+    for expected, actual in zip(memory, streaming):
+        np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("workers", [None, 3])
+def test_tiffdir2mzarr_equals_in_memory_save(tmp_path, save_image, workers):
+    expected_path, image = save_image(shape=(20, 64, 48), dtype=np.uint16, smooth=True, name="expected.mzarr")
+    load_dir = tmp_path / "slices"
+    load_dir.mkdir()
+    for index, image_slice in enumerate(image):
+        tifffile.imwrite(str(load_dir / "slice_{:03d}.tif".format(index)), image_slice)
+    save_filepath = str(tmp_path / "converted.mzarr")
+    tiffdir2mzarr(str(load_dir), save_filepath, is_seg=False, lossy=False, workers=workers, slab_size=6)
+
+    for expected, actual in zip(read_levels(expected_path), read_levels(save_filepath)):
+        np.testing.assert_array_equal(actual, expected)
@@ -0,0 +1,66 @@
+import math
+import numpy as np
+import pytest
+from mzarr import Mzarr
+from mzarr.tuning import benchmark_codecs, select_codec, tune, sample_array, LOSSLESS_CODECS, LOSSY_CODECS
+
+
+def result(ratio, decode_mbps, encode_mbps=100.0, lossless=True):
+    return {"codec": {"id": "test", "ratio": ratio}, "ratio": ratio, "decode_mbps": decode_mbps, "encode_mbps": encode_mbps, "lossless": lossless}
+
+
+def test_benchmark_codecs(save_image):
+    _, image = save_image(shape=(16, 64, 64), dtype=np.uint16, smooth=True, num_pyramids=0)
+    results = benchmark_codecs(image, (16, 32, 32), LOSSLESS_CODECS[:1] + [{"id": "zstd", "level": 3}] + LOSSY_CODECS[:1])
+    assert [r["codec"] for r in results] == LOSSLESS_CODECS[:1] + [{"id": "zstd", "level": 3}] + LOSSY_CODECS[:1]
+    for r in results[:2]:
+        assert r["lossless"] and r["max_error"] == 0 and math.isinf(r["psnr"])
+        assert r["ratio"] > 1 and r["encode_mbps"] > 0 and r["decode_mbps"] > 0
+    assert not results[2]["lossless"] and 0 < results[2]["max_error"] and results[2]["psnr"] > 40
+    # Lossy JpegXl compresses better than lossless JpegXl
+    assert results[2]["ratio"] > results[0]["ratio"]
+
+
+def test_select_codec():
+    results = [result(2.0, 500.0), result(3.0, 200.0), result(4.0, 50.0), result(8.0, 20.0, lossless=False)]
+    # Without a target the highest ratio wins
+    assert select_codec(results) is results[2]
+    assert select_codec(results, lossless=False) is results[3]
+    # The highest ratio among the codecs that meet the target
+    assert select_codec(results, min_decode_mbps=100.0) is results[1]
+    # With only a minimal ratio, the fastest decoding among the codecs that meet it
+    assert select_codec(results, min_ratio=2.5) is results[1]
+    # No codec meets the target, so the closest one is selected
+    assert select_codec(results, min_decode_mbps=1000.0) is results[0]
+    with pytest.raises(RuntimeError):
+        select_codec(results[3:])
+
+
+def test_tune(save_image):
+    _, image = save_image(shape=(16, 64, 64), dtype=np.uint16, smooth=True, num_pyramids=0)
+    sample = sample_array(image, (8, 32, 32), max_chunks=4)
+    assert sample.shape == (8, 32, 32)
+    selected = tune(sample, (8, 32, 32))
+    assert selected["lossless"] and selected["codec"] in LOSSLESS_CODECS
+    selected = tune(sample, (8, 32, 32), lossless=False, codecs=[{"id": "zstd", "level": 3}] + LOSSY_CODECS)
+    assert selected["codec"] in LOSSY_CODECS
+    with pytest.raises(RuntimeError):
+        tune(sample, target={"max_ratio": 2})
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_save_with_auto_compression(save_image, streaming):
+    target = {"min_decode_mbps": 1.0}
+    path, image = save_image(shape=(32, 96, 96), dtype=np.uint16, smooth=True, chunks=(16, 32, 32), compression="auto", compression_target=target, streaming=streaming)
+    mzarr = Mzarr(path, mode='r')
+    compression = mzarr.store.attrs["compression"]
+    assert compression["mode"] == "auto" and compression["target"] == target
+    assert len(compression["levels"]) == mzarr.num_levels()
+    for p, level in enumerate(compression["levels"]):
+        # The recorded codec is the codec of the level
+        assert level["codec"] == mzarr.level(p).compressor.get_config()
+        assert {"encode_mbps", "decode_mbps", "ratio", "psnr", "max_error", "lossless"} <= set(level)
+    # The base level stays lossless
+    assert compression["levels"][0]["lossless"] and compression["levels"][0]["psnr"] is None
+    np.testing.assert_array_equal(mzarr.numpy(), image)
+    mzarr.close()
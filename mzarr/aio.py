@@ -0,0 +1,216 @@
+import numpy as np
+import zarr
+import asyncio
+import contextvars
+from zarr.indexing import BasicIndexer
+from concurrent.futures import Executor
+from collections import deque
+from typing import Optional, Tuple, Any, Dict, Hashable, List, AsyncIterator
+from mzarr.cache import ChunkCache, chunk_key
+from mzarr.chunk_io import load_chunk, fetch_chunk, decode_chunk, iter_chunks, in_process
+from mzarr import profiling
+
+
+class AsyncChunkReader:
+    def __init__(
+            self,
+            executor: Optional[Executor] = None,
+            cache: Optional[ChunkCache] = None,
+            file: Optional[str] = None
+    ) -> None:
+        """
+        Read regions of zarr arrays from asyncio coroutines.
+
+        Fetching and decoding a chunk are blocking, so every chunk is loaded in the executor while the event loop
+        keeps serving other requests. Requests for a chunk that is already being loaded wait for the same load
+        instead of starting another one. A cancelled request stops waiting immediately and the load of a chunk is
+        cancelled once no request waits for it anymore (unless it already runs in the executor). With a process pool,
+        the chunks are fetched in the event loop and only decoded in the pool.
+
+        Args:
+            executor (Executor, optional): The pool used to fetch and decode chunks. Defaults to None, which uses the
+                default executor of the event loop.
+            cache (ChunkCache, optional): The cache of decoded chunks. Defaults to None.
+            file (str, optional): The absolute path of the file the arrays belong to. Required for the cache.
+        """
+
+        self.executor = executor
+        self.cache = cache if file is not None else None
+        self.file = file
+        self.loads = 0
+        self.merged = 0
+        self._inflight: Dict[Hashable, List[Any]] = {}
+
+    async def read(self, array: zarr.Array, selection: Any) -> Any:
+        """
+        Read a region of an array with basic indexing.
+
+        Args:
+            array (zarr.Array): The array to read from.
+            selection (Any): The index or slice to read.
+
+        Returns:
+            Any: The region as NumPy array or a scalar if all axes are indexed with integers.
+        """
+
+        indexer = BasicIndexer(selection, array)
+        out = np.empty(indexer.shape, dtype=array.dtype)
+        pending = []
+        for chunk_coords, chunk_selection, out_selection in indexer:
+            if self.cache is not None:
+                chunk = self.cache.get(chunk_key(self.file, array.path, chunk_coords))
+                if chunk is not None:
+                    if profiling.active() is not None:
+                        profiling.active().add_cache_hit(array.path)
+                    out[out_selection] = chunk[chunk_selection]
+                    continue
+            pending.append((chunk_coords, chunk_selection, out_selection))
+        chunks = await asyncio.gather(*(self._chunk(array, chunk_coords) for chunk_coords, _, _ in pending))
+        for chunk, (_, chunk_selection, out_selection) in zip(chunks, pending):
+            if chunk is None:
+                if array.fill_value is not None:
+                    out[out_selection] = array.fill_value
+                continue
+            out[out_selection] = chunk[chunk_selection]
+        if out.shape:
+            return out
+        return out[()]
+
+    async def iter_tiles(
+            self,
+            array: zarr.Array,
+            tile_shape: Tuple[int, ...],
+            region: Optional[Tuple[slice, ...]] = None,
+            prefetch: int = 8
+    ) -> AsyncIterator[Tuple[Tuple[slice, ...], np.ndarray]]:
+        """
+        Read an array tile by tile in C-order while the next tiles are already loading.
+
+        Args:
+            array (zarr.Array): The array to read from.
+            tile_shape (Tuple[int, ...]): The shape of the tiles, the tiles at the border may be smaller.
+            region (Tuple[slice, ...], optional): Only read the tiles within this region. Defaults to None.
+            prefetch (int, optional): The number of tiles that are loaded ahead. Defaults to 8.
+
+        Yields:
+            Tuple[Tuple[slice, ...], np.ndarray]: The region of the tile in the array and its data.
+        """
+
+        pending = deque()
+        try:
+            for tile in tile_regions(array.shape, tile_shape, region):
+                pending.append((tile, asyncio.ensure_future(self.read(array, tile))))
+                if len(pending) > prefetch:
+                    tile, task = pending.popleft()
+                    yield tile, await task
+            while pending:
+                tile, task = pending.popleft()
+                yield tile, await task
+        finally:
+            # The consumer stopped early or was cancelled
+            for _, task in pending:
+                task.cancel()
+
+    async def _chunk(self, array: zarr.Array, chunk_coords: Tuple[int, ...]) -> Optional[np.ndarray]:
+        """
+        Load a chunk in the executor or wait for the load that is already in flight.
+
+        Args:
+            array (zarr.Array): The array the chunk belongs to.
+            chunk_coords (Tuple[int, ...]): The chunk coordinates.
+
+        Returns:
+            Optional[np.ndarray]: The decoded chunk or None if the chunk is not stored.
+        """
+
+        loop = asyncio.get_running_loop()
+        key = (loop, chunk_key(self.file, array.path, chunk_coords) if self.file is not None else (id(array), chunk_coords))
+        entry = self._inflight.get(key)
+        if entry is None:
+            if in_process(self.executor):
+                # The load runs in the context of the task, so an active profile records it
+                future = loop.run_in_executor(self.executor, contextvars.copy_context().run, load_chunk, array, chunk_coords)
+            else:
+                future = self._decode(loop, array, chunk_coords)
+            entry = self._inflight[key] = [future, 0]
+            future.add_done_callback(lambda f, key=key, entry=entry: self._loaded(key, entry, array, chunk_coords))
+            self.loads += 1
+        else:
+            self.merged += 1
+        entry[1] += 1
+        try:
+            # The shield keeps a cancelled request from cancelling the load shared with other requests
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            if not entry[0].done():
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._inflight.pop(key, None)
+                    entry[0].cancel()
+            raise
+
+    def _decode(self, loop: asyncio.AbstractEventLoop, array: zarr.Array, chunk_coords: Tuple[int, ...]) -> asyncio.Future:
+        """
+        Fetch a chunk and decode it in a process pool. The context of the task and memoryviews of memory-mapped
+        stores can not be pickled, so the chunk is fetched in the event loop and sent to the pool as bytes.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The running event loop.
+            array (zarr.Array): The array the chunk belongs to.
+            chunk_coords (Tuple[int, ...]): The chunk coordinates.
+
+        Returns:
+            asyncio.Future: The future of the decoded chunk or None if the chunk is not stored.
+        """
+
+        try:
+            cdata = fetch_chunk(array, chunk_coords, profiling.active())
+        except KeyError:
+            future = loop.create_future()
+            future.set_result(None)
+            return future
+        if isinstance(cdata, memoryview):
+            cdata = bytes(cdata)
+        return loop.run_in_executor(self.executor, decode_chunk, array.compressor, cdata, array.dtype, array.chunks)
+
+    def _loaded(self, key: Hashable, entry: List[Any], array: zarr.Array, chunk_coords: Tuple[int, ...]) -> None:
+        """
+        Remove a finished load from the loads in flight and add its chunk to the cache.
+
+        Args:
+            key (Hashable): The key of the load.
+            entry (List[Any]): The future of the load and the number of waiting requests.
+            array (zarr.Array): The array the chunk belongs to.
+            chunk_coords (Tuple[int, ...]): The chunk coordinates.
+        """
+
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+        future = entry[0]
+        if self.cache is not None and not future.cancelled() and future.exception() is None and future.result() is not None:
+            self.cache.put(chunk_key(self.file, array.path, chunk_coords), future.result())
+
+
+def tile_regions(
+        shape: Tuple[int, ...],
+        tile_shape: Tuple[int, ...],
+        region: Optional[Tuple[slice, ...]] = None
+) -> List[Tuple[slice, ...]]:
+    """
+    Split an array into tiles in C-order.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the array.
+        tile_shape (Tuple[int, ...]): The shape of the tiles.
+        region (Tuple[slice, ...], optional): Only return the tiles within this region, clipped to it. Defaults to None.
+
+    Returns:
+        List[Tuple[slice, ...]]: The regions of the tiles.
+    """
+
+    region = tuple(region or ()) + (slice(None),) * (len(shape) - len(region or ()))
+    bounds = [key.indices(size)[:2] for key, size in zip(region, shape)]
+    return [
+        tuple(slice(max(key.start, start), min(key.stop, stop)) for key, (start, stop) in zip(tile, bounds))
+        for _, tile in iter_chunks(shape, tile_shape, region)
+    ]
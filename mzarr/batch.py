@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, List, Tuple, Callable, Dict
+from tqdm import tqdm
+from mzarr.profiling import IOStats
+
+
+def convert_all(
+        jobs: List[Tuple[str, str]],
+        convert: Callable[[str, str], None],
+        processes: int = 1,
+        nbytes: Optional[Callable[[str], int]] = None,
+        memory_budget: Optional[int] = None,
+        memory_factor: float = 3.0,
+        manifest_filepath: Optional[str] = None,
+        overwrite: bool = False,
+        desc: str = "Image conversion",
+        stats: Optional[IOStats] = None
+) -> List[dict]:
+    """
+    Converts many files in a pool of processes.
+
+    Outputs that exist and are newer than their input are skipped, so an interrupted conversion can simply
+    be restarted. Every output is first written to a temporary '.partial' file that is only renamed after
+    the conversion succeeded, hence a crash never leaves a truncated output behind.
+    The number of concurrently running conversions is limited by the memory budget: A conversion is only
+    started if the estimated memory of all running conversions stays within the budget. A single conversion
+    that exceeds the budget on its own is run alone.
+    Failed conversions do not stop the batch and are reported with their error.
+
+    Args:
+        jobs (List[Tuple[str, str]]): The input and output paths of every conversion.
+        convert (Callable[[str, str], None]): Converts a single input path to an output path. Needs to be
+            picklable, e.g. a module level function or a functools.partial of one.
+        processes (int, optional): The number of processes, values below 1 use a single process. Defaults to 1.
+        nbytes (Callable[[str], int], optional): Returns the uncompressed size of an input in bytes. Used for the
+            memory estimate and the compression ratio. Defaults to None.
+        memory_budget (int, optional): The maximal estimated memory of all running conversions in bytes.
+            Defaults to None, which only limits the number of processes.
+        memory_factor (float, optional): The estimated peak memory of a conversion relative to the uncompressed
+            size of its input. Defaults to 3.0.
+        manifest_filepath (str, optional): Path to a JSON lines file to which an entry with the timing and
+            compression ratio of every conversion is appended. Defaults to None.
+        overwrite (bool, optional): Whether to convert inputs with an up-to-date output again. Defaults to False.
+        desc (str, optional): The description of the progress bar. Defaults to "Image conversion".
+        stats (IOStats, optional): Instruments every conversion in its worker process and adds the statistics to
+            this stats object. Defaults to None.
+
+    Returns:
+        List[dict]: The manifest entries of all jobs in the order of the jobs. Skipped jobs have the status 'skipped'.
+    """
+
+    processes = max(processes, 1)
+    results: Dict[int, dict] = {}
+    todo = []
+    for index, (load_filepath, save_filepath) in enumerate(jobs):
+        if not overwrite and is_up_to_date(load_filepath, save_filepath):
+            results[index] = {"input": load_filepath, "output": save_filepath, "status": "skipped"}
+        else:
+            size = None
+            if nbytes is not None:
+                # An unreadable input fails in the conversion, where the error is recorded
+                with contextlib.suppress(Exception):
+                    size = nbytes(load_filepath)
+            todo.append((index, load_filepath, save_filepath, size))
+
+    # Start with the largest conversions, so they do not end up running alone at the end
+    todo.sort(key=lambda job: -(job[3] or 0))
+    with open(manifest_filepath, "a") if manifest_filepath is not None else contextlib.nullcontext() as manifest, \
+            tqdm(total=len(jobs), initial=len(results), desc=desc) as progress, \
+            ProcessPoolExecutor(processes) as executor:
+        running = {}
+        while todo or running:
+            while todo and len(running) < processes:
+                job = _next_job(todo, running, memory_budget, memory_factor)
+                if job is None:
+                    break
+                todo.remove(job)
+                future = executor.submit(_convert, convert, job[1], job[2], stats is not None)
+                running[future] = job
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, load_filepath, save_filepath, size = running.pop(future)
+                entry = {"input": load_filepath, "output": save_filepath, "nbytes": size}
+                try:
+                    result = future.result()
+                    if stats is not None:
+                        stats.merge(result.pop("stats"))
+                    entry.update(result)
+                    entry["status"] = "converted"
+                    if size is not None and entry["output_nbytes"] > 0:
+                        entry["compression_ratio"] = size / entry["output_nbytes"]
+                except Exception as error:  # noqa: BLE001
+                    entry["status"] = "failed"
+                    entry["error"] = "{}: {}".format(type(error).__name__, error)
+                results[index] = entry
+                if manifest is not None:
+                    manifest.write(json.dumps(entry) + "\n")
+                    manifest.flush()
+                progress.update()
+
+    return [results[index] for index in range(len(jobs))]
+
+
+def is_up_to_date(load_filepath: str, save_filepath: str) -> bool:
+    """
+    Checks whether an output exists and is newer than its input.
+
+    Args:
+        load_filepath (str): Path to the input file or directory.
+        save_filepath (str): Path to the output file.
+
+    Returns:
+        bool: Whether the output is up to date.
+    """
+
+    return os.path.exists(save_filepath) and os.path.getmtime(save_filepath) >= _mtime(load_filepath)
+
+
+def load_manifest(manifest_filepath: str) -> Dict[str, dict]:
+    """
+    Loads a manifest written by `convert_all`.
+
+    Args:
+        manifest_filepath (str): Path to the manifest.
+
+    Returns:
+        Dict[str, dict]: The latest entry of every output path.
+    """
+
+    entries = {}
+    with open(manifest_filepath) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry["output"]] = entry
+    return entries
+
+
+def _next_job(todo: List[tuple], running: dict, memory_budget: Optional[int], memory_factor: float) -> Optional[tuple]:
+    """
+    Selects the largest pending job that fits into the remaining memory budget.
+
+    Args:
+        todo (List[tuple]): The pending jobs sorted by decreasing size.
+        running (dict): The running jobs.
+        memory_budget (Optional[int]): The maximal estimated memory of all running jobs.
+        memory_factor (float): The estimated peak memory of a job relative to its uncompressed size.
+
+    Returns:
+        Optional[tuple]: The job or None if no job fits.
+    """
+
+    if memory_budget is None:
+        return todo[0]
+    used = sum((job[3] or 0) * memory_factor for job in running.values())
+    for job in todo:
+        if used + (job[3] or 0) * memory_factor <= memory_budget:
+            return job
+    # A job that exceeds the budget on its own is run alone
+    return todo[0] if not running else None
+
+
+def _convert(convert: Callable[[str, str], None], load_filepath: str, save_filepath: str, profile: bool = False) -> dict:
+    """
+    Runs a single conversion in a worker process and atomically moves the output into place.
+
+    Args:
+        convert (Callable[[str, str], None]): Converts a single input path to an output path.
+        load_filepath (str): Path to the input.
+        save_filepath (str): Path to the output.
+        profile (bool, optional): Whether to instrument the conversion. Defaults to False.
+
+    Returns:
+        dict: The duration of the conversion in seconds, the size of the output in bytes and, if instrumented,
+            the statistics of the conversion.
+    """
+
+    partial_filepath = save_filepath + ".partial"
+    stats = IOStats()
+    start = time.perf_counter()
+    try:
+        if profile:
+            with stats:
+                convert(load_filepath, partial_filepath)
+        else:
+            convert(load_filepath, partial_filepath)
+        os.replace(partial_filepath, save_filepath)
+    finally:
+        if os.path.exists(partial_filepath):
+            os.remove(partial_filepath)
+    result = {"seconds": time.perf_counter() - start, "output_nbytes": os.path.getsize(save_filepath)}
+    if profile:
+        result["stats"] = stats.as_dict()
+    return result
+
+
+def _mtime(path: str) -> float:
+    """
+    Gets the modification time of a file or the latest modification time of the files in a directory.
+
+    Args:
+        path (str): Path to the file or directory.
+
+    Returns:
+        float: The modification time.
+    """
+
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+    return max([os.path.getmtime(path)] + [os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path)])
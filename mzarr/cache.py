@@ -0,0 +1,159 @@
+import numpy as np
+from collections import OrderedDict
+from typing import Optional, Hashable, Tuple
+import threading
+
+
+class ChunkCache:
+    def __init__(self, max_bytes: int = 256 * 1024 ** 2) -> None:
+        """
+        A thread-safe cache of decoded chunks with a byte budget and least-recently-used eviction.
+
+        The cache is keyed by (file, level, chunk index) and can be shared by multiple Mzarr instances in
+        the same process by passing the same instance to each of them. Cached chunks are read-only.
+
+        Args:
+            max_bytes (int, optional): The maximal number of bytes of decoded chunks held in the cache.
+                Defaults to 256 MiB.
+        """
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """
+        Get a decoded chunk from the cache and mark it as most recently used.
+
+        Args:
+            key (Hashable): The key of the chunk.
+
+        Returns:
+            Optional[np.ndarray]: The decoded chunk or None if the chunk is not cached.
+        """
+
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is None:
+                self.misses += 1
+                return None
+            self._chunks.move_to_end(key)
+            self.hits += 1
+            return chunk
+
+    def put(self, key: Hashable, chunk: np.ndarray) -> None:
+        """
+        Add a decoded chunk to the cache and evict the least recently used chunks until it fits into the budget.
+        Chunks larger than the budget are not cached.
+
+        Args:
+            key (Hashable): The key of the chunk.
+            chunk (np.ndarray): The decoded chunk.
+        """
+
+        if chunk.nbytes > self.max_bytes:
+            return
+        chunk.flags.writeable = False
+        with self._lock:
+            if key in self._chunks:
+                self.nbytes -= self._chunks.pop(key).nbytes
+            self._chunks[key] = chunk
+            self.nbytes += chunk.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._chunks.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def discard(self, key: Hashable) -> None:
+        """
+        Remove a chunk from the cache if it is cached.
+
+        Args:
+            key (Hashable): The key of the chunk.
+        """
+
+        with self._lock:
+            chunk = self._chunks.pop(key, None)
+            if chunk is not None:
+                self.nbytes -= chunk.nbytes
+
+    def invalidate(self, file: str, level: Optional[str] = None) -> None:
+        """
+        Remove all chunks of a file or of a single level of a file from the cache.
+
+        Args:
+            file (str): The file of the chunks.
+            level (str, optional): The path of the level within the file. Defaults to None, which removes all levels.
+        """
+
+        with self._lock:
+            for key in [key for key in self._chunks if key[0] == file and (level is None or key[1] == level)]:
+                self.nbytes -= self._chunks.pop(key).nbytes
+
+    def clear(self) -> None:
+        """
+        Remove all chunks from the cache. The counters are kept.
+        """
+
+        with self._lock:
+            self._chunks.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the cache.
+
+        Returns:
+            dict: The number of hits, misses, evictions and cached chunks, the cached bytes and the hit rate.
+        """
+
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "chunks": len(self._chunks),
+                "nbytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": self.hits / requests if requests > 0 else 0.0,
+            }
+
+    def __getstate__(self) -> dict:
+        """
+        Get the state of the cache for pickling. Only the budget is pickled, so every process starts with an empty cache.
+
+        Returns:
+            dict: The state of the cache.
+        """
+
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["max_bytes"])
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def __repr__(self) -> str:
+        return "ChunkCache({})".format(", ".join("{}={}".format(key, value) for key, value in self.stats().items()))
+
+
+def chunk_key(file: str, level: str, chunk_coords: Tuple[int, ...]) -> Tuple[str, str, Tuple[int, ...]]:
+    """
+    Build the cache key of a chunk.
+
+    Args:
+        file (str): The absolute path of the Mzarr file.
+        level (str): The path of the level within the file.
+        chunk_coords (Tuple[int, ...]): The chunk index.
+
+    Returns:
+        Tuple[str, str, Tuple[int, ...]]: The cache key.
+    """
+
+    return file, level, tuple(chunk_coords)
@@ -0,0 +1,398 @@
+import numpy as np
+import zarr
+from zarr.indexing import BasicIndexer
+from numcodecs.compat import ensure_ndarray_like
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from collections import deque
+from typing import Optional, List, Tuple, Any, Callable, Iterator
+from mzarr.cache import ChunkCache, chunk_key
+from mzarr import profiling
+import itertools
+import math
+import time
+
+
+def iter_chunks(
+        shape: Tuple[int, ...],
+        chunks: Tuple[int, ...],
+        region: Optional[Tuple[slice, ...]] = None
+) -> Iterator[Tuple[Tuple[int, ...], Tuple[slice, ...]]]:
+    """
+    Iterate over the chunk grid of an array in C-order, which is the order in which zarr writes chunks.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the array.
+        chunks (Tuple[int, ...]): The chunk shape of the array.
+        region (Tuple[slice, ...], optional): Only iterate over the chunks that overlap with this region.
+            Defaults to None.
+
+    Yields:
+        Tuple[Tuple[int, ...], Tuple[slice, ...]]: The chunk coordinates and the region of the chunk in the array.
+    """
+
+    if region is None:
+        ranges = [range(math.ceil(s / c)) for s, c in zip(shape, chunks)]
+    else:
+        ranges = []
+        region = tuple(region) + (slice(None),) * (len(shape) - len(region))
+        for key, s, c in zip(region, shape, chunks):
+            start, stop, _ = key.indices(s)
+            ranges.append(range(start // c, math.ceil(stop / c)))
+    for coords in itertools.product(*ranges):
+        yield coords, tuple(slice(i * c, min((i + 1) * c, s)) for i, c, s in zip(coords, chunks, shape))
+
+
+def encode_chunk(compressor: Any, chunk: np.ndarray) -> Any:
+    """
+    Encode a full chunk in the same way as `zarr.Array` does.
+
+    This is a module level function, so it can be submitted to thread and process pools alike.
+
+    Args:
+        compressor (Any): The numcodecs compressor of the array or None.
+        chunk (np.ndarray): The chunk with the full chunk shape.
+
+    Returns:
+        Any: The encoded chunk.
+    """
+
+    if compressor is None:
+        return chunk
+    return compressor.encode(chunk)
+
+
+def decode_chunk(compressor: Any, cdata: Any, dtype: np.dtype, chunks: Tuple[int, ...]) -> np.ndarray:
+    """
+    Decode a chunk in the same way as `zarr.Array` does.
+
+    This is a module level function, so it can be submitted to thread and process pools alike.
+
+    Args:
+        compressor (Any): The numcodecs compressor of the array or None.
+        cdata (Any): The encoded chunk.
+        dtype (np.dtype): The dtype of the array.
+        chunks (Tuple[int, ...]): The chunk shape of the array.
+
+    Returns:
+        np.ndarray: The decoded chunk.
+    """
+
+    chunk = cdata if compressor is None else compressor.decode(cdata)
+    chunk = ensure_ndarray_like(chunk).view(dtype)
+    return chunk.reshape(-1, order="A").reshape(chunks)
+
+
+def fetch_chunk(array: zarr.Array, chunk_coords: Tuple[int, ...], stats: Optional["profiling.IOStats"] = None) -> Any:
+    """
+    Read an encoded chunk from the store of an array.
+
+    Args:
+        array (zarr.Array): The array the chunk belongs to.
+        chunk_coords (Tuple[int, ...]): The chunk coordinates.
+        stats (IOStats, optional): Records the read. Defaults to None.
+
+    Returns:
+        Any: The encoded chunk.
+
+    Raises:
+        KeyError: If the chunk is not stored.
+    """
+
+    if stats is None:
+        return array.chunk_store[array._chunk_key(chunk_coords)]
+    start = time.perf_counter()
+    cdata = array.chunk_store[array._chunk_key(chunk_coords)]
+    stats.add_store_read(array.path, _nbytes(cdata), time.perf_counter() - start)
+    return cdata
+
+
+def load_chunk(array: zarr.Array, chunk_coords: Tuple[int, ...]) -> Optional[np.ndarray]:
+    """
+    Fetch and decode a chunk, e.g. in a pool.
+
+    Args:
+        array (zarr.Array): The array the chunk belongs to.
+        chunk_coords (Tuple[int, ...]): The chunk coordinates.
+
+    Returns:
+        Optional[np.ndarray]: The decoded chunk or None if the chunk is not stored.
+    """
+
+    stats = profiling.active()
+    try:
+        cdata = fetch_chunk(array, chunk_coords, stats)
+    except KeyError:
+        return None
+    if stats is None:
+        return decode_chunk(array.compressor, cdata, array.dtype, array.chunks)
+    chunk, seconds = _decode_timed(array.compressor, cdata, array.dtype, array.chunks)
+    stats.add_decode(array.path, chunk.nbytes, seconds)
+    return chunk
+
+
+def write_chunks(
+        arrays: List[zarr.Array],
+        compute: Callable[[Tuple[slice, ...]], np.ndarray],
+        executor: Optional[Executor] = None,
+        max_pending: Optional[int] = None,
+        region: Optional[Tuple[slice, ...]] = None,
+        on_chunk: Optional[Callable[[Tuple[int, ...], np.ndarray], None]] = None
+) -> None:
+    """
+    Write arrays chunk by chunk.
+
+    The data of every chunk is computed in the calling thread. Without an executor, it is written through zarr.
+    With an executor, the encoding is distributed over the pool, while the encoded chunks are still written
+    in C-order from the calling thread. The chunks are padded with the fill value and encoded exactly as zarr
+    does, so the stored chunks are byte-identical to the serial path. At most `max_pending` chunks are
+    in flight at any time to bound the memory consumption.
+
+    Args:
+        arrays (List[zarr.Array]): The arrays to write. All arrays share the same shape and chunks.
+        compute (Callable[[Tuple[slice, ...]], np.ndarray]): Computes the data of a region of the arrays.
+        executor (Executor, optional): The pool used for encoding. Defaults to None.
+        max_pending (int, optional): The maximal number of chunks in flight. Defaults to four times the number
+            of workers of the executor.
+        region (Tuple[slice, ...], optional): Only write the chunks that overlap with this chunk-aligned region.
+            Defaults to None.
+        on_chunk (Callable[[Tuple[int, ...], np.ndarray], None], optional): Called with the chunk coordinates and
+            the data of every chunk, e.g. to collect statistics while writing. Defaults to None.
+    """
+
+    shape, chunks = arrays[0].shape, arrays[0].chunks
+    if max_pending is None:
+        max_pending = 4 * getattr(executor, "_max_workers", 1)
+    stats = profiling.active()
+    pending = deque()
+    for coords, chunk_region in iter_chunks(shape, chunks, region):
+        block = np.asarray(compute(chunk_region))
+        if on_chunk is not None:
+            on_chunk(coords, block)
+        for array in arrays:
+            if executor is None and stats is None:
+                array[chunk_region] = block.astype(array.dtype, copy=False)
+                continue
+            chunk = _pad_chunk(array, block)
+            if not array.write_empty_chunks and array.fill_value is not None and np.all(chunk == array.fill_value):
+                continue
+            if stats is None:
+                future = executor.submit(encode_chunk, array.compressor, chunk)
+            else:
+                future = _submit(executor, _encode_timed, array.compressor, chunk)
+            pending.append((array, array._chunk_key(coords), future, stats))
+        while len(pending) > max_pending:
+            _store_chunk(*pending.popleft())
+    while pending:
+        _store_chunk(*pending.popleft())
+
+
+def read_region(
+        array: zarr.Array,
+        selection: Any,
+        executor: Optional[Executor] = None,
+        cache: Optional[ChunkCache] = None,
+        file: Optional[str] = None
+) -> Any:
+    """
+    Read a region of an array with basic indexing.
+
+    The encoded chunks are read from the store in the calling thread, while the decoding is distributed
+    over the pool. Decoded chunks are looked up in and added to the cache. Without an executor and cache,
+    the region is read through zarr. Chunks of a memory-mapped store are copied before they are sent to the
+    worker processes of a process pool, see `in_process`.
+
+    Args:
+        array (zarr.Array): The array to read from.
+        selection (Any): The index or slice to read.
+        executor (Executor, optional): The pool used for decoding. Defaults to None.
+        cache (ChunkCache, optional): The cache of decoded chunks. Defaults to None.
+        file (str, optional): The absolute path of the file the array belongs to. Required for the cache.
+
+    Returns:
+        Any: The region as NumPy array or a scalar if all axes are indexed with integers.
+    """
+
+    stats = profiling.active()
+    if executor is None and cache is None and stats is None:
+        return array[selection]
+    indexer = BasicIndexer(selection, array)
+    out = np.empty(indexer.shape, dtype=array.dtype)
+    pending = []
+    for chunk_coords, chunk_selection, out_selection in indexer:
+        key = None
+        if cache is not None:
+            key = chunk_key(file, array.path, chunk_coords)
+            chunk = cache.get(key)
+            if chunk is not None:
+                if stats is not None:
+                    stats.add_cache_hit(array.path)
+                out[out_selection] = chunk[chunk_selection]
+                continue
+        try:
+            cdata = fetch_chunk(array, chunk_coords, stats)
+        except KeyError:
+            if array.fill_value is not None:
+                out[out_selection] = array.fill_value
+            continue
+        if not in_process(executor) and isinstance(cdata, memoryview):
+            cdata = bytes(cdata)
+        if stats is not None:
+            chunk = _submit(executor, _decode_timed, array.compressor, cdata, array.dtype, array.chunks)
+        elif executor is None:
+            chunk = decode_chunk(array.compressor, cdata, array.dtype, array.chunks)
+        else:
+            chunk = executor.submit(decode_chunk, array.compressor, cdata, array.dtype, array.chunks)
+        pending.append((key, chunk, chunk_selection, out_selection))
+    for key, chunk, chunk_selection, out_selection in pending:
+        if stats is not None:
+            chunk, seconds = chunk.result()
+            stats.add_decode(array.path, chunk.nbytes, seconds)
+        elif executor is not None:
+            chunk = chunk.result()
+        if cache is not None:
+            cache.put(key, chunk)
+        out[out_selection] = chunk[chunk_selection]
+    if out.shape:
+        return out
+    return out[()]
+
+
+def in_process(executor: Optional[Executor]) -> bool:
+    """
+    Check whether the tasks of an executor run in the calling process. Only then they can be passed objects that
+    can not be pickled, like the memoryviews returned by memory-mapped stores.
+
+    Args:
+        executor (Optional[Executor]): The executor or None to run the tasks in the calling thread.
+
+    Returns:
+        bool: Whether the tasks run in the calling process.
+    """
+
+    return executor is None or isinstance(executor, ThreadPoolExecutor)
+
+
+class ChunkReader:
+    def __init__(
+            self,
+            array: zarr.Array,
+            executor: Optional[Executor] = None,
+            cache: Optional[ChunkCache] = None,
+            file: Optional[str] = None
+    ) -> None:
+        """
+        An array-like view of a zarr array that reads with `read_region`, so it can be passed to functions
+        that slice arbitrary array-likes while decoding in a pool and sharing decoded chunks through a cache.
+
+        Args:
+            array (zarr.Array): The array to read from.
+            executor (Executor, optional): The pool used for decoding. Defaults to None.
+            cache (ChunkCache, optional): The cache of decoded chunks. Defaults to None.
+            file (str, optional): The absolute path of the file the array belongs to. Required for the cache.
+        """
+
+        self.array = array
+        self.executor = executor
+        self.cache = cache
+        self.file = file
+        self.shape = array.shape
+        self.dtype = array.dtype
+
+    def __getitem__(self, key: Any) -> Any:
+        return read_region(self.array, key, self.executor, self.cache, self.file)
+
+
+def _pad_chunk(array: zarr.Array, block: np.ndarray) -> np.ndarray:
+    """
+    Pad a block at the border of an array to the full chunk shape with the fill value.
+
+    Args:
+        array (zarr.Array): The array the block belongs to.
+        block (np.ndarray): The data of the chunk.
+
+    Returns:
+        np.ndarray: The C-contiguous chunk with the full chunk shape.
+    """
+
+    if block.shape == array.chunks:
+        return np.ascontiguousarray(block, dtype=array.dtype)
+    chunk = np.empty(array.chunks, dtype=array.dtype)
+    chunk.fill(0 if array.fill_value is None else array.fill_value)
+    chunk[tuple(slice(0, s) for s in block.shape)] = block
+    return chunk
+
+
+def _store_chunk(array: zarr.Array, key: str, future: Any, stats: Optional["profiling.IOStats"] = None) -> None:
+    """
+    Store an encoded chunk once its encoding is finished.
+
+    Args:
+        array (zarr.Array): The array the chunk belongs to.
+        key (str): The store key of the chunk.
+        future (Any): The future of the encoding.
+        stats (IOStats, optional): Records the encoding and the write, the future then returns the encoded chunk
+            along with the duration of the encoding, see `_encode_timed`. Defaults to None.
+    """
+
+    if stats is None:
+        array.chunk_store[key] = future.result()
+        return
+    cdata, seconds = future.result()
+    stats.add_encode(array.path, math.prod(array.chunks) * array.dtype.itemsize, _nbytes(cdata), seconds)
+    start = time.perf_counter()
+    array.chunk_store[key] = cdata
+    stats.add_store_write(array.path, time.perf_counter() - start)
+
+
+def _encode_timed(compressor: Any, chunk: np.ndarray) -> Tuple[Any, float]:
+    """
+    Encode a chunk and measure the duration, see `encode_chunk`.
+
+    Returns:
+        Tuple[Any, float]: The encoded chunk and the duration in seconds.
+    """
+
+    start = time.perf_counter()
+    cdata = encode_chunk(compressor, chunk)
+    return cdata, time.perf_counter() - start
+
+
+def _decode_timed(compressor: Any, cdata: Any, dtype: np.dtype, chunks: Tuple[int, ...]) -> Tuple[np.ndarray, float]:
+    """
+    Decode a chunk and measure the duration, see `decode_chunk`.
+
+    Returns:
+        Tuple[np.ndarray, float]: The decoded chunk and the duration in seconds.
+    """
+
+    start = time.perf_counter()
+    chunk = decode_chunk(compressor, cdata, dtype, chunks)
+    return chunk, time.perf_counter() - start
+
+
+def _submit(executor: Optional[Executor], func: Callable, *args) -> Future:
+    """
+    Submit a function to an executor or run it right away without one.
+
+    Args:
+        executor (Optional[Executor]): The executor.
+        func (Callable): The function.
+        *args: The arguments of the function.
+
+    Returns:
+        Future: The future of the result.
+    """
+
+    if executor is not None:
+        return executor.submit(func, *args)
+    future = Future()
+    future.set_result(func(*args))
+    return future
+
+
+def _nbytes(cdata: Any) -> int:
+    """
+    Get the number of bytes of an encoded chunk, which is bytes-like or an array for uncompressed chunks.
+    """
+
+    return cdata.nbytes if hasattr(cdata, "nbytes") else len(cdata)
@@ -0,0 +1,201 @@
+import numpy as np
+from typing import Optional, Tuple, Union, List, Iterable
+from mzarr.chunk_io import iter_chunks
+from mzarr.pyramid import _normalize_axis
+import math
+
+
+# Default number of bytes of a chunk of the base level
+DEFAULT_CHUNK_BYTES = 1024 ** 2
+# Chunks of coarser levels shrink with the level, but never below this size, as tiny chunks compress poorly
+MIN_CHUNK_BYTES = 64 * 1024
+# Edge length of the patches of the 'patch3d' access profile
+PATCH_SIZE = 128
+
+ACCESS_PROFILES = ("patch3d", "slice")
+
+
+def access_patch(
+        shape: Tuple[int, ...],
+        access: Union[str, Tuple[int, ...]],
+        channel_axis: Optional[int] = None
+) -> Tuple[int, ...]:
+    """
+    Get the shape of a typical read of an access profile.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the array.
+        access (Union[str, Tuple[int, ...]]): The access profile. Either 'patch3d' for cubic patches of 128
+            along every spatial axis, 'slice' for full 2D slices along the first spatial axis or an explicit
+            patch shape with or without the channel axis.
+        channel_axis (int, optional): The axis representing channels in the array. Defaults to None.
+
+    Returns:
+        Tuple[int, ...]: The patch shape including the channel axis, which always covers all channels.
+
+    Raises:
+        RuntimeError: If the access profile is unknown or the patch shape does not match the array.
+    """
+
+    ndim = len(shape)
+    channel_axis = _normalize_axis(channel_axis, ndim)
+    spatial = [axis for axis in range(ndim) if axis != channel_axis]
+    patch = list(shape)
+    if isinstance(access, str):
+        if access == "patch3d":
+            for axis in spatial:
+                patch[axis] = PATCH_SIZE
+        elif access == "slice":
+            patch[spatial[0]] = 1
+        else:
+            raise RuntimeError("Unknown access profile {}. Supported are {} or a patch shape.".format(access, ACCESS_PROFILES))
+    else:
+        access = tuple(int(size) for size in access)
+        if len(access) == len(spatial):
+            for axis, size in zip(spatial, access):
+                patch[axis] = size
+        elif len(access) == ndim:
+            patch = list(access)
+            if channel_axis is not None:
+                patch[channel_axis] = shape[channel_axis]
+        else:
+            raise RuntimeError("The patch shape {} does not match an array of shape {}.".format(access, shape))
+    return tuple(max(1, min(p, s)) for p, s in zip(patch, shape))
+
+
+def access_chunks(
+        shape: Tuple[int, ...],
+        itemsize: int,
+        patch: Tuple[int, ...],
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+        channel_axis: Optional[int] = None
+) -> Tuple[int, ...]:
+    """
+    Derive a chunk shape with the proportions of a patch shape and about the given number of bytes.
+
+    The patch is scaled uniformly along all axes until the chunk has the target size. Axes that would
+    exceed the array are clipped and the remaining bytes are distributed over the other axes.
+    The channel axis always covers all channels.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the array.
+        itemsize (int): The number of bytes of an element.
+        patch (Tuple[int, ...]): The shape of a typical read, see `access_patch`.
+        chunk_bytes (int, optional): The target number of bytes of a chunk. Defaults to 1 MiB.
+        channel_axis (int, optional): The axis representing channels in the array. Defaults to None.
+
+    Returns:
+        Tuple[int, ...]: The chunk shape.
+    """
+
+    ndim = len(shape)
+    channel_axis = _normalize_axis(channel_axis, ndim)
+    chunks = [float(p) for p in patch]
+    fixed = {channel_axis: shape[channel_axis]} if channel_axis is not None else {}
+    while True:
+        free = [axis for axis in range(ndim) if axis not in fixed]
+        if not free:
+            break
+        budget = chunk_bytes / itemsize / math.prod(fixed.values())
+        scale = (budget / math.prod(chunks[axis] for axis in free)) ** (1 / len(free))
+        clipped = False
+        for axis in free:
+            size = chunks[axis] * scale
+            if size >= shape[axis] or size <= 1:
+                fixed[axis] = min(max(size, 1), shape[axis])
+                clipped = True
+        if not clipped:
+            for axis in free:
+                fixed[axis] = chunks[axis] * scale
+            break
+    return tuple(max(1, min(int(round(fixed[axis])), shape[axis])) for axis in range(ndim))
+
+
+def pyramid_chunks(
+        shapes: List[Tuple[int, ...]],
+        itemsize: int,
+        access: Union[str, Tuple[int, ...]],
+        chunk_bytes: Optional[int] = None,
+        channel_axis: Optional[int] = None
+) -> List[Tuple[int, ...]]:
+    """
+    Derive the chunk shapes of all pyramid levels from an access profile.
+
+    A region read from a coarser level is downscaled by 2 along every spatial axis per level, so the patch
+    and the chunks of each level are downscaled proportionally. A read then touches about the same number
+    of chunks on every level. The chunks do not shrink below 64 KiB (or the level itself).
+
+    Args:
+        shapes (List[Tuple[int, ...]]): The shapes of all pyramid levels.
+        itemsize (int): The number of bytes of an element.
+        access (Union[str, Tuple[int, ...]]): The access profile, see `access_patch`.
+        chunk_bytes (int, optional): The target number of bytes of a chunk of the base level. Defaults to 1 MiB.
+        channel_axis (int, optional): The axis representing channels in the array. Defaults to None.
+
+    Returns:
+        List[Tuple[int, ...]]: The chunk shape of every pyramid level.
+    """
+
+    if chunk_bytes is None:
+        chunk_bytes = DEFAULT_CHUNK_BYTES
+    ndim = len(shapes[0])
+    channel_axis = _normalize_axis(channel_axis, ndim)
+    num_spatial = ndim if channel_axis is None else ndim - 1
+    patch = access_patch(shapes[0], access, channel_axis)
+    level_chunks = []
+    for p, shape in enumerate(shapes):
+        level_patch = tuple(size if axis == channel_axis else max(1, size // 2 ** p) for axis, size in enumerate(patch))
+        level_bytes = max(chunk_bytes / 2 ** (p * num_spatial), min(MIN_CHUNK_BYTES, chunk_bytes))
+        level_chunks.append(access_chunks(shape, itemsize, level_patch, level_bytes, channel_axis))
+    return level_chunks
+
+
+def chunks_touched(shape: Tuple[int, ...], chunks: Tuple[int, ...], regions: Iterable[Tuple[slice, ...]]) -> dict:
+    """
+    Count the chunks that reads of the given regions touch.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the array.
+        chunks (Tuple[int, ...]): The chunk shape of the array.
+        regions (Iterable[Tuple[slice, ...]]): The regions that are read.
+
+    Returns:
+        dict: The mean number of chunks per read and the mean read amplification, i.e. the number of decoded
+            elements relative to the number of requested elements.
+    """
+
+    reads, touched, amplification = 0, 0, 0.0
+    for region in regions:
+        count = sum(1 for _ in iter_chunks(shape, chunks, region))
+        requested = math.prod(len(range(*key.indices(size))) for key, size in zip(region, shape))
+        reads += 1
+        touched += count
+        amplification += count * math.prod(chunks) / max(requested, 1)
+    return {"chunks_per_read": touched / max(reads, 1), "amplification": amplification / max(reads, 1)}
+
+
+def random_regions(
+        shape: Tuple[int, ...],
+        patch: Tuple[int, ...],
+        count: int,
+        seed: int = 0
+) -> List[Tuple[slice, ...]]:
+    """
+    Draw regions of the patch shape at random positions within an array.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the array.
+        patch (Tuple[int, ...]): The shape of the regions.
+        count (int): The number of regions.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+
+    Returns:
+        List[Tuple[slice, ...]]: The regions.
+    """
+
+    rng = np.random.default_rng(seed)
+    regions = []
+    for _ in range(count):
+        starts = [int(rng.integers(0, s - p + 1)) for s, p in zip(shape, patch)]
+        regions.append(tuple(slice(start, start + p) for start, p in zip(starts, patch)))
+    return regions
@@ -1,24 +1,51 @@
 import numpy as np
 import zarr
-from zarr.util import guess_chunks, normalize_dtype
+from scipy import ndimage
+from zarr.util import guess_chunks, normalize_dtype, normalize_chunks
 from skimage.transform import pyramid_gaussian
 from imagecodecs.numcodecs import JpegXl
-from typing import Optional, List, Union, Literal, Any
+from typing import Optional, List, Union, Literal, Any, Tuple, Iterable, Callable, AsyncIterator
 import os
+import math
+import shutil
+import tempfile
+import itertools
+import threading
+import json
+import zipfile
 import numcodecs
 from pathlib import Path
+from concurrent.futures import Executor, ThreadPoolExecutor
+from mzarr.pyramid import BLOCK_TYPES, _normalize_axis, downsample, level_shape, level_coordinates, source_rows, target_rows, pyramid_region, RowWindow
+from zarr.indexing import BasicIndexer
+from mzarr.chunk_io import write_chunks, read_region, iter_chunks, ChunkReader
+from mzarr.cache import ChunkCache, chunk_key
+from mzarr.tuning import tune, sample_array
+from mzarr.chunking import pyramid_chunks, access_patch
+from mzarr.storage import ShardedStore, ignore_duplicate_names, compact_zip, stale_bytes, consolidate, read_consolidated, open_store, detect_layout, CONSOLIDATED_KEY, COMPACT_STALE_FRACTION
+from mzarr.stats import ChunkStats, compute_stats, chunked_range, finite_range
+from mzarr.aio import AsyncChunkReader, tile_regions
+from mzarr.profiling import phase, active
 
 
 numcodecs.register_codec(JpegXl)
 
 class Mzarr:
-    def __init__(self, store: Union[np.ndarray, str], mode: Literal['r', 'r+', 'a', 'w', 'w-'] = 'a') -> None:
+    def __init__(
+            self,
+            store: Union[np.ndarray, zarr.Array, str],
+            mode: Literal['r', 'r+', 'a', 'w', 'w-'] = 'a',
+            workers: Optional[Union[int, Executor]] = None,
+            cache: Optional[ChunkCache] = None,
+            auto_flush: bool = False
+    ) -> None:
         """
         Initialize the Mzarr instance.
 
         Args:
-            store (Union[np.ndarray, str]): The array to be handled by the instance, or the
-                path to a Mzarr file to be loaded.
+            store (Union[np.ndarray, zarr.Array, str]): The array to be handled by the instance, or the
+                path to a Mzarr file to be loaded. Memory-mapped and zarr arrays are not loaded
+                into memory and are saved chunk by chunk.
             mode (Literal['r', 'r+', 'a', 'w', 'w-'], optional): The mode in which to open
                 the Mzarr file. This is only used if `store` is a path.
                 'r' means read only (must exist);
@@ -27,11 +54,33 @@ class Mzarr:
                 'w' means create (overwrite if exists);
                 'w-' means create (fail if exists).
                 Defaults to 'a'.
+            workers (Union[int, Executor], optional): The number of threads used to encode and decode chunks,
+                or an existing thread or process pool. JpegXl releases the GIL, so threads scale with the number
+                of cores. Defaults to None, which encodes and decodes in the calling thread.
+            cache (ChunkCache, optional): A cache of decoded chunks, which can be shared between Mzarr instances.
+                Repeated reads of the same chunks are then served from the cache. Defaults to None.
+            auto_flush (bool, optional): Whether to update the coarser pyramid levels after every write to the base
+                level. Defaults to False, which updates them on `flush` or `close`.
+
+        A Mzarr instance of a file can be read from many threads at once. It can also be pickled cheaply, e.g. into
+        the worker processes of a PyTorch DataLoader: Only the path and the settings are pickled and the file is
+        reopened lazily on first access in the new process. A file opened with mode 'r' is memory-mapped,
+        so threads fetch chunks without a lock, see `MmapZipStore`.
         """
 
         self.path = None
-        self.store = None
-        self.array = None
+        self._mode = mode
+        self._store = None
+        self._array = None
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        self.levels = None
+        self.workers = workers
+        self._pool = None
+        self.cache = cache
+        self.auto_flush = auto_flush
+        self._dirty = []
+        self._async_reader = None
 
         if isinstance(store, str) or isinstance(store, Path):
             self.load(store, mode)
@@ -41,19 +90,150 @@ class Mzarr:
             else:
                 raise RuntimeError("Currently only the dtypes 'uint8', 'uint16', 'float16', 'float32' are supported. Dtype {} is not supported".format(store.dtype))
 
-    def load(self, path: str, mode: Literal['r', 'r+', 'a', 'a'] = 'a') -> None:
+    def load(self, path: str, mode: Literal['r', 'r+', 'a', 'a'] = 'a', workers: Optional[Union[int, Executor]] = None) -> None:
         """
         Load the Mzarr instance from a file on disk.
 
+        The storage layout ('zip', 'directory' or 'sharded', see `save`) is detected automatically. In read-only mode
+        ('r') zip and sharded files are memory-mapped, see `MmapZipStore` and `ShardedStore`, and the metadata of all
+        levels is read from the consolidated metadata written by `save`.
+
         Args:
             path (str): The path to the Mzarr file to load.
             mode (Literal['r', 'r+', 'a', 'a'], optional): The mode in which to open the Mzarr file.
                 Defaults to 'a'.
+            workers (Union[int, Executor], optional): The number of threads or a pool used to decode chunks.
+                Defaults to None, which keeps the workers passed on initialization.
         """
 
+        if workers is not None:
+            self._set_workers(workers)
         self.path = path
-        self.store = zarr.open(zarr.ZipStore(path, mode=mode), mode=mode)
-        self.array = self.store["base"]
+        self._mode = mode
+        self._pid = os.getpid()
+        # Read-only files are memory-mapped, so chunks are read without copies and without the lock of the ZipStore
+        store = open_store(path, mode)
+        if mode == 'r' and CONSOLIDATED_KEY in store:
+            self._store = zarr.open_consolidated(store, mode=mode)
+        else:
+            self._store = zarr.open(store, mode=mode)
+        self._array = self._store["base"]
+        self.levels = {0: self._array}
+        self._async_reader = None
+
+    @property
+    def store(self) -> Optional[zarr.Group]:
+        """
+        The root group of the Mzarr file. The file is reopened if the instance was unpickled or forked into another process.
+        """
+
+        self._reopen()
+        return self._store
+
+    @store.setter
+    def store(self, store: Optional[zarr.Group]) -> None:
+        self._store = store
+
+    @property
+    def array(self) -> Any:
+        """
+        The base array. The file is reopened if the instance was unpickled or forked into another process.
+        """
+
+        self._reopen()
+        return self._array
+
+    @array.setter
+    def array(self, array: Any) -> None:
+        self._array = array
+
+    def _reopen(self) -> None:
+        """
+        Open the file of the Mzarr instance if it was unpickled and not opened yet, or if the instance was forked
+        into another process, as the file handle of the parent process must not be shared.
+        """
+
+        if self.path is None or (self._store is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._store is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # The threads of the pool do not exist in the forked process
+                self._pool = None
+            self.load(self.path, self._reopen_mode())
+
+    def _reopen_mode(self) -> str:
+        """
+        Get the mode in which the file of the Mzarr instance is opened again.
+
+        Returns:
+            str: The mode. A file that was created by the instance is opened with 'a', so it is not created again.
+        """
+
+        return 'a' if self._mode in ('w', 'w-') else self._mode
+
+    def __getstate__(self) -> dict:
+        """
+        Get the state of the Mzarr instance for pickling. For a file, only the path and the settings are pickled.
+
+        Returns:
+            dict: The state of the Mzarr instance.
+        """
+
+        state = {
+            "path": self.path,
+            "mode": self._mode,
+            "workers": None if isinstance(self.workers, Executor) else self.workers,
+            "cache": self.cache,
+            "auto_flush": self.auto_flush,
+        }
+        if self.path is None:
+            state["array"] = self._array
+            state["store"] = self._store
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restore the Mzarr instance from a pickled state. A file is reopened lazily on first access.
+
+        Args:
+            state (dict): The state of the Mzarr instance.
+        """
+
+        self.path = state["path"]
+        self._mode = state["mode"]
+        self._store = state.get("store")
+        self._array = state.get("array")
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        self.levels = {0: self._array} if self._array is not None else None
+        self.workers = state["workers"]
+        self._pool = None
+        self.cache = state["cache"]
+        self.auto_flush = state["auto_flush"]
+        self._dirty = []
+        self._async_reader = None
+
+    @classmethod
+    def from_slabs(cls, slabs: Iterable[np.ndarray], shape: Tuple[int, ...], dtype: Any) -> "Mzarr":
+        """
+        Create a Mzarr instance from an iterator of slabs that are only read while saving.
+
+        The slabs are consecutive blocks along the first axis of the array, e.g. one or more slices of a
+        z-stack. They can have arbitrary thickness, but together need to cover the given shape exactly.
+        As the slabs are consumed once, the instance can only be saved (with streaming) and not be indexed.
+
+        Args:
+            slabs (Iterable[np.ndarray]): The slabs along the first axis.
+            shape (Tuple[int, ...]): The shape of the full array.
+            dtype (Any): The dtype of the full array.
+
+        Returns:
+            Mzarr: The Mzarr instance.
+        """
+
+        return cls(SlabSource(slabs, shape, dtype))
 
     def save(
             self,
@@ -62,51 +242,726 @@ class Mzarr:
             num_pyramids: int = 4,
             channel_axis: Optional[int] = None,
             is_seg: bool = False,
-            type: Literal['subsampled', 'gaussian'] = "subsampled",
+            type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'] = "subsampled",
             lossless: bool = True,
             chunks: bool = True,
             mode: Literal['r+', 'a', 'w', 'w-'] = 'a',
-            overwrite: bool = True
+            overwrite: bool = True,
+            streaming: Optional[bool] = None,
+            workers: Optional[Union[int, Executor]] = None,
+            compression: Optional[Union[Literal['auto', 'raw'], dict, List[Optional[dict]]]] = None,
+            compression_target: Optional[dict] = None,
+            access: Optional[Union[Literal['patch3d', 'slice'], Tuple[int, ...]]] = None,
+            chunk_bytes: Optional[int] = None,
+            statistics: bool = True,
+            layout: Literal['zip', 'directory', 'sharded'] = "zip"
     ) -> None:
         """
         Save the Mzarr instance to a file on disk. This includes creating a pyramid of images,
         and writing the pyramid along with metadata to disk.
 
+        With streaming, the base level is written chunk by chunk and every coarser level is computed
+        chunk by chunk from the finished level before it. The peak memory is then bounded by a few chunks
+        instead of the full pyramid, which allows saving arrays that do not fit into memory.
+
+        With `compression='auto'`, the codec of every level is selected by benchmarking candidate JpegXl, Blosc,
+        Zstd and LZ4 settings on a sample of the level, see `mzarr.tuning`. The base level stays lossless if
+        `lossless` is set, while the coarser levels may use lossy JpegXl that is at least as accurate as the default.
+        The codec settings of every level are recorded in the 'compression' attribute of the file.
+
         Args:
             path (str): The path to save the Mzarr file to.
             attrs (dict, optional): Additional attributes to be saved in the Mzarr file. Defaults to None.
             num_pyramids (int, optional): The number of pyramid levels to create. Defaults to 4.
             channel_axis (int, optional): The axis of the array representing channels. Defaults to None.
             is_seg (bool, optional): Whether the array represents a segmentation mask. Defaults to False.
-            type (str, optional): The type of pyramid to create ("gaussian" or "subsampled"). Defaults to "subsampled".
+            type (str, optional): The type of pyramid to create ("gaussian", "subsampled", "mode", "mean" or "max").
+                "mode" takes the majority vote of every 2x2(x2) block, which keeps labels of segmentation masks
+                more faithfully than subsampling, "mean" and "max" reduce the blocks of intensity images.
+                Defaults to "subsampled".
             lossless (bool, optional): Whether to use lossless compression. Defaults to True.
-            chunks (bool, optional): Whether to use chunked storage. Defaults to True.
+            chunks (Union[bool, Tuple[int, ...]], optional): Whether to use chunked storage, or the chunk shape. Defaults to True.
             mode (Literal['r+', 'a', 'w', 'w-'], optional): The mode in which to open the Mzarr file. Defaults to 'a'.
             overwrite (bool, optional): Whether to overwrite an existing file at the same path. Defaults to True.
+            streaming (bool, optional): Whether to save the array chunk by chunk. Defaults to None, which
+                streams every array that is not a regular in-memory NumPy array (e.g. memory-mapped arrays,
+                zarr arrays and slabs).
+            workers (Union[int, Executor], optional): The number of threads or a pool used to encode chunks.
+                The saved chunks are byte-identical to the serial path. Defaults to None, which keeps the workers
+                passed on initialization.
+            compression (Union[str, dict, List[dict]], optional): The codecs of the pyramid levels. Either 'auto',
+                'raw' for uncompressed chunks, a numcodecs config used for all levels or a list with one config
+                (or None for uncompressed chunks) per level. Uncompressed chunks of files opened with mode 'r' are
+                read without any copy. Defaults to None, which uses JpegXl for all levels (lossless for the base
+                level if `lossless` is set, lossy otherwise).
+            compression_target (dict, optional): The target of the 'auto' compression with the optional keys
+                'min_decode_mbps', 'min_encode_mbps' and 'min_ratio', e.g. {"min_decode_mbps": 200}. Among the codecs
+                that meet the target the one with the highest compression ratio is selected. Defaults to None,
+                which selects the codec with the highest compression ratio.
+            access (Union[str, Tuple[int, ...]], optional): How the file will be read, used to derive the chunk shape of
+                every pyramid level. Either 'patch3d' for cubic patches of 128 along every spatial axis, 'slice'
+                for 2D slices along the first spatial axis or an explicit patch shape. The chunks of coarser levels
+                shrink proportionally, so a read touches about the same number of chunks on every level.
+                Defaults to None, which uses `chunks`.
+            chunk_bytes (int, optional): The target number of bytes of a chunk of the base level for `access`.
+                Defaults to None, which uses 1 MiB.
+            statistics (bool, optional): Whether to store an index of statistics of every chunk of the base level,
+                which is computed while the chunks are written, see `statistics`. Defaults to True.
+            layout (Literal['zip', 'directory', 'sharded'], optional): The storage layout. 'zip' writes a single zip
+                file, which can only be appended to. 'directory' writes a directory with one file per chunk, which
+                are updated in place and can be written by parallel writers. 'sharded' packs blocks of chunks into
+                shard files with an index, which keeps the number of files small, see `ShardedStore`. Use `repack` to
+                convert a file to another layout. Defaults to "zip".
         """
 
-        pyramid = self._create_pyramid(self.array, num_pyramids, channel_axis, is_seg, type)
-        self._save(path, attrs, pyramid, type, is_seg, lossless, chunks, channel_axis, mode, overwrite)
+        if workers is not None:
+            self._set_workers(workers)
+        self._dirty = []
+        if self.cache is not None:
+            self.cache.invalidate(os.path.abspath(path))
+        if streaming is None:
+            streaming = self.array.__class__ is not np.ndarray
+        if access is not None and chunks is not None and chunks is not True:
+            raise RuntimeError("The chunks cannot be given together with an access profile.")
+        if streaming:
+            self._save_streaming(path, attrs, num_pyramids, type, is_seg, lossless, chunks, channel_axis, mode, overwrite, compression, compression_target, access, chunk_bytes, statistics, layout)
+        else:
+            if isinstance(self.array, SlabSource):
+                raise RuntimeError("A Mzarr instance created from slabs can only be saved with streaming.")
+            with phase("create_pyramid"):
+                pyramid = self._create_pyramid(self.array, num_pyramids, channel_axis, is_seg, type)
+            self._save(path, attrs, pyramid, type, is_seg, lossless, chunks, channel_axis, mode, overwrite, compression, compression_target, access, chunk_bytes, statistics, layout)
 
-    def numpy(self) -> np.ndarray:
+    def numpy(self, level: int = 0) -> np.ndarray:
         """
         Get a NumPy array representation of the Mzarr instance.
 
-        This method returns a copy of the base array of the Mzarr instance as a NumPy array.
+        This method returns a copy of the base array (or of the given pyramid level) of the
+        Mzarr instance as a NumPy array.
+
+        Args:
+            level (int, optional): The pyramid level to return. Level 0 is the base resolution. Defaults to 0.
 
         Returns:
             np.ndarray: The NumPy array representation of the Mzarr instance.
         """
-        return np.array(self.array)
+        return np.array(self._read(self.level(level), Ellipsis))
+
+    def num_levels(self) -> int:
+        """
+        Get the number of pyramid levels including the base level.
+
+        Returns:
+            int: The number of pyramid levels.
+        """
+
+        if self.store is None or "multiscale" not in self.store.attrs:
+            return 1
+        return len(self.store.attrs["multiscale"]["datasets"])
+
+    def level(self, level: int) -> Union[np.ndarray, zarr.Array]:
+        """
+        Get the array of a pyramid level. Level 0 is the base resolution, each subsequent level is
+        downscaled by a factor of 2 along every spatial axis.
+
+        The returned array is not decoded, so it can be sliced like the base array without reading
+        the full level into memory.
+
+        Args:
+            level (int): The pyramid level. Negative values index from the coarsest level.
+
+        Returns:
+            Union[np.ndarray, zarr.Array]: The array of the pyramid level.
+
+        Raises:
+            RuntimeError: If the pyramid level does not exist.
+        """
+
+        num_levels = self.num_levels()
+        if level < 0:
+            level += num_levels
+        if level == 0:
+            return self.array
+        if level < 0 or level >= num_levels:
+            raise RuntimeError("Pyramid level {} does not exist. The Mzarr instance has {} levels.".format(level, num_levels))
+        if level not in self.levels:
+            self.levels[level] = self.store[self.store.attrs["multiscale"]["datasets"][level]["path"]]
+        return self.levels[level]
+
+    def level_scale(self, level: int) -> Tuple[int, ...]:
+        """
+        Get the downscale factor of a pyramid level with respect to the base resolution for every axis.
+
+        A coordinate c in the pyramid level corresponds to the coordinate c * scale in the base resolution.
+
+        Args:
+            level (int): The pyramid level. Negative values index from the coarsest level.
+
+        Returns:
+            Tuple[int, ...]: The downscale factor for every axis. The channel axis always has a factor of 1.
+        """
+
+        if level < 0:
+            level += self.num_levels()
+        ndim = len(self.array.shape)
+        channel_axis = _normalize_axis(None if self.store is None else self.store.attrs.get("channel_axis"), ndim)
+        return tuple(1 if axis == channel_axis else 2 ** level for axis in range(ndim))
+
+    def select_level(
+            self,
+            roi: Any = Ellipsis,
+            target_shape: Optional[Tuple[Optional[int], ...]] = None,
+            max_bytes: Optional[int] = None
+    ) -> int:
+        """
+        Select the coarsest pyramid level that satisfies the given requirements.
+
+        Args:
+            roi (Any, optional): The region of interest in base resolution coordinates. Defaults to the full array.
+            target_shape (Tuple[Optional[int], ...], optional): The minimal shape the region of interest needs to have
+                in the selected level. Axes set to None are ignored. Defaults to None.
+            max_bytes (int, optional): The maximal number of bytes the region of interest is allowed to have in the
+                selected level. If no level is small enough the coarsest level is selected. Defaults to None.
+
+        Returns:
+            int: The selected pyramid level.
+        """
+
+        num_levels = self.num_levels()
+        level = 0
+        if target_shape is not None:
+            for candidate in range(num_levels):
+                shape = self._roi_shape(roi, candidate)
+                if all(t is None or s >= t for s, t in zip(shape, target_shape)):
+                    level = candidate
+                else:
+                    break
+        if max_bytes is not None:
+            itemsize = np.dtype(self.array.dtype).itemsize
+            for candidate in range(level, num_levels):
+                level = candidate
+                if math.prod(self._roi_shape(roi, candidate)) * itemsize <= max_bytes:
+                    break
+        return level
+
+    def read(
+            self,
+            roi: Any = Ellipsis,
+            level: Optional[int] = None,
+            target_shape: Optional[Tuple[Optional[int], ...]] = None,
+            max_bytes: Optional[int] = None,
+            spacing: Optional[Union[float, Tuple[float, ...]]] = None,
+            base_spacing: Optional[Tuple[float, ...]] = None
+    ) -> np.ndarray:
+        """
+        Read a region of interest from a pyramid level.
+
+        The region of interest is given in base resolution coordinates and is mapped to the coordinates of the
+        pyramid level, so the same region can be read from any level. A coordinate c in the returned array
+        corresponds to the base resolution coordinate start + c * ceil(step / scale) * scale, where start is roi_start
+        rounded down to a multiple of scale, see `level_scale`. A step that is not a multiple of the scale is thus
+        rounded up to the next multiple, so a level is never sampled more densely than requested.
+        If no level is given, the level is selected with `select_level` based on `target_shape` and `max_bytes`.
+
+        If a spacing is given, the region of interest is resampled to that spacing instead: The coarsest pyramid
+        level that is still at least as fine as the target spacing is selected, only the chunks covering the region
+        of interest are decoded and just that region is resampled (linearly, or with nearest neighbor interpolation
+        for segmentation masks). The result covers the same physical extent as the region of interest.
+
+        Args:
+            roi (Any, optional): The index or slice in base resolution coordinates. Defaults to the full array.
+            level (int, optional): The pyramid level to read from. Defaults to None.
+            target_shape (Tuple[Optional[int], ...], optional): See `select_level`. Defaults to None.
+            max_bytes (int, optional): See `select_level`. Defaults to None.
+            spacing (Union[float, Tuple[float, ...]], optional): The target spacing of the spatial axes in the order
+                of the array axes, or a single value for all spatial axes. Defaults to None.
+            base_spacing (Tuple[float, ...], optional): The spacing of the spatial axes of the base level in the
+                order of the array axes. Defaults to None, which uses `spacing()`.
+
+        Returns:
+            np.ndarray: The region of interest from the pyramid level.
+        """
+
+        if spacing is not None:
+            return self._read_spacing(roi, spacing, base_spacing, level)
+        if level is None:
+            level = self.select_level(roi, target_shape, max_bytes)
+        return self._read(self.level(level), self._map_roi(roi, level))
+
+    def spacing(self) -> Optional[Tuple[float, ...]]:
+        """
+        Get the spacing of the spatial axes of the base level in the order of the array axes.
+
+        The spacing is taken from the 'spacing' entry of the attributes passed to `save`. Like `nifti2mzarr` stores
+        it, the entry is expected in the (x, y, z) order of SimpleITK, which is the reverse of the array axes.
+
+        Returns:
+            Optional[Tuple[float, ...]]: The spacing or None if the file has no spacing.
+        """
+
+        return self._attrs_spacing(self.store.attrs.get("attrs") if self.store is not None else None)
+
+    @staticmethod
+    def _attrs_spacing(attrs: Optional[dict]) -> Optional[Tuple[float, ...]]:
+        """
+        Get the spacing in the order of the array axes from the additional attributes of a file, see `spacing`.
+
+        Args:
+            attrs (Optional[dict]): The additional attributes passed to `save`.
+
+        Returns:
+            Optional[Tuple[float, ...]]: The spacing or None if the attributes have no spacing.
+        """
+
+        if not isinstance(attrs, dict) or attrs.get("spacing") is None:
+            return None
+        return tuple(float(s) for s in reversed(attrs["spacing"]))
+
+    @staticmethod
+    def inspect(path: str) -> dict:
+        """
+        Read the shape, dtype, levels, spacing and chunking of a Mzarr file without opening it.
+
+        The consolidated metadata written by `save` is read with a single read from the end of the file, see
+        `read_consolidated`. For files without consolidated metadata, the metadata members are read from the zip file
+        or the files of the directory layouts.
+
+        Args:
+            path (str): The path to the Mzarr file.
+
+        Returns:
+            dict: The 'path', 'layout', 'shape', 'dtype', 'chunks', 'num_levels', 'spacing' (in the order of the array
+                axes), 'channel_axis', 'seg', 'type' and additional 'attrs' of the file, and the 'path', 'shape',
+                'chunks' and 'compressor' of every pyramid level in 'levels'.
+        """
+
+        layout = detect_layout(path)
+        metadata = read_consolidated(path)
+        if metadata is None and layout == "zip":
+            with zipfile.ZipFile(path) as zf:
+                metadata = Mzarr._read_metadata(zf.read, set(zf.namelist()))
+        elif metadata is None:
+            # Both directory layouts store the metadata as plain files
+            store = zarr.DirectoryStore(path)
+            metadata = Mzarr._read_metadata(store.__getitem__, store)
+        attrs = metadata.get(".zattrs", {})
+        datasets = attrs.get("multiscale", {}).get("datasets", [{"path": "base"}])
+        levels = []
+        for dataset in datasets:
+            array = metadata["{}/.zarray".format(dataset["path"])]
+            levels.append({"path": dataset["path"], "shape": tuple(array["shape"]), "chunks": tuple(array["chunks"]), "compressor": array["compressor"]})
+        base = metadata["base/.zarray"]
+        return {
+            "path": path,
+            "layout": layout,
+            "shape": tuple(base["shape"]),
+            "dtype": str(np.dtype(base["dtype"])),
+            "chunks": tuple(base["chunks"]),
+            "num_levels": len(levels),
+            "spacing": Mzarr._attrs_spacing(attrs.get("attrs")),
+            "channel_axis": attrs.get("channel_axis"),
+            "seg": attrs.get("seg"),
+            "type": attrs.get("multiscale", {}).get("type"),
+            "attrs": attrs.get("attrs"),
+            "levels": levels,
+        }
+
+    @staticmethod
+    def _read_metadata(read: Callable[[str], bytes], keys: Any) -> dict:
+        """
+        Read the metadata of the root group and of all pyramid levels of a file without consolidated metadata.
+
+        Args:
+            read (Callable[[str], bytes]): Reads a member of the file.
+            keys (Any): The keys of the file, which support `in`.
+
+        Returns:
+            dict: The metadata keyed by the metadata key like the consolidated metadata, see `read_consolidated`.
+        """
+
+        metadata = {".zattrs": json.loads(read(".zattrs")) if ".zattrs" in keys else {}}
+        for dataset in metadata[".zattrs"].get("multiscale", {}).get("datasets", [{"path": "base"}]):
+            key = "{}/.zarray".format(dataset["path"])
+            metadata[key] = json.loads(read(key))
+        return metadata
+
+    @staticmethod
+    def inspect_many(paths: Iterable[str], workers: Optional[Union[int, Executor]] = None) -> List[dict]:
+        """
+        Inspect many Mzarr files, e.g. to fingerprint a dataset, see `inspect`.
+
+        Args:
+            paths (Iterable[str]): The paths to the Mzarr files.
+            workers (Union[int, Executor], optional): The number of threads or a pool used to read the files in
+                parallel, which helps on network file systems. Defaults to None.
+
+        Returns:
+            List[dict]: The result of `inspect` for every file in the order of the paths.
+        """
+
+        if workers is None:
+            return [Mzarr.inspect(path) for path in paths]
+        if isinstance(workers, Executor):
+            return list(workers.map(Mzarr.inspect, paths))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(Mzarr.inspect, paths))
+
+    @staticmethod
+    def repack(
+            path: str,
+            out_path: Optional[str] = None,
+            layout: Literal['zip', 'directory', 'sharded'] = "sharded",
+            overwrite: bool = True,
+            workers: Optional[Union[int, Executor]] = None
+    ) -> str:
+        """
+        Convert a Mzarr file to another storage layout without decoding or encoding any chunk.
+
+        All chunks and metadata are copied as they are, so every pyramid level of the converted file is identical
+        to the original, and the consolidated metadata is written last. Stale copies of chunks (see `flush`) are not
+        copied, so repacking a file into its own layout compacts it.
+
+        Args:
+            path (str): The path to the Mzarr file. The file must not be open for writing.
+            out_path (str, optional): The path of the converted file. Defaults to None, which replaces the file at
+                `path` once it is converted.
+            layout (Literal['zip', 'directory', 'sharded'], optional): The storage layout of the converted file, see
+                `save`. Defaults to "sharded".
+            overwrite (bool, optional): Whether to overwrite an existing file at `out_path`. Defaults to True.
+            workers (Union[int, Executor], optional): The number of threads or a thread pool used to copy the chunks.
+                The directory layouts are written in parallel. Defaults to None, which copies in the calling thread.
+
+        Returns:
+            str: The path of the converted file.
+
+        Raises:
+            RuntimeError: If a file already exists at `out_path` and 'overwrite' is set to False.
+        """
+
+        target = out_path if out_path is not None else path + ".repack"
+        Mzarr._prepare_path(target, overwrite or out_path is None)
+        source = open_store(path, 'r')
+        try:
+            destination = open_store(target, 'w', layout)
+            try:
+                keys = [key for key in source.keys() if key != CONSOLIDATED_KEY]
+
+                def copy(key: str) -> None:
+                    destination[key] = source[key]
+
+                if workers is None:
+                    for key in keys:
+                        copy(key)
+                elif isinstance(workers, Executor):
+                    list(workers.map(copy, keys))
+                else:
+                    with ThreadPoolExecutor(max_workers=workers) as executor:
+                        list(executor.map(copy, keys))
+                consolidate(destination)
+            finally:
+                destination.close()
+        finally:
+            source.close()
+        if out_path is not None:
+            return out_path
+        # Swap the files by renaming, which works for files and directories alike
+        previous_path = path + ".previous"
+        os.replace(path, previous_path)
+        os.replace(target, path)
+        if os.path.isdir(previous_path):
+            shutil.rmtree(previous_path)
+        else:
+            os.remove(previous_path)
+        return path
+
+    def _read_spacing(
+            self,
+            roi: Any,
+            spacing: Union[float, Tuple[float, ...]],
+            base_spacing: Optional[Tuple[float, ...]],
+            level: Optional[int]
+    ) -> np.ndarray:
+        """
+        Read a region of interest resampled to a target spacing, see `read`.
+
+        Args:
+            roi (Any): The index or slice in base resolution coordinates.
+            spacing (Union[float, Tuple[float, ...]]): The target spacing of the spatial axes.
+            base_spacing (Optional[Tuple[float, ...]]): The spacing of the spatial axes of the base level.
+            level (Optional[int]): The pyramid level to resample from. Defaults to the level selected by the spacing.
+
+        Returns:
+            np.ndarray: The resampled region of interest.
+
+        Raises:
+            RuntimeError: If the spacing is unknown or does not match the array, or the region of interest uses
+                unsupported indexing.
+        """
+
+        shape = self.array.shape
+        channel_axis = _normalize_axis(None if self.store is None else self.store.attrs.get("channel_axis"), len(shape))
+        spatial = [axis for axis in range(len(shape)) if axis != channel_axis]
+        if base_spacing is None:
+            base_spacing = self.spacing()
+        if base_spacing is None:
+            raise RuntimeError("The Mzarr file has no spacing. Pass the base_spacing explicitly.")
+        if np.isscalar(spacing):
+            spacing = (spacing,) * len(spatial)
+        if len(base_spacing) != len(spatial) or len(spacing) != len(spatial):
+            raise RuntimeError("The spacing needs one value per spatial axis ({}). Got {} and base spacing {}.".format(len(spatial), spacing, base_spacing))
+
+        roi = self._normalize_roi(roi)
+        squeeze = tuple(axis for axis, key in enumerate(roi) if not isinstance(key, slice))
+        roi = tuple(slice(int(key % size), int(key % size) + 1) if axis in squeeze else key for axis, (key, size) in enumerate(zip(roi, shape)))
+        if any(key.indices(size)[2] != 1 for key, size in zip(roi, shape)):
+            raise RuntimeError("Slice steps are not supported when reading with a spacing.")
+
+        if level is None:
+            level = 0
+            for candidate in range(1, self.num_levels()):
+                scale = self.level_scale(candidate)
+                if all(base_spacing[i] * scale[axis] <= spacing[i] * (1 + 1e-6) for i, axis in enumerate(spatial)):
+                    level = candidate
+        elif level < 0:
+            level += self.num_levels()
+        pyramid_type = self.store.attrs["multiscale"]["type"] if level > 0 else "subsampled"
+        scale = self.level_scale(level)
+        level_shape = self.level(level).shape
+
+        region, coords = [], []
+        for axis, (key, size) in enumerate(zip(roi, shape)):
+            start, stop, _ = key.indices(size)
+            stop = max(start, stop)
+            if axis == channel_axis:
+                region.append(slice(start, stop))
+                coords.append(np.arange(stop - start, dtype=np.float64))
+                continue
+            i = spatial.index(axis)
+            out_size = max(1, int(round((stop - start) * base_spacing[i] / spacing[i])))
+            # The output elements are evenly spread over the extent of the region of interest in base coordinates
+            base_coords = start - 0.5 + (np.arange(out_size) + 0.5) * (stop - start) / out_size
+            level_coords = level_coordinates(base_coords, scale[axis], pyramid_type)
+            lo = min(max(0, int(math.floor(level_coords.min())) - 1), level_shape[axis] - 1)
+            hi = max(min(level_shape[axis], int(math.ceil(level_coords.max())) + 2), lo + 1)
+            region.append(slice(lo, hi))
+            coords.append(level_coords - lo)
+
+        data = np.asarray(self._read(self.level(level), tuple(region)))
+        is_seg = bool(self.store.attrs.get("seg", False))
+        if is_seg:
+            result = ndimage.map_coordinates(data, np.meshgrid(*coords, indexing="ij"), order=0, mode="nearest")
+        else:
+            result = ndimage.map_coordinates(data.astype(np.float32, copy=False), np.meshgrid(*coords, indexing="ij"), order=1, mode="nearest")
+            if np.issubdtype(data.dtype, np.integer):
+                info = np.iinfo(data.dtype)
+                result = np.clip(np.rint(result), info.min, info.max)
+            result = result.astype(data.dtype)
+        if squeeze:
+            result = result.squeeze(axis=squeeze)
+        return result
+
+    def _read(self, array: Union[np.ndarray, zarr.Array], key: Any) -> Any:
+        """
+        Read from an array of the Mzarr instance, decoding the chunks in the pool if workers are set and
+        serving them from the cache if a cache is set.
+
+        Args:
+            array (Union[np.ndarray, zarr.Array]): The array to read from.
+            key (Any): The index or slice to read.
+
+        Returns:
+            Any: The item or slice from the array.
+        """
+
+        if isinstance(array, zarr.Array):
+            file = None if self.path is None else os.path.abspath(self.path)
+            cache = self.cache if file is not None else None
+            with phase("read"):
+                return read_region(array, key, self._executor(), cache, file)
+        return array[key]
+
+    async def aread(self, level: int = 0, key: Any = Ellipsis) -> Any:
+        """
+        Read from a pyramid level without blocking the event loop, e.g. to serve tiles to a viewer.
+
+        Unlike `read`, the key indexes the pyramid level directly. The chunks are fetched and decoded in the pool of
+        the workers (or the default executor of the event loop), concurrent requests for the same chunk share a single
+        load and decoded chunks are served from the cache if one is set. Cancelling the coroutine cancels the loads
+        that no other request waits for, see `AsyncChunkReader`.
+
+        Args:
+            level (int, optional): The pyramid level to read from. Defaults to 0.
+            key (Any, optional): The index or slice in the coordinates of the level. Defaults to the full level.
+
+        Returns:
+            Any: The item or slice from the pyramid level.
+        """
+
+        array = self.level(level)
+        if not isinstance(array, zarr.Array):
+            return array[key]
+        return await self._async().read(array, key)
+
+    async def iter_tiles(
+            self,
+            level: int,
+            tile_shape: Tuple[int, ...],
+            region: Optional[Tuple[slice, ...]] = None,
+            prefetch: int = 8
+    ) -> AsyncIterator[Tuple[Tuple[slice, ...], np.ndarray]]:
+        """
+        Read a pyramid level tile by tile without blocking the event loop, while the next tiles are already loading.
+
+        Args:
+            level (int): The pyramid level to read from.
+            tile_shape (Tuple[int, ...]): The shape of the tiles, the tiles at the border may be smaller.
+            region (Tuple[slice, ...], optional): Only read the tiles within this region in the coordinates of the
+                level. Defaults to None.
+            prefetch (int, optional): The number of tiles that are loaded ahead. Defaults to 8.
+
+        Yields:
+            Tuple[Tuple[slice, ...], np.ndarray]: The region of the tile in the level and its data.
+        """
+
+        array = self.level(level)
+        if not isinstance(array, zarr.Array):
+            for tile in tile_regions(array.shape, tile_shape, region):
+                yield tile, array[tile]
+            return
+        async for tile, data in self._async().iter_tiles(array, tile_shape, region, prefetch):
+            yield tile, data
+
+    def _async(self) -> AsyncChunkReader:
+        """
+        Get the reader of the async API. It is shared by all coroutines, so they share the chunks in flight.
+
+        Returns:
+            AsyncChunkReader: The reader.
+        """
+
+        with self._lock:
+            executor = self._executor()
+            if self._async_reader is None or self._async_reader.executor is not executor:
+                file = None if self.path is None else os.path.abspath(self.path)
+                self._async_reader = AsyncChunkReader(executor, self.cache, file)
+            return self._async_reader
+
+    def _set_workers(self, workers: Union[int, Executor]) -> None:
+        """
+        Set the workers used to encode and decode chunks and shut down a previously created pool.
+
+        Args:
+            workers (Union[int, Executor]): The number of threads or a pool.
+        """
+
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self.workers = workers
+
+    def _executor(self) -> Optional[Executor]:
+        """
+        Get the pool used to encode and decode chunks. A thread pool is created on first use if the number of
+        workers is given.
+
+        Returns:
+            Optional[Executor]: The pool or None if chunks are encoded and decoded in the calling thread.
+        """
+
+        if isinstance(self.workers, Executor):
+            return self.workers
+        if self.workers is None or self.workers <= 1:
+            return None
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers)
+        return self._pool
+
+    def _map_roi(self, roi: Any, level: int) -> Tuple[Union[int, slice], ...]:
+        """
+        Map a region of interest from base resolution coordinates to the coordinates of a pyramid level.
+
+        Args:
+            roi (Any): The index or slice in base resolution coordinates.
+            level (int): The pyramid level.
+
+        Returns:
+            Tuple[Union[int, slice], ...]: The index or slice in the coordinates of the pyramid level.
+
+        Raises:
+            RuntimeError: If the region of interest uses unsupported indexing.
+        """
+
+        base_shape = self.array.shape
+        level_shape = self.level(level).shape
+        scale = self.level_scale(level)
+        roi = self._normalize_roi(roi)
+
+        level_roi = []
+        for key, size, level_size, factor in zip(roi, base_shape, level_shape, scale):
+            if isinstance(key, slice):
+                start, stop, step = key.indices(size)
+                if step < 0:
+                    raise RuntimeError("Negative slice steps are not supported.")
+                stop = max(start, stop)
+                level_roi.append(slice(start // factor, min(-(-stop // factor), level_size), -(-step // factor)))
+            elif isinstance(key, (int, np.integer)):
+                level_roi.append(int(key % size) // factor)
+            else:
+                raise RuntimeError("Only integer and slice indexing is supported. Got {}.".format(key))
+        return tuple(level_roi)
+
+    def _normalize_roi(self, roi: Any) -> Tuple[Any, ...]:
+        """
+        Expand a region of interest to one index or slice per axis of the base level.
+
+        Args:
+            roi (Any): The index or slice in base resolution coordinates.
+
+        Returns:
+            Tuple[Any, ...]: The index or slice of every axis.
+        """
+
+        ndim = len(self.array.shape)
+        roi = roi if isinstance(roi, tuple) else (roi,)
+        if any(key is Ellipsis for key in roi):
+            index = next(i for i, key in enumerate(roi) if key is Ellipsis)
+            roi = roi[:index] + (slice(None),) * (ndim - len(roi) + 1) + roi[index + 1:]
+        return roi + (slice(None),) * (ndim - len(roi))
+
+    def _roi_shape(self, roi: Any, level: int) -> Tuple[int, ...]:
+        """
+        Get the shape of a region of interest in a pyramid level. Integer indexed axes are kept with a size of 1.
+
+        Args:
+            roi (Any): The index or slice in base resolution coordinates.
+            level (int): The pyramid level.
+
+        Returns:
+            Tuple[int, ...]: The shape of the region of interest in the pyramid level.
+        """
+
+        level_roi = self._map_roi(roi, level)
+        return tuple(len(range(*key.indices(size))) if isinstance(key, slice) else 1 for key, size in zip(level_roi, self.level(level).shape))
 
     def close(self) -> None:
         """
         Close the Mzarr file associated with the Mzarr instance.
 
-        This method closes the underlying ZipStore associated with the Mzarr instance.
+        This method updates the coarser pyramid levels if the base level was written (see `flush`), closes
+        the underlying ZipStore associated with the Mzarr instance and shuts down the thread pool created for the workers.
+        The consolidated metadata of a file opened for writing is rewritten if it is outdated, see `consolidate`.
         """
 
-        self.store.store.close()
+        if self._dirty:
+            self.flush()
+        store = self.store.chunk_store
+        # The zip store of a file written by `save` is already closed
+        closed = isinstance(store, zarr.ZipStore) and (store.mode == 'r' or store.zf.fp is None)
+        if self._mode != 'r' and not closed and CONSOLIDATED_KEY in store:
+            consolidate(store)
+        store.close()
+        self._set_workers(self.workers)
 
     def attrs(self) -> dict:
         """
@@ -117,6 +972,113 @@ class Mzarr:
         """
         return dict(self.store.attrs)
 
+    def statistics(self) -> dict:
+        """
+        Get the statistics of the base level from the statistics index, without decoding any chunk.
+
+        Returns:
+            dict: The 'count', 'nonzero', 'min', 'max', 'mean' and 'std' of the base level, a coarse 'histogram' with
+                its bin 'edges' and, for segmentation masks, the 'labels' that are present, see `ChunkStats.global_stats`.
+
+        Raises:
+            RuntimeError: If the file has no statistics index.
+        """
+
+        return self._stats().global_stats()
+
+    def chunks_with_label(self, label: int) -> List[Tuple[slice, ...]]:
+        """
+        Find the chunks of the base level of a segmentation mask that contain a label, without decoding any chunk.
+
+        Args:
+            label (int): The label.
+
+        Returns:
+            List[Tuple[slice, ...]]: The regions of the chunks in the base level.
+
+        Raises:
+            RuntimeError: If the file has no statistics index or is not a segmentation mask.
+        """
+
+        stats = self._stats()
+        return [stats.region(coords) for coords in stats.chunks_with_label(label)]
+
+    def sample_patches(
+            self,
+            patch_shape: Tuple[int, ...],
+            count: int,
+            foreground: float = 0.33,
+            label: Optional[int] = None,
+            seed: Optional[int] = None
+    ) -> List[Tuple[slice, ...]]:
+        """
+        Draw random patch positions in the base level, of which a fraction is biased towards the foreground.
+
+        A foreground patch is centered on a random position inside a chunk with foreground, which is drawn from
+        the statistics index without decoding any chunk. Chunks are weighted by their number of nonzero elements,
+        or equally among the chunks that contain `label`. All other patches are drawn uniformly.
+
+        Args:
+            patch_shape (Tuple[int, ...]): The shape of the patches with or without the channel axis.
+            count (int): The number of patches.
+            foreground (float, optional): The probability that a patch is a foreground patch. Defaults to 0.33.
+            label (int, optional): The label that defines the foreground of a segmentation mask. Defaults to None,
+                which treats every nonzero element as foreground.
+            seed (int, optional): The seed of the random generator. Defaults to None.
+
+        Returns:
+            List[Tuple[slice, ...]]: The regions of the patches, which can be passed to `read`.
+
+        Raises:
+            RuntimeError: If the file has no statistics index or the patch shape does not match the array.
+        """
+
+        stats = self._stats()
+        shape = stats.shape
+        patch = access_patch(shape, tuple(patch_shape), self.store.attrs.get("channel_axis") if self.store is not None else None)
+        chunks, probabilities = stats.foreground_chunks(label)
+        rng = np.random.default_rng(seed)
+        patches = []
+        for _ in range(count):
+            if len(chunks) > 0 and rng.random() < foreground:
+                region = stats.region(chunks[rng.choice(len(chunks), p=probabilities)])
+                centers = [rng.integers(key.start, key.stop) for key in region]
+                starts = [min(max(center - p // 2, 0), size - p) for center, p, size in zip(centers, patch, shape)]
+            else:
+                starts = [rng.integers(0, size - p + 1) for p, size in zip(patch, shape)]
+            patches.append(tuple(slice(int(start), int(start) + p) for start, p in zip(starts, patch)))
+        return patches
+
+    def update_statistics(self) -> None:
+        """
+        Compute the statistics index of the base level of a file anew, e.g. for files saved without it.
+
+        The base level is read twice chunk by chunk, once for the edges of the histogram and once for the index.
+        """
+
+        attrs = self.store.attrs
+        stats = compute_stats(self.array, self.array.chunks, bool(attrs.get("seg", False)))
+        with ignore_duplicate_names():
+            attrs["stats"] = stats.write(self.store)
+
+    def _stats(self) -> ChunkStats:
+        """
+        Load the statistics index. For arrays in memory, it is computed with the whole array as a single chunk.
+
+        Returns:
+            ChunkStats: The statistics index.
+
+        Raises:
+            RuntimeError: If the file has no statistics index.
+        """
+
+        if self.store is None:
+            return compute_stats(self.array, self.array.shape)
+        stats = ChunkStats.load(self.store)
+        if stats is None:
+            raise RuntimeError("The Mzarr file has no statistics index. Create it with update_statistics.")
+        return stats
+
     def __getitem__(self, key: Union[int, slice]) -> np.ndarray:
         """
         Get an item or a slice from the base array of the Mzarr instance.
@@ -130,7 +1092,7 @@ class Mzarr:
             np.ndarray: The item or slice from the base array corresponding to the key.
         """
 
-        return self.array[key]
+        return self._read(self.array, key)
 
     def __setitem__(self, key: Union[int, slice], value: np.ndarray) -> None:
         """
@@ -143,7 +1105,98 @@ class Mzarr:
             value (np.ndarray): The value to set at the specified index or slice.
         """
 
-        self.array.__setitem__(key, value)
+        with ignore_duplicate_names():
+            self.array.__setitem__(key, value)
+        if self.path is None:
+            return
+        indexer = BasicIndexer(key, self.array)
+        if self.cache is not None:
+            file = os.path.abspath(self.path)
+            for chunk_coords, _, _ in indexer:
+                self.cache.discard(chunk_key(file, self.array.path, chunk_coords))
+        if self.num_levels() > 1 or "stats" in self.store.attrs:
+            region = []
+            for dim_indexer in indexer.dim_indexers:
+                if hasattr(dim_indexer, "dim_sel"):
+                    region.append(slice(dim_indexer.dim_sel, dim_indexer.dim_sel + 1))
+                else:
+                    last = dim_indexer.start + max(dim_indexer.nitems - 1, 0) * dim_indexer.step
+                    region.append(slice(dim_indexer.start, last + 1 if dim_indexer.nitems > 0 else dim_indexer.start))
+            self._dirty.append(tuple(region))
+            if self.auto_flush:
+                self.flush(compact=False)
+
+    def flush(self, compact: Optional[bool] = None) -> None:
+        """
+        Update the coarser pyramid levels and the statistics index after writes to the base level.
+
+        Every write to the base level is tracked as a dirty region. Only the regions of the coarser levels that depend
+        on a dirty region are recomputed from the base level, so only the chunks that contain them are re-encoded and
+        all other chunks are left untouched. The dirty regions are grouped by chunk, so every affected chunk is
+        decoded and re-encoded once per flush, however many edits it contains. The recomputed regions are identical
+        to the ones `save` would create from the edited base level. For lossy levels, the rest of a re-encoded chunk
+        is encoded once more.
+        A zip file can only be appended to, so rewritten chunks leave stale copies behind, which are removed by
+        compacting the file without re-encoding any chunk, see `compact_zip`. The directory layouts update the
+        chunks in place (the sharded layout only chunks that do not grow), see `save`.
+        The statistics of the edited chunks of the base level are recomputed with the histogram edges of `save`.
+
+        Args:
+            compact (bool, optional): Whether to compact the file afterwards. Defaults to None, which compacts the
+                file once the stale copies make up at least half of it.
+        """
+
+        if self._dirty:
+            # The dirty regions are only cleared once the levels are updated, so a failed flush can be repeated
+            edited = list(self._dirty)
+            regions = edited
+            attrs = self.store.attrs
+            pyramid_type, is_seg, channel_axis = attrs["multiscale"]["type"], attrs["seg"], attrs.get("channel_axis")
+            shapes = [self.level(p).shape for p in range(self.num_levels())]
+            channel_axis = _normalize_axis(channel_axis, len(shapes[0]))
+            file = os.path.abspath(self.path)
+            # The regions of all levels overlap in the base level, so its decoded chunks are shared through a cache
+            base = ChunkReader(self.array, self._executor(), self.cache if self.cache is not None else ChunkCache(), file)
+            with phase("flush"), ignore_duplicate_names():
+                for p in range(1, len(shapes)):
+                    regions = [tuple(slice(*target_rows(key.start, key.stop, size, pyramid_type, axis == channel_axis)) for axis, (key, size) in enumerate(zip(region, shapes[p - 1]))) for region in regions]
+                    regions = [region for region in regions if all(key.stop > key.start for key in region)]
+                    array = self.level(p)
+                    # The parts of all regions in a chunk are recomputed together, so every chunk is re-encoded once
+                    chunks = {}
+                    for region in regions:
+                        for coords, chunk_region in iter_chunks(array.shape, array.chunks, region):
+                            part = tuple(slice(max(key.start, bound.start), min(key.stop, bound.stop)) for key, bound in zip(region, chunk_region))
+                            parts = chunks.setdefault(coords, (chunk_region, []))[1]
+                            if part not in parts:
+                                parts.append(part)
+                    for coords, (chunk_region, parts) in chunks.items():
+                        block = np.array(array[chunk_region])
+                        for part in parts:
+                            local = tuple(slice(key.start - origin.start, key.stop - origin.start) for key, origin in zip(part, chunk_region))
+                            block[local] = pyramid_region(base, shapes, part, p, pyramid_type, is_seg, channel_axis).astype(array.dtype)
+                        array[chunk_region] = block
+                        if self.cache is not None:
+                            self.cache.discard(chunk_key(file, array.path, coords))
+                stats = ChunkStats.load(self.store)
+                if stats is not None:
+                    chunks = {coords: chunk_region for region in edited for coords, chunk_region in iter_chunks(stats.shape, stats.chunks, region)}
+                    for coords, chunk_region in chunks.items():
+                        stats.update(coords, base[chunk_region])
+                    stats.write(self.store)
+            self._dirty = self._dirty[len(edited):]
+        store = self.store.chunk_store
+        if isinstance(store, ShardedStore):
+            # The indexes of the shards are written on flush, which makes the changes visible to readers
+            store.flush()
+        if compact is not False and isinstance(store, zarr.ZipStore):
+            # The store is only closed and reopened if the compaction has something to remove
+            stale = stale_bytes(store.zf.infolist())
+            if stale > 0 and (compact or stale >= COMPACT_STALE_FRACTION * os.path.getsize(self.path)):
+                store.close()
+                with phase("compact"):
+                    compact_zip(self.path)
+                self.load(self.path, self._reopen_mode())
 
     def __getattr__(self, name: str) -> Any:
         """
@@ -160,6 +1213,9 @@ class Mzarr:
             Any: The attribute value.
         """
 
+        if name.startswith("_"):
+            # Private attributes are never forwarded, e.g. while the instance is unpickled
+            raise AttributeError(name)
         return getattr(self.array, name)
 
     def __repr__(self) -> str:
@@ -170,27 +1226,29 @@ class Mzarr:
             str: The string representation of the Mzarr instance.
         """
 
-        return repr(self.array[...])
+        if isinstance(self.array, np.ndarray):
+            return repr(self.array)
+        return "Mzarr(path={}, shape={}, dtype={}, chunks={}, levels={})".format(self.path, self.array.shape, self.array.dtype, self.array.chunks, self.num_levels())
 
     def _create_pyramid(self,
                         array: np.ndarray,
                         num_pyramids: int,
                         channel_axis: Optional[int],
                         is_seg: bool,
-                        type: Literal['subsampled', 'gaussian']
+                        type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max']
                         ) -> List[np.ndarray]:
         """
         Create a pyramid from the given array.
 
         This method generates a pyramid of images from the given input array. The pyramid
-        can be of "gaussian" or "subsampled" type and will contain 'num_pyramids' levels.
+        can be of "gaussian", "subsampled", "mode", "mean" or "max" type and will contain 'num_pyramids' levels.
 
         Args:
             array (np.ndarray): The input array.
             num_pyramids (int): The number of pyramid levels to create.
             channel_axis (Optional[int]): The axis representing channels in the array.
             is_seg (bool): Indicates if the array is a segmentation mask.
-            type (str): The type of pyramid to create ("gaussian" or "subsampled").
+            type (str): The type of pyramid to create ("gaussian", "subsampled", "mode", "mean" or "max").
 
         Returns:
             List[np.ndarray]: The pyramid of arrays.
@@ -202,12 +1260,22 @@ class Mzarr:
             order = 1
             if is_seg:
                 order = 0
-            pyramid = list(pyramid_gaussian(array, downscale=2, max_layer=num_pyramids, channel_axis=channel_axis, order=order, preserve_range=True))
-            pyramid = [p.astype(array.dtype) for p in pyramid]
+            # Cast every level as soon as it is generated, so only the current float level is kept in memory
+            pyramid = [p.astype(array.dtype) for p in pyramid_gaussian(array, downscale=2, max_layer=num_pyramids, channel_axis=channel_axis, order=order, preserve_range=True)]
+        elif type in BLOCK_TYPES:
+            pyramid = [array]
+            for _ in range(num_pyramids):
+                previous = pyramid[-1]
+                level = np.empty(level_shape(previous.shape, channel_axis), dtype=array.dtype)
+                # Reduce the level in slabs of about 256 KiB, so the temporary arrays stay small compared to the level
+                step = max(1, (256 * 1024) // max(1, level[:1].nbytes))
+                for start in range(0, level.shape[0], step):
+                    region = (slice(start, min(start + step, level.shape[0])),) + tuple(slice(0, size) for size in level.shape[1:])
+                    level[region] = downsample(previous, region, type, is_seg, channel_axis)
+                pyramid.append(level)
         else:
             pyramid = [array]
-            if channel_axis is not None and channel_axis < 0:
-                channel_axis = len(array.shape) + channel_axis
+            channel_axis = _normalize_axis(channel_axis, len(array.shape))
             slices = []
             for axis in range(len(array.shape)):
                 if channel_axis is None or axis != channel_axis:
@@ -223,13 +1291,19 @@ class Mzarr:
               path: str,
               attrs: Optional[dict],
               pyramid: List[np.ndarray],
-              pyramid_type: Literal['subsampled', 'gaussian'],
+              pyramid_type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'],
               is_seg: bool,
               lossless: bool,
               chunks: bool,
               channel_axis: Optional[int],
               mode: Literal['r+', 'a', 'w', 'w-'] = 'a',
-              overwrite: bool = True
+              overwrite: bool = True,
+              compression: Optional[Union[Literal['auto', 'raw'], dict, List[Optional[dict]]]] = None,
+              compression_target: Optional[dict] = None,
+              access: Optional[Union[str, Tuple[int, ...]]] = None,
+              chunk_bytes: Optional[int] = None,
+              statistics: bool = True,
+              layout: Literal['zip', 'directory', 'sharded'] = "zip"
               ) -> None:
         """
         Save the Mzarr instance to disk.
@@ -241,56 +1315,493 @@ class Mzarr:
             path (str): The path to save the Mzarr instance to.
             attrs (Optional[dict]): Additional attributes to be saved.
             pyramid (List[np.ndarray]): The pyramid of arrays to be saved.
-            pyramid_type (str): The type of pyramid ("gaussian" or "subsampled").
+            pyramid_type (str): The type of pyramid ("gaussian", "subsampled", "mode", "mean" or "max").
             is_seg (bool): Whether the array is a segmentation mask.
             lossless (bool): Whether to use lossless compression.
             chunks (bool): Whether to use chunked storage.
             channel_axis (Optional[int]): The axis representing channels in the array.
             mode (Literal['r+', 'a', 'w', 'w-']): The mode in which to open the Mzarr file. Default is 'a'.
             overwrite (bool): Whether to overwrite an existing Mzarr file at the same path.
+            compression (Union[str, dict, List[dict]], optional): The codecs of the pyramid levels, see `save`.
+            compression_target (dict, optional): The target of the 'auto' compression, see `save`.
+            access (Union[str, Tuple[int, ...]], optional): The access profile used to derive the chunks, see `save`.
+            chunk_bytes (int, optional): The target number of bytes of a chunk of the base level, see `save`.
+            statistics (bool, optional): Whether to store the statistics index, see `save`. Defaults to True.
+            layout (Literal['zip', 'directory', 'sharded'], optional): The storage layout, see `save`. Defaults to "zip".
 
         Raises:
             RuntimeError: If a file already exists at the specified path and 'overwrite' is set to False.
         """
 
-        if os.path.exists(path) and overwrite:
-            os.remove(path)
-        elif os.path.exists(path):
-            raise RuntimeError("A file already exists under {}".format(path))
+        self._prepare_path(path, overwrite)
 
-        if (chunks is None or chunks is True) and channel_axis is not None:
-            dtype = normalize_dtype(pyramid[0].dtype, None)[0]
-            chunks = guess_chunks(pyramid[0].shape, dtype.itemsize)
-            chunks = list(chunks)
-            chunks[channel_axis] = pyramid[0].shape[channel_axis]
-            chunks = tuple(chunks)
+        dtype = normalize_dtype(pyramid[0].dtype, None)[0]
+        level_chunks = self._pyramid_chunks([level.shape for level in pyramid], dtype, chunks, channel_axis, access, chunk_bytes)
+        with phase("compression_tuning"):
+            compressors, compression_attrs = self._level_compressors(
+                len(pyramid), lambda: [(sample_array(level, c), c) for level, c in zip(pyramid, level_chunks)],
+                lossless, compression, compression_target)
 
-        zip_store = zarr.ZipStore(path, compression=0, mode=mode)
-        grp = zarr.group(zip_store)
+        store = open_store(path, mode, layout)
+        grp = zarr.group(store)
 
         series = []
         for p, dataset in enumerate(pyramid):
             if p == 0:
                 resolution_path = "base"
-                p_lossless = lossless
             else:
                 resolution_path = "{}_{}".format(pyramid_type, p)
-                p_lossless = False
-            grp.create_dataset(resolution_path, data=pyramid[p], chunks=chunks, compressor=JpegXl(lossless=p_lossless), dtype=pyramid[p].dtype)
+            with phase("write_levels"):
+                if self._executor() is None and active() is None:
+                    grp.create_dataset(resolution_path, data=pyramid[p], chunks=level_chunks[p], compressor=compressors[p], dtype=pyramid[p].dtype)
+                else:
+                    # Instrumented saves encode through write_chunks, which produces the same chunks as zarr
+                    dataset = grp.create_dataset(resolution_path, shape=pyramid[p].shape, chunks=level_chunks[p], compressor=compressors[p], dtype=pyramid[p].dtype)
+                    write_chunks([dataset], lambda region, level=pyramid[p]: level[region], self._executor())
             series.append({"path": resolution_path})
 
+        stats_attrs = None
+        if statistics:
+            with phase("statistics"):
+                base = pyramid[0]
+                edges = finite_range(base, (0.0, 1.0))
+                stats_attrs = compute_stats(base, level_chunks[0], is_seg, edges).write(grp)
+
+        with phase("metadata"):
+            self._write_metadata(grp, attrs, series, pyramid_type, is_seg, lossless, channel_axis, len(pyramid[0].shape), compression_attrs, stats_attrs)
+            consolidate(store)
+        with phase("close"):
+            store.close()
+
+        self.store = grp
+
+    def _save_streaming(self,
+                        path: str,
+                        attrs: Optional[dict],
+                        num_pyramids: int,
+                        pyramid_type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'],
+                        is_seg: bool,
+                        lossless: bool,
+                        chunks: bool,
+                        channel_axis: Optional[int],
+                        mode: Literal['r+', 'a', 'w', 'w-'] = 'a',
+                        overwrite: bool = True,
+                        compression: Optional[Union[Literal['auto', 'raw'], dict, List[Optional[dict]]]] = None,
+                        compression_target: Optional[dict] = None,
+                        access: Optional[Union[str, Tuple[int, ...]]] = None,
+                        chunk_bytes: Optional[int] = None,
+                        statistics: bool = True,
+                        layout: Literal['zip', 'directory', 'sharded'] = "zip"
+                        ) -> None:
+        """
+        Save the Mzarr instance to disk chunk by chunk.
+
+        For arrays, the base level is written chunk by chunk and every coarser level is then computed chunk by
+        chunk from the level before it. As all coarser levels are stored lossy, an exact copy of the previous level
+        is kept in a temporary scratch store next to the output file, so the pyramid matches the one created in
+        memory by `_create_pyramid`.
+        For a SlabSource, every slab is added to all pyramid levels as it arrives, see `_write_slab_pyramid`.
+
+        Args:
+            path (str): The path to save the Mzarr instance to.
+            attrs (Optional[dict]): Additional attributes to be saved.
+            num_pyramids (int): The number of pyramid levels to create.
+            pyramid_type (str): The type of pyramid ("gaussian", "subsampled", "mode", "mean" or "max").
+            is_seg (bool): Whether the array is a segmentation mask.
+            lossless (bool): Whether to use lossless compression.
+            chunks (bool): Whether to use chunked storage.
+            channel_axis (Optional[int]): The axis representing channels in the array.
+            mode (Literal['r+', 'a', 'w', 'w-']): The mode in which to open the Mzarr file. Default is 'a'.
+            overwrite (bool): Whether to overwrite an existing Mzarr file at the same path.
+            compression (Union[str, dict, List[dict]], optional): The codecs of the pyramid levels, see `save`.
+                For 'auto', the levels are sampled from a small pyramid of a central crop of the base level
+                (or of the first slab of a SlabSource).
+            compression_target (dict, optional): The target of the 'auto' compression, see `save`.
+            access (Union[str, Tuple[int, ...]], optional): The access profile used to derive the chunks, see `save`.
+            chunk_bytes (int, optional): The target number of bytes of a chunk of the base level, see `save`.
+            statistics (bool, optional): Whether to store the statistics index, see `save`. For arrays, the edges of
+                its histogram are the range of the whole base level like in `_save`, which reads the array once more
+                chunk by chunk. The slabs of a SlabSource can only be read once, so the edges are the range of the
+                first slab and values outside of it are counted in the outer bins of the histogram. The edges are
+                stored with the index. Defaults to True.
+            layout (Literal['zip', 'directory', 'sharded'], optional): The storage layout, see `save`. Defaults to "zip".
+
+        Raises:
+            RuntimeError: If a file already exists at the specified path and 'overwrite' is set to False.
+        """
+
+        self._prepare_path(path, overwrite)
+        source = self.array
+        shape, dtype = tuple(source.shape), np.dtype(source.dtype)
+
+        shapes = [shape]
+        for _ in range(num_pyramids or 0):
+            p_shape = level_shape(shapes[-1], channel_axis)
+            if pyramid_type == "gaussian" and p_shape == shapes[-1]:
+                break
+            shapes.append(p_shape)
+
+        shapes_chunks = self._pyramid_chunks(shapes, dtype, chunks, channel_axis, access, chunk_bytes)
+
+        def base_sample() -> np.ndarray:
+            if isinstance(source, SlabSource):
+                # Peek at the first slab and put it back in front of the remaining slabs
+                slabs = iter(source.slabs)
+                first = np.asarray(next(slabs))
+                source.slabs = itertools.chain([first], slabs)
+                return first
+            return sample_array(source, shapes_chunks[0])
+
+        def samples() -> List[Tuple[np.ndarray, Tuple[int, ...]]]:
+            pyramid = self._create_pyramid(base_sample(), len(shapes) - 1, channel_axis, is_seg, pyramid_type)
+            return [(pyramid[min(p, len(pyramid) - 1)], c) for p, c in enumerate(shapes_chunks)]
+
+        with phase("compression_tuning"):
+            compressors, compression_attrs = self._level_compressors(len(shapes), samples, lossless, compression, compression_target)
+        stats = None
+        if statistics:
+            if isinstance(source, SlabSource):
+                edges = finite_range(base_sample(), (0.0, 1.0))
+            else:
+                with phase("statistics"):
+                    edges = chunked_range(source, shapes_chunks[0])
+            stats = ChunkStats(shape, shapes_chunks[0], edges, is_seg)
+
+        store = open_store(path, mode, layout)
+        grp = zarr.group(store)
+        try:
+            arrays, series = [], []
+            for p, p_shape in enumerate(shapes):
+                resolution_path = "base" if p == 0 else "{}_{}".format(pyramid_type, p)
+                arrays.append(grp.create_dataset(resolution_path, shape=p_shape, chunks=shapes_chunks[p], compressor=compressors[p], dtype=dtype))
+                series.append({"path": resolution_path})
+
+            # The pyramid is computed while the levels are written
+            with phase("write_levels"):
+                if isinstance(source, SlabSource):
+                    self._write_slab_pyramid(arrays, source, pyramid_type, is_seg, channel_axis, stats)
+                else:
+                    self._write_array_pyramid(arrays, source, pyramid_type, is_seg, channel_axis, os.path.dirname(os.path.abspath(path)), stats)
+
+            with phase("metadata"):
+                stats_attrs = stats.write(grp) if stats is not None else None
+                self._write_metadata(grp, attrs, series, pyramid_type, is_seg, lossless, channel_axis, len(shape), compression_attrs, stats_attrs)
+                consolidate(store)
+        finally:
+            with phase("close"):
+                store.close()
+
+        self.store = grp
+
+    def _write_array_pyramid(self,
+                             arrays: List[zarr.Array],
+                             source: Any,
+                             pyramid_type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'],
+                             is_seg: bool,
+                             channel_axis: Optional[int],
+                             scratch_dir: str,
+                             stats: Optional[ChunkStats] = None
+                             ) -> None:
+        """
+        Write all pyramid levels of an array chunk by chunk, one level after the other.
+
+        Args:
+            arrays (List[zarr.Array]): The arrays of all pyramid levels.
+            source (Any): The base level. Can be any array-like that supports slicing.
+            pyramid_type (str): The type of pyramid ("gaussian", "subsampled", "mode", "mean" or "max").
+            is_seg (bool): Whether the array is a segmentation mask.
+            channel_axis (Optional[int]): The axis representing channels in the array.
+            scratch_dir (str): The directory in which the temporary scratch store is created.
+            stats (ChunkStats, optional): Collects the statistics of the chunks of the base level. Defaults to None.
+        """
+
+        # The gaussian pyramid computes every level from the previous float level, see `pyramid_gaussian`
+        scratch_dtype = source.dtype
+        if pyramid_type == "gaussian":
+            scratch_dtype = np.float32 if source.dtype in (np.float16, np.float32) else np.float64
+
+        with tempfile.TemporaryDirectory(prefix=".mzarr_", dir=scratch_dir) as scratch_path:
+            scratch = zarr.group(zarr.DirectoryStore(scratch_path))
+            write_chunks([arrays[0]], lambda region: source[region], self._executor(), on_chunk=stats.update if stats is not None else None)
+            previous = source
+            for p in range(1, len(arrays)):
+                targets = [arrays[p]]
+                if p < len(arrays) - 1:
+                    targets.append(scratch.create_dataset(arrays[p].path, shape=arrays[p].shape, chunks=arrays[p].chunks, compressor=numcodecs.Zstd(level=1), dtype=scratch_dtype))
+                write_chunks(targets, lambda region, previous=previous: downsample(previous, region, pyramid_type, is_seg, channel_axis), self._executor())
+                previous = targets[-1]
+
+    def _write_slab_pyramid(self,
+                            arrays: List[zarr.Array],
+                            source: "SlabSource",
+                            pyramid_type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'],
+                            is_seg: bool,
+                            channel_axis: Optional[int],
+                            stats: Optional[ChunkStats] = None
+                            ) -> None:
+        """
+        Write all pyramid levels from a SlabSource in a single pass over the slabs.
+
+        Every slab is appended to the base level and cascaded through all coarser levels as soon as it arrives:
+        Each level keeps a window of its most recent rows (along the first axis) from which the rows of the next
+        coarser level are computed once all rows they depend on are available. Each level also buffers its computed
+        rows until a full row of chunks can be written. Hence, the memory is bounded by a few rows of chunks per level
+        and the slabs are never read back from the file.
+
+        Args:
+            arrays (List[zarr.Array]): The arrays of all pyramid levels.
+            source (SlabSource): The slabs of the base level.
+            pyramid_type (str): The type of pyramid ("gaussian", "subsampled", "mode", "mean" or "max").
+            is_seg (bool): Whether the array is a segmentation mask.
+            channel_axis (Optional[int]): The axis representing channels in the array.
+            stats (ChunkStats, optional): Collects the statistics of the chunks of the base level. Defaults to None.
+
+        Raises:
+            RuntimeError: If the slabs do not match the shape of the SlabSource.
+        """
+
+        is_channel_axis = channel_axis is not None and channel_axis % len(source.shape) == 0
+        # The gaussian pyramid computes every level from the previous float level, see `pyramid_gaussian`
+        window_dtype = source.dtype
+        if pyramid_type == "gaussian":
+            window_dtype = np.float32 if source.dtype in (np.float16, np.float32) else np.float64
+        windows = [RowWindow(array.shape, source.dtype if p == 0 else window_dtype) for p, array in enumerate(arrays)]
+        buffers = [RowWindow(array.shape, array.dtype) for array in arrays]
+        computed = [0] * len(arrays)
+
+        def push(p: int, rows: np.ndarray) -> None:
+            buffer, array = buffers[p], arrays[p]
+            buffer.append(rows)
+            # Write all complete rows of chunks, or everything once the level is complete
+            stop = buffer.start + (len(buffer.data) // array.chunks[0]) * array.chunks[0]
+            if buffer.stop == array.shape[0]:
+                stop = buffer.stop
+            if stop > buffer.start:
+                on_chunk = stats.update if p == 0 and stats is not None else None
+                write_chunks([array], lambda region: buffer[region], self._executor(), region=(slice(buffer.start, stop),), on_chunk=on_chunk)
+                buffer.drop_before(stop)
+            if p + 1 == len(arrays):
+                return
+
+            window, size = windows[p], array.shape[0]
+            window.append(rows)
+            start = stop = computed[p + 1]
+            while stop < arrays[p + 1].shape[0] and source_rows(start, stop + 1, size, pyramid_type, is_channel_axis)[1] <= window.stop:
+                stop += 1
+            if stop > start:
+                region = (slice(start, stop),) + tuple(slice(0, s) for s in arrays[p + 1].shape[1:])
+                computed[p + 1] = stop
+                rows = downsample(window, region, pyramid_type, is_seg, channel_axis)
+                if stop < arrays[p + 1].shape[0]:
+                    window.drop_before(source_rows(stop, stop + 1, size, pyramid_type, is_channel_axis)[0])
+                push(p + 1, rows)
+
+        shape, written = source.shape, 0
+        for slab in source:
+            slab = np.asarray(slab)
+            if tuple(slab.shape[1:]) != tuple(shape[1:]) or written + len(slab) > shape[0]:
+                raise RuntimeError("Slab of shape {} does not fit into an array of shape {} at position {}.".format(slab.shape, shape, written))
+            if len(slab) > 0:
+                push(0, slab)
+                written += len(slab)
+        if written != shape[0]:
+            raise RuntimeError("The slabs cover only {} of {} elements along the first axis.".format(written, shape[0]))
+
+    def _level_compressors(self,
+                           num_levels: int,
+                           samples: Callable[[], List[Tuple[np.ndarray, Tuple[int, ...]]]],
+                           lossless: bool,
+                           compression: Optional[Union[Literal['auto', 'raw'], dict, List[Optional[dict]]]],
+                           compression_target: Optional[dict]
+                           ) -> Tuple[List[Any], dict]:
+        """
+        Determine the compressor of every pyramid level.
+
+        Args:
+            num_levels (int): The number of pyramid levels.
+            samples (Callable[[], List[Tuple[np.ndarray, Tuple[int, ...]]]]): Returns a sample and the chunk shape
+                of every pyramid level. Only called for the 'auto' compression.
+            lossless (bool): Whether to use lossless compression for the base level.
+            compression (Union[str, dict, List[dict]], optional): The codecs of the pyramid levels, see `save`.
+            compression_target (dict, optional): The target of the 'auto' compression, see `save`.
+
+        Returns:
+            Tuple[List[Any], dict]: The compressor of every pyramid level and the compression attributes.
+
+        Raises:
+            RuntimeError: If the compression is invalid.
+        """
+
+        benchmarks = None
+        if compression is None:
+            compressors = [JpegXl(lossless=lossless if p == 0 else False) for p in range(num_levels)]
+        elif isinstance(compression, str) and compression == "raw":
+            compressors = [None] * num_levels
+        elif isinstance(compression, str) and compression == "auto":
+            benchmarks = [tune(sample, c, lossless and p == 0, compression_target) for p, (sample, c) in enumerate(samples())]
+            compressors = [numcodecs.get_codec(dict(result["codec"])) for result in benchmarks]
+        elif isinstance(compression, dict):
+            compressors = [numcodecs.get_codec(dict(compression)) for _ in range(num_levels)]
+        elif isinstance(compression, (list, tuple)) and len(compression) == num_levels:
+            compressors = [None if config is None else numcodecs.get_codec(dict(config)) for config in compression]
+        else:
+            raise RuntimeError("Compression needs to be None, 'auto', 'raw', a codec config or a list of {} codec configs. Got {}.".format(num_levels, compression))
+
+        levels = []
+        for p, compressor in enumerate(compressors):
+            level = {"codec": None if compressor is None else compressor.get_config()}
+            if benchmarks is not None:
+                level.update({key: value for key, value in benchmarks[p].items() if key != "codec"})
+                # Lossless codecs have an infinite PSNR, which is not valid JSON
+                level["psnr"] = None if math.isinf(level["psnr"]) else level["psnr"]
+            levels.append(level)
+        compression_attrs = {
+            "mode": "auto" if benchmarks is not None else ("default" if compression is None else "manual"),
+            "target": compression_target if benchmarks is not None else None,
+            "levels": levels,
+        }
+        return compressors, compression_attrs
+
+    def _pyramid_chunks(self,
+                        shapes: List[Tuple[int, ...]],
+                        dtype: np.dtype,
+                        chunks: Any,
+                        channel_axis: Optional[int],
+                        access: Optional[Union[str, Tuple[int, ...]]] = None,
+                        chunk_bytes: Optional[int] = None
+                        ) -> List[Tuple[int, ...]]:
+        """
+        Determine the chunk shape of every pyramid level.
+
+        Args:
+            shapes (List[Tuple[int, ...]]): The shapes of all pyramid levels.
+            dtype (np.dtype): The dtype of the pyramid levels.
+            chunks (Any): The chunks argument passed to `save`.
+            channel_axis (Optional[int]): The axis representing channels in the array.
+            access (Union[str, Tuple[int, ...]], optional): The access profile, see `save`. Defaults to None.
+            chunk_bytes (int, optional): The target number of bytes of a chunk of the base level. Defaults to None.
+
+        Returns:
+            List[Tuple[int, ...]]: The chunk shape of every pyramid level.
+        """
+
+        if access is not None:
+            return pyramid_chunks(shapes, dtype.itemsize, access, chunk_bytes, channel_axis)
+        if (chunks is None or chunks is True) and channel_axis is not None:
+            # The chunks of the base level are used for all levels
+            return [self._level_chunks(shapes[0], dtype, chunks, channel_axis)] * len(shapes)
+        return [self._level_chunks(shape, dtype, chunks, channel_axis) for shape in shapes]
+
+    def _level_chunks(self, shape: Tuple[int, ...], dtype: np.dtype, chunks: Any, channel_axis: Optional[int]) -> Tuple[int, ...]:
+        """
+        Determine the chunk shape of a pyramid level in the same way as zarr does for `chunks=True`.
+
+        Args:
+            shape (Tuple[int, ...]): The shape of the pyramid level.
+            dtype (np.dtype): The dtype of the pyramid level.
+            chunks (Any): The chunks argument passed to `save`.
+            channel_axis (Optional[int]): The axis representing channels in the array.
+
+        Returns:
+            Tuple[int, ...]: The chunk shape.
+        """
+
+        if chunks is None or chunks is True:
+            chunks = list(guess_chunks(shape, dtype.itemsize))
+            if channel_axis is not None:
+                chunks[channel_axis] = shape[channel_axis]
+            return tuple(chunks)
+        return normalize_chunks(chunks, shape, dtype.itemsize)
+
+    @staticmethod
+    def _prepare_path(path: str, overwrite: bool) -> None:
+        """
+        Remove an existing Mzarr file of any layout at the path if it should be overwritten.
+
+        Args:
+            path (str): The path to save the Mzarr instance to.
+            overwrite (bool): Whether to overwrite an existing Mzarr file at the same path.
+
+        Raises:
+            RuntimeError: If a file already exists at the specified path and 'overwrite' is set to False, or if the
+                path is a directory that is not a Mzarr file.
+        """
+
+        if os.path.isdir(path) and not os.path.isfile(os.path.join(path, ".zgroup")):
+            raise RuntimeError("The directory {} is not a Mzarr file and is not overwritten.".format(path))
+        if os.path.exists(path) and overwrite:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        elif os.path.exists(path):
+            raise RuntimeError("A file already exists under {}".format(path))
+
+    def _write_metadata(self,
+                        grp: zarr.Group,
+                        attrs: Optional[dict],
+                        series: List[dict],
+                        pyramid_type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'],
+                        is_seg: bool,
+                        lossless: bool,
+                        channel_axis: Optional[int],
+                        ndim: int,
+                        compression: Optional[dict] = None,
+                        stats: Optional[dict] = None
+                        ) -> None:
+        """
+        Write the Mzarr metadata to the root group.
+
+        Args:
+            grp (zarr.Group): The root group.
+            attrs (Optional[dict]): Additional attributes to be saved.
+            series (List[dict]): The paths of the pyramid levels.
+            pyramid_type (str): The type of pyramid ("gaussian", "subsampled", "mode", "mean" or "max").
+            is_seg (bool): Whether the array is a segmentation mask.
+            lossless (bool): Whether to use lossless compression.
+            channel_axis (Optional[int]): The axis representing channels in the array.
+            ndim (int): The number of dimensions of the base level.
+            compression (dict, optional): The codec settings of every pyramid level. Defaults to None.
+            stats (dict, optional): The description of the statistics index. Defaults to None.
+        """
+
         multiscale = {
             "version": "0.1",
             "datasets": series,
             "type": pyramid_type,
         }
 
-        grp.attrs["multiscale"] = multiscale
-        grp.attrs["seg"] = is_seg
-        grp.attrs['attrs'] = attrs
-        grp.attrs["lossless"] = lossless
-        grp.attrs["channel_axis"] = channel_axis
-        grp.attrs["num_spatial"] = len(pyramid[0].shape) if channel_axis is None else len(pyramid[0].shape) - 1
-        zip_store.close()
+        metadata = {
+            "multiscale": multiscale,
+            "seg": is_seg,
+            "attrs": attrs,
+            "lossless": lossless,
+            "channel_axis": channel_axis,
+            "num_spatial": ndim if channel_axis is None else ndim - 1,
+        }
+        if compression is not None:
+            metadata["compression"] = compression
+        if stats is not None:
+            metadata["stats"] = stats
+        # Write all attributes at once, as every write appends another copy of the attributes to the zip file
+        grp.attrs.update(metadata)
+
+
+class SlabSource:
+    def __init__(self, slabs: Iterable[np.ndarray], shape: Tuple[int, ...], dtype: Any) -> None:
+        """
+        An array that is only available as consecutive slabs along its first axis.
+
+        Args:
+            slabs (Iterable[np.ndarray]): The slabs along the first axis.
+            shape (Tuple[int, ...]): The shape of the full array.
+            dtype (Any): The dtype of the full array.
+        """
+
+        self.slabs = slabs
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
 
-        self.store = grp
\ No newline at end of file
+    def __iter__(self):
+        return iter(self.slabs)
@@ -1,30 +1,58 @@
 import argparse
-from tqdm import tqdm
+import contextlib
 from os.path import join
 import os
 from natsort import natsorted
 import SimpleITK as sitk
 from mzarr import Mzarr
 import numpy as np
-from typing import Union, Tuple
-
-
-def all_nifti2mzarr(load_dir: str, save_dir: str, is_seg: bool, lossy: bool) -> None:
+from typing import Union, Tuple, Optional, List
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from mzarr.batch import convert_all
+from mzarr.profiling import IOStats
+
+
+def all_nifti2mzarr(
+        load_dir: str,
+        save_dir: str,
+        is_seg: bool,
+        lossy: bool,
+        workers: Optional[int] = None,
+        processes: int = 1,
+        memory_budget: Optional[int] = None,
+        manifest_filepath: Optional[str] = None,
+        overwrite: bool = False,
+        stats: Optional[IOStats] = None
+) -> List[dict]:
     """
     Converts all nifti files into mzarr files.
 
+    Outputs that are newer than their nifti file are skipped, so an interrupted conversion can be resumed.
+    See `mzarr.batch.convert_all` for the scheduling.
+
     Args:
         load_dir (str): Directory where the nifti files are located.
         save_dir (str): Directory where the mzarr files should be saved.
         is_seg (bool): Whether the image is a segmentation.
         lossy (bool): Whether lossy JpegXL compression should be used.
+        workers (int, optional): Number of threads used to encode the chunks of each image. Optional.
+        processes (int, optional): Number of images that are converted in parallel. Optional.
+        memory_budget (int, optional): Maximal estimated memory in bytes of all images converted in parallel. Optional.
+        manifest_filepath (str, optional): Path to a JSON lines file with the timing and compression ratio of every image. Optional.
+        overwrite (bool, optional): Whether to convert images with an up-to-date mzarr file again. Optional.
+        stats (IOStats, optional): Collects the instrumentation of all conversions, see `mzarr.profiling`. Optional.
+
+    Returns:
+        The manifest entries of all images.
     """
     names = load_filepaths(load_dir, extension=".nii.gz", return_path=False, return_extension=False)
-    for name in tqdm(names, desc="Image conversion"):
-        nifti2mzarr(join(load_dir, name + ".nii.gz"), join(save_dir, name + ".mzarr"), is_seg, lossy)
+    jobs = [(join(load_dir, name + ".nii.gz"), join(save_dir, name + ".mzarr")) for name in names]
+    convert = partial(nifti2mzarr, is_seg=is_seg, lossy=lossy, workers=workers)
+    return convert_all(jobs, convert, processes, nifti_nbytes, memory_budget, manifest_filepath=manifest_filepath, overwrite=overwrite, stats=stats)
 
 
-def nifti2mzarr(load_filepath: str, save_filepath: str, is_seg: bool, lossy: bool) -> None:
+def nifti2mzarr(load_filepath: str, save_filepath: str, is_seg: bool, lossy: bool, workers: Optional[int] = None) -> None:
     """
     Converts a single nifti file to a mzarr file.
 
@@ -33,10 +61,29 @@ def nifti2mzarr(load_filepath: str, save_filepath: str, is_seg: bool, lossy: boo
         save_dir (str): Path to where the mzarr file should be saved.
                 is_seg (bool): Whether the image is a segmentation.
         lossy (bool): Whether lossy JpegXL compression should be used.
+        workers (int, optional): Number of threads used to encode the chunks. Optional.
     """
     image, spacing, affine, header = load_nifti(load_filepath, return_meta=True)
-    image = Mzarr(image)
-    image.save(save_filepath, attrs={"spacing": spacing}, is_seg=is_seg, lossless=not lossy)
+    # The in-memory Mzarr instance holds no file, only the pool of the workers needs to be shut down
+    with ThreadPoolExecutor(workers) if workers is not None and workers > 1 else contextlib.nullcontext() as pool:
+        Mzarr(image, workers=pool).save(save_filepath, attrs={"spacing": spacing}, is_seg=is_seg, lossless=not lossy)
+
+
+def nifti_nbytes(filepath: str) -> int:
+    """
+    Computes the uncompressed size of a nifti image from its header without reading the image.
+
+    Args:
+        filepath: The path to the NIfTI file.
+
+    Returns:
+        The uncompressed size in bytes.
+    """
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(filepath)
+    reader.ReadImageInformation()
+    itemsize = sitk.GetArrayViewFromImage(sitk.Image([1] * reader.GetDimension(), reader.GetPixelID())).itemsize
+    return int(np.prod(reader.GetSize())) * reader.GetNumberOfComponents() * itemsize
 
 
 def load_filepaths(load_dir: str, extension: str = None, return_path: bool = True, return_extension: bool = True) -> np.ndarray:
@@ -122,9 +169,22 @@ if __name__ == '__main__':
     parser.add_argument('-o', "--output", required=True, help="Absolute output path to the folder that should be used for the Mzarr images.")
     parser.add_argument('--seg', required=False, default=False, action="store_true", help="Whether the image is a segmentation.")
     parser.add_argument('--lossy', required=False, default=False, action="store_true", help="Whether lossy JpegXL compression should be used.")
+    parser.add_argument('--workers', required=False, default=None, type=int, help="Number of threads used to encode the chunks.")
+    parser.add_argument('--processes', required=False, default=1, type=int, help="Number of images that are converted in parallel.")
+    parser.add_argument('--memory', required=False, default=None, type=float, help="Maximal estimated memory in GB of all images converted in parallel.")
+    parser.add_argument('--manifest', required=False, default=None, help="Path to a JSON lines file with the timing and compression ratio of every image.")
+    parser.add_argument('--overwrite', required=False, default=False, action="store_true", help="Whether to convert images with an up-to-date mzarr file again.")
+    parser.add_argument('--profile', required=False, default=False, action="store_true", help="Whether to print where the time of the conversion goes.")
     args = parser.parse_args()
 
+    stats = IOStats() if args.profile else None
     if not args.input.endswith(".nii.gz"):
-        all_nifti2mzarr(args.input, args.output, args.seg, args.lossy)
+        memory_budget = None if args.memory is None else int(args.memory * 1024 ** 3)
+        all_nifti2mzarr(args.input, args.output, args.seg, args.lossy, args.workers, args.processes, memory_budget, args.manifest, args.overwrite, stats)
+    elif stats is not None:
+        with stats:
+            nifti2mzarr(args.input, args.output, args.seg, args.lossy, args.workers)
     else:
-        nifti2mzarr(args.input, args.output, args.seg, args.lossy)
+        nifti2mzarr(args.input, args.output, args.seg, args.lossy, args.workers)
+    if stats is not None:
+        print(stats.summary())
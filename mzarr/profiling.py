@@ -0,0 +1,303 @@
+import numpy as np
+import contextlib
+import contextvars
+import threading
+import time
+import math
+from typing import Optional, Dict, Union, Iterator, ContextManager
+
+
+# Upper edges of the latency histogram buckets in microseconds, from 1 us to about 1 s and one bucket for all above
+LATENCY_EDGES_US = [2 ** i for i in range(21)]
+# Counters kept for every pyramid level
+LEVEL_COUNTERS = (
+    "chunks_encoded", "bytes_in", "bytes_out", "encode_seconds", "store_write_seconds",
+    "chunks_decoded", "bytes_read", "bytes_decoded", "store_read_seconds", "decode_seconds", "cache_hits",
+)
+
+# The active stats object of the current thread or asyncio task, so overlapping profiles in different threads
+# neither leak into nor deactivate each other
+_active: contextvars.ContextVar = contextvars.ContextVar("mzarr_profile", default=None)
+# The tokens that restore the previously active stats objects of the current context when a profile is exited
+_tokens: contextvars.ContextVar = contextvars.ContextVar("mzarr_profile_tokens", default=())
+_NO_PHASE = contextlib.nullcontext()
+
+
+class IOStats:
+    def __init__(self) -> None:
+        """
+        Statistics of where the time goes when saving and reading Mzarr files.
+
+        While a stats object is active (`with IOStats() as stats:`), the hot paths record the time spent in every
+        phase of `save`, `flush` and `read`, the bytes going into and out of the codecs and the store per pyramid
+        level, and histograms of the latency of every chunk encode and decode. Chunks that are encoded or decoded by
+        zarr itself (e.g. partial chunk writes of `flush`) are only covered by the phase timers. Recording is
+        thread-safe. A stats object is active in the thread or asyncio task that entered it and in the threads that
+        Mzarr starts on its behalf, but not in other threads. When no stats object is active, every hook is a single
+        lookup of a context variable.
+        """
+
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.levels: Dict[str, Dict[str, float]] = {}
+        self.encode_latency = np.zeros(len(LATENCY_EDGES_US) + 1, dtype=np.int64)
+        self.decode_latency = np.zeros(len(LATENCY_EDGES_US) + 1, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "IOStats":
+        _tokens.set(_tokens.get() + (_active.set(self),))
+        return self
+
+    def __exit__(self, *args) -> None:
+        tokens = _tokens.get()
+        _tokens.set(tokens[:-1])
+        _active.reset(tokens[-1])
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        """
+        Record a call of a phase.
+
+        Args:
+            name (str): The name of the phase.
+            seconds (float): The duration of the call.
+        """
+
+        with self._lock:
+            phase = self.phases.setdefault(name, {"calls": 0, "seconds": 0.0})
+            phase["calls"] += 1
+            phase["seconds"] += seconds
+
+    def add_encode(self, level: str, nbytes: int, cbytes: int, seconds: float) -> None:
+        """
+        Record the encoding of a chunk.
+
+        Args:
+            level (str): The path of the pyramid level.
+            nbytes (int): The number of bytes of the decoded chunk.
+            cbytes (int): The number of bytes of the encoded chunk.
+            seconds (float): The duration of the encoding.
+        """
+
+        with self._lock:
+            counters = self._level(level)
+            counters["chunks_encoded"] += 1
+            counters["bytes_in"] += nbytes
+            counters["bytes_out"] += cbytes
+            counters["encode_seconds"] += seconds
+            self.encode_latency[_bucket(seconds)] += 1
+
+    def add_store_write(self, level: str, seconds: float) -> None:
+        """
+        Record the write of an encoded chunk to the store.
+
+        Args:
+            level (str): The path of the pyramid level.
+            seconds (float): The duration of the write.
+        """
+
+        with self._lock:
+            self._level(level)["store_write_seconds"] += seconds
+
+    def add_store_read(self, level: str, cbytes: int, seconds: float) -> None:
+        """
+        Record the read of an encoded chunk from the store.
+
+        Args:
+            level (str): The path of the pyramid level.
+            cbytes (int): The number of bytes of the encoded chunk.
+            seconds (float): The duration of the read.
+        """
+
+        with self._lock:
+            counters = self._level(level)
+            counters["bytes_read"] += cbytes
+            counters["store_read_seconds"] += seconds
+
+    def add_decode(self, level: str, nbytes: int, seconds: float) -> None:
+        """
+        Record the decoding of a chunk.
+
+        Args:
+            level (str): The path of the pyramid level.
+            nbytes (int): The number of bytes of the decoded chunk.
+            seconds (float): The duration of the decoding.
+        """
+
+        with self._lock:
+            counters = self._level(level)
+            counters["chunks_decoded"] += 1
+            counters["bytes_decoded"] += nbytes
+            counters["decode_seconds"] += seconds
+            self.decode_latency[_bucket(seconds)] += 1
+
+    def add_cache_hit(self, level: str) -> None:
+        """
+        Record a chunk that was served from the cache.
+
+        Args:
+            level (str): The path of the pyramid level.
+        """
+
+        with self._lock:
+            self._level(level)["cache_hits"] += 1
+
+    def merge(self, other: Union["IOStats", dict]) -> None:
+        """
+        Add the statistics of another stats object, e.g. of a conversion in a worker process.
+
+        Args:
+            other (Union[IOStats, dict]): The stats object or its `as_dict`.
+        """
+
+        other = other.as_dict() if isinstance(other, IOStats) else other
+        with self._lock:
+            for name, phase in other["phases"].items():
+                own = self.phases.setdefault(name, {"calls": 0, "seconds": 0.0})
+                own["calls"] += phase["calls"]
+                own["seconds"] += phase["seconds"]
+            for level, counters in other["levels"].items():
+                own = self._level(level)
+                for key in LEVEL_COUNTERS:
+                    own[key] += counters[key]
+            self.encode_latency += np.asarray(other["encode_latency"], dtype=np.int64)
+            self.decode_latency += np.asarray(other["decode_latency"], dtype=np.int64)
+
+    def as_dict(self) -> dict:
+        """
+        Get the statistics as a dict that can be serialized to JSON or pickled.
+
+        Returns:
+            dict: The 'phases', the counters of all 'levels' and the 'encode_latency' and 'decode_latency' histograms
+                with the bucket edges in 'latency_edges_us'.
+        """
+
+        with self._lock:
+            return {
+                "phases": {name: dict(phase) for name, phase in self.phases.items()},
+                "levels": {level: dict(counters) for level, counters in self.levels.items()},
+                "encode_latency": self.encode_latency.tolist(),
+                "decode_latency": self.decode_latency.tolist(),
+                "latency_edges_us": list(LATENCY_EDGES_US),
+            }
+
+    def summary(self) -> str:
+        """
+        Format the statistics as a human-readable table.
+
+        Returns:
+            str: The summary.
+        """
+
+        stats = self.as_dict()
+        lines = ["{:<24} {:>8} {:>10}".format("phase", "calls", "seconds")]
+        for name, phase in sorted(stats["phases"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append("{:<24} {:>8} {:>10.3f}".format(name, phase["calls"], phase["seconds"]))
+        reads = stats["phases"].get("read", {}).get("calls", 0)
+        lines.append("")
+        lines.append("{:<16} {:>8} {:>10} {:>10} {:>7} {:>9} {:>9} {:>8} {:>10} {:>9} {:>9} {:>7}".format(
+            "level", "encoded", "MB in", "MB out", "ratio", "enc s", "write s", "decoded", "MB read", "read s", "dec s", "hits"))
+        for level, c in sorted(stats["levels"].items()):
+            lines.append("{:<16} {:>8} {:>10.2f} {:>10.2f} {:>7.2f} {:>9.3f} {:>9.3f} {:>8} {:>10.2f} {:>9.3f} {:>9.3f} {:>7}".format(
+                level, int(c["chunks_encoded"]), c["bytes_in"] / 1e6, c["bytes_out"] / 1e6, c["bytes_in"] / c["bytes_out"] if c["bytes_out"] else math.nan,
+                c["encode_seconds"], c["store_write_seconds"], int(c["chunks_decoded"]), c["bytes_read"] / 1e6,
+                c["store_read_seconds"], c["decode_seconds"], int(c["cache_hits"])))
+        if reads:
+            bytes_read = sum(c["bytes_read"] for c in stats["levels"].values())
+            lines.append("")
+            lines.append("{} reads, {:.1f} KB read per read".format(reads, bytes_read / reads / 1e3))
+        for name in ("encode", "decode"):
+            histogram = stats["{}_latency".format(name)]
+            if sum(histogram):
+                lines.append("{} latency: p50 <= {} us, p99 <= {} us, max <= {} us".format(
+                    name, _percentile(histogram, 50), _percentile(histogram, 99), _percentile(histogram, 100)))
+        return "\n".join(lines)
+
+    def _level(self, level: str) -> Dict[str, float]:
+        counters = self.levels.get(level)
+        if counters is None:
+            counters = self.levels[level] = {key: 0 for key in LEVEL_COUNTERS}
+        return counters
+
+
+def active() -> Optional[IOStats]:
+    """
+    Get the active stats object.
+
+    Returns:
+        Optional[IOStats]: The stats object or None if instrumentation is off.
+    """
+
+    return _active.get()
+
+
+def profile(stats: Optional[IOStats] = None) -> IOStats:
+    """
+    Get a stats object to activate with a with statement, e.g. `with mzarr.profile() as stats: ...`.
+
+    Args:
+        stats (IOStats, optional): A stats object to add to. Defaults to None, which creates a new one.
+
+    Returns:
+        IOStats: The stats object.
+    """
+
+    return stats if stats is not None else IOStats()
+
+
+def phase(name: str) -> ContextManager:
+    """
+    Time a phase if instrumentation is on.
+
+    Args:
+        name (str): The name of the phase.
+
+    Returns:
+        ContextManager: The timer, or a shared no-op context if instrumentation is off.
+    """
+
+    stats = _active.get()
+    if stats is None:
+        return _NO_PHASE
+    return _timed_phase(stats, name)
+
+
+@contextlib.contextmanager
+def _timed_phase(stats: IOStats, name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_phase(name, time.perf_counter() - start)
+
+
+def _bucket(seconds: float) -> int:
+    """
+    Get the latency histogram bucket of a duration.
+
+    Args:
+        seconds (float): The duration.
+
+    Returns:
+        int: The index of the bucket.
+    """
+
+    microseconds = seconds * 1e6
+    if microseconds <= 1:
+        return 0
+    return min(int(math.ceil(math.log2(microseconds))), len(LATENCY_EDGES_US))
+
+
+def _percentile(histogram: list, q: float) -> str:
+    """
+    Get the upper bucket edge of a percentile of a latency histogram.
+
+    Args:
+        histogram (list): The counts of the buckets.
+        q (float): The percentile.
+
+    Returns:
+        str: The upper edge in microseconds.
+    """
+
+    cumulative = np.cumsum(histogram)
+    index = int(np.searchsorted(cumulative, q / 100 * cumulative[-1]))
+    return str(LATENCY_EDGES_US[index]) if index < len(LATENCY_EDGES_US) else ">{}".format(LATENCY_EDGES_US[-1])
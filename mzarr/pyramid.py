@@ -0,0 +1,437 @@
+import numpy as np
+from scipy import ndimage
+from typing import Optional, Tuple, Literal, Any, List
+import math
+
+
+# Sigma and truncation used by skimage.transform.pyramid_reduce for a downscale factor of 2.
+GAUSSIAN_SIGMA = 2 * 2 / 6.0
+GAUSSIAN_TRUNCATE = 4.0
+GAUSSIAN_HALO = int(GAUSSIAN_TRUNCATE * GAUSSIAN_SIGMA + 0.5)
+
+# Pyramid types that reduce every block of 2 elements along each spatial axis to a single element
+BLOCK_TYPES = ("mode", "mean", "max")
+
+
+def level_shape(shape: Tuple[int, ...], channel_axis: Optional[int]) -> Tuple[int, ...]:
+    """
+    Compute the shape of the next coarser pyramid level.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the current pyramid level.
+        channel_axis (Optional[int]): The axis representing channels in the array.
+
+    Returns:
+        Tuple[int, ...]: The shape of the next coarser pyramid level.
+    """
+
+    channel_axis = _normalize_axis(channel_axis, len(shape))
+    return tuple(size if axis == channel_axis else math.ceil(size / 2) for axis, size in enumerate(shape))
+
+
+def downsample(
+        source: Any,
+        region: Tuple[slice, ...],
+        type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'],
+        is_seg: bool,
+        channel_axis: Optional[int]
+) -> np.ndarray:
+    """
+    Compute a region of the next coarser pyramid level from the current pyramid level.
+
+    Only the part of the source that is needed for the region (plus a small halo for the gaussian
+    pyramid) is read, so the source can be a memory-mapped or chunked array that does not fit into memory.
+    The result matches the corresponding region of `Mzarr._create_pyramid`.
+
+    Args:
+        source (Any): The current pyramid level. Can be any array-like that supports slicing.
+        region (Tuple[slice, ...]): The region in the coordinates of the next coarser pyramid level.
+            Every slice must have explicit start and stop values and a step of 1.
+        type (str): The type of pyramid to create ("gaussian", "subsampled", "mode", "mean" or "max").
+        is_seg (bool): Indicates if the array is a segmentation mask.
+        channel_axis (Optional[int]): The axis representing channels in the array.
+
+    Returns:
+        np.ndarray: The region of the next coarser pyramid level.
+    """
+
+    channel_axis = _normalize_axis(channel_axis, len(source.shape))
+    if type == "gaussian":
+        return _downsample_gaussian(source, region, is_seg, channel_axis)
+    if type in BLOCK_TYPES:
+        return _downsample_block(source, region, type, channel_axis)
+    return _downsample_subsampled(source, region, channel_axis)
+
+
+def _downsample_subsampled(source: Any, region: Tuple[slice, ...], channel_axis: Optional[int]) -> np.ndarray:
+    """
+    Compute a region of the next coarser level of a subsampled pyramid.
+
+    Args:
+        source (Any): The current pyramid level.
+        region (Tuple[slice, ...]): The region in the coordinates of the next coarser pyramid level.
+        channel_axis (Optional[int]): The normalized axis representing channels in the array.
+
+    Returns:
+        np.ndarray: The region of the next coarser pyramid level.
+    """
+
+    source_region = []
+    for axis, key in enumerate(region):
+        if axis == channel_axis:
+            source_region.append(key)
+        else:
+            source_region.append(slice(key.start * 2, key.stop * 2, 2))
+    return np.asarray(source[tuple(source_region)])
+
+
+def _downsample_gaussian(source: Any, region: Tuple[slice, ...], is_seg: bool, channel_axis: Optional[int]) -> np.ndarray:
+    """
+    Compute a region of the next coarser level of a gaussian pyramid.
+
+    This reproduces `skimage.transform.pyramid_reduce` on a block: The block is read with a halo large enough
+    for the gaussian kernel and the interpolation, smoothed and then sampled at the global coordinates of
+    the output region.
+
+    Args:
+        source (Any): The current pyramid level.
+        region (Tuple[slice, ...]): The region in the coordinates of the next coarser pyramid level.
+        is_seg (bool): Indicates if the array is a segmentation mask.
+        channel_axis (Optional[int]): The normalized axis representing channels in the array.
+
+    Returns:
+        np.ndarray: The region of the next coarser pyramid level as float array.
+    """
+
+    order = 0 if is_seg else 1
+    out_shape = level_shape(source.shape, channel_axis)
+    source_region, coords, sigma = [], [], []
+    for axis, (key, size, out_size) in enumerate(zip(region, source.shape, out_shape)):
+        if axis == channel_axis:
+            source_region.append(key)
+            coords.append(np.arange(key.stop - key.start, dtype=np.float64))
+            sigma.append(0)
+            continue
+        scale = size / out_size
+        coord = (np.arange(key.start, key.stop) + 0.5) * scale - 0.5
+        start = max(int(math.floor(coord[0])) - GAUSSIAN_HALO, 0)
+        stop = min(int(math.ceil(coord[-1])) + 1 + GAUSSIAN_HALO, size)
+        source_region.append(slice(start, stop))
+        coords.append(coord - start)
+        sigma.append(GAUSSIAN_SIGMA)
+
+    block = np.asarray(source[tuple(source_region)])
+    float_dtype = np.float32 if block.dtype in (np.float16, np.float32) else np.float64
+    block = ndimage.gaussian_filter(block.astype(float_dtype), sigma, mode="reflect", truncate=GAUSSIAN_TRUNCATE)
+    grid = np.meshgrid(*coords, indexing="ij")
+    return ndimage.map_coordinates(block, grid, order=order, mode="mirror")
+
+
+def _downsample_block(
+        source: Any,
+        region: Tuple[slice, ...],
+        type: Literal['mode', 'mean', 'max'],
+        channel_axis: Optional[int]
+) -> np.ndarray:
+    """
+    Compute a region of the next coarser level by reducing every block of 2 elements along each spatial axis.
+
+    The blocks are reduced with NumPy by reshaping the source region into (size, 2) pairs along every spatial
+    axis, so no Python loop runs over the elements. Blocks at the border of an odd-sized axis only contain
+    a single element along that axis. They are padded by repeating the border element, which duplicates every
+    element of the block equally and therefore keeps the mode, mean and maximum of the block unchanged.
+
+    Args:
+        source (Any): The current pyramid level.
+        region (Tuple[slice, ...]): The region in the coordinates of the next coarser pyramid level.
+        type (str): The reduction. "mode" is the majority vote of the labels of a block (ties are resolved to the
+            smallest label), "mean" the mean rounded to the dtype and "max" the maximum.
+        channel_axis (Optional[int]): The normalized axis representing channels in the array.
+
+    Returns:
+        np.ndarray: The region of the next coarser pyramid level with the dtype of the source.
+    """
+
+    source_region, padding = [], []
+    for axis, (key, size) in enumerate(zip(region, source.shape)):
+        if axis == channel_axis:
+            source_region.append(key)
+            padding.append((0, 0))
+        else:
+            stop = min(2 * key.stop, size)
+            source_region.append(slice(2 * key.start, stop))
+            padding.append((0, 2 * (key.stop - key.start) - (stop - 2 * key.start)))
+    block = np.asarray(source[tuple(source_region)])
+    if any(pad[1] > 0 for pad in padding):
+        block = np.pad(block, padding, mode="edge")
+
+    # Split every spatial axis into (size, 2) and move the block axes to the end
+    shape, block_axes = [], []
+    for axis, size in enumerate(block.shape):
+        if axis == channel_axis:
+            shape.append(size)
+        else:
+            shape.extend([size // 2, 2])
+            block_axes.append(len(shape) - 1)
+    if type in ("max", "mean"):
+        # Reduce the pairs of one spatial axis after the other, which only touches every element once per axis
+        n = 2 ** len(block_axes)
+        if type == "mean":
+            block = block.astype(np.float32 if np.issubdtype(block.dtype, np.floating) else np.uint32 if block.dtype.itemsize < 4 else np.uint64)
+        reduce = np.maximum if type == "max" else np.add
+        for axis in range(block.ndim):
+            if axis != channel_axis:
+                index = (slice(None),) * axis
+                block = reduce(block[index + (slice(0, None, 2),)], block[index + (slice(1, None, 2),)])
+        if type == "mean":
+            block = (block + n // 2) // n if np.issubdtype(block.dtype, np.integer) else block / n
+        return block.astype(source.dtype, copy=False)
+
+    blocks = block.reshape(shape)
+
+    # Majority vote: count for every element of a block how often its label occurs in the block. The elements of
+    # the blocks are moved to the first axis, so every comparison is a single vectorized operation over all blocks.
+    kept = [axis for axis in range(len(shape)) if axis not in block_axes]
+    votes = np.ascontiguousarray(blocks.transpose(block_axes + kept)).reshape([-1] + [shape[axis] for axis in kept])
+    counts = np.ones(votes.shape, dtype=np.uint8)
+    for i in range(len(votes)):
+        for j in range(i + 1, len(votes)):
+            equal = votes[i] == votes[j]
+            counts[i] += equal
+            counts[j] += equal
+    best_label, best_count = votes[0].copy(), counts[0].copy()
+    for i in range(1, len(votes)):
+        better = (counts[i] > best_count) | ((counts[i] == best_count) & (votes[i] < best_label))
+        np.copyto(best_label, votes[i], where=better)
+        np.copyto(best_count, counts[i], where=better)
+    return best_label
+
+
+def _normalize_axis(axis: Optional[int], ndim: int) -> Optional[int]:
+    """
+    Normalize a possibly negative axis.
+
+    Args:
+        axis (Optional[int]): The axis.
+        ndim (int): The number of dimensions of the array.
+
+    Returns:
+        Optional[int]: The non-negative axis or None.
+    """
+
+    if axis is not None and axis < 0:
+        axis = ndim + axis
+    return axis
+
+
+def source_rows(
+        start: int,
+        stop: int,
+        size: int,
+        type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'],
+        is_channel_axis: bool
+) -> Tuple[int, int]:
+    """
+    Compute the rows along the first axis of the current pyramid level that `downsample` reads to compute
+    the rows [start, stop) of the next coarser pyramid level.
+
+    Args:
+        start (int): The first row of the next coarser pyramid level.
+        stop (int): The row after the last row of the next coarser pyramid level.
+        size (int): The size of the first axis of the current pyramid level.
+        type (str): The type of pyramid to create ("gaussian", "subsampled", "mode", "mean" or "max").
+        is_channel_axis (bool): Whether the first axis is the channel axis.
+
+    Returns:
+        Tuple[int, int]: The first row and the row after the last row of the current pyramid level.
+    """
+
+    if is_channel_axis:
+        return start, stop
+    if type in BLOCK_TYPES:
+        return 2 * start, min(2 * stop, size)
+    if type == "gaussian":
+        scale = size / math.ceil(size / 2)
+        first, last = (start + 0.5) * scale - 0.5, (stop - 1 + 0.5) * scale - 0.5
+        return max(int(math.floor(first)) - GAUSSIAN_HALO, 0), min(int(math.ceil(last)) + 1 + GAUSSIAN_HALO, size)
+    return 2 * start, 2 * (stop - 1) + 1
+
+
+class RowWindow:
+    def __init__(self, shape: Tuple[int, ...], dtype: Any) -> None:
+        """
+        A window of consecutive rows along the first axis of an array that is only available row by row.
+
+        The window can be sliced with global coordinates like the full array, as long as only rows within the
+        window are accessed. This allows to compute a pyramid level with `downsample` from a stream of rows.
+
+        Args:
+            shape (Tuple[int, ...]): The shape of the full array.
+            dtype (Any): The dtype of the rows.
+        """
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.start = 0
+        self.data = np.empty((0,) + self.shape[1:], dtype=self.dtype)
+
+    @property
+    def stop(self) -> int:
+        return self.start + len(self.data)
+
+    def append(self, rows: np.ndarray) -> None:
+        """
+        Append rows to the end of the window.
+
+        Args:
+            rows (np.ndarray): The rows.
+        """
+
+        self.data = np.concatenate([self.data, rows.astype(self.dtype, copy=False)])
+
+    def drop_before(self, row: int) -> None:
+        """
+        Remove all rows before the given row from the window.
+
+        Args:
+            row (int): The first row that is kept.
+        """
+
+        row = min(row, self.stop)
+        if row > self.start:
+            self.data = self.data[row - self.start:]
+            self.start = row
+
+    def __getitem__(self, key: Tuple[slice, ...]) -> np.ndarray:
+        start, stop, step = key[0].indices(self.shape[0])
+        last = start + (len(range(start, stop, step)) - 1) * step
+        if start < self.start or last >= self.stop:
+            raise RuntimeError("Rows [{}, {}] are not within the window [{}, {}).".format(start, last, self.start, self.stop))
+        return self.data[(slice(start - self.start, stop - self.start, step),) + tuple(key[1:])]
+
+
+def target_rows(
+        start: int,
+        stop: int,
+        size: int,
+        type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'],
+        is_channel_axis: bool
+) -> Tuple[int, int]:
+    """
+    Compute the rows of the next coarser pyramid level that depend on the rows [start, stop) of the current
+    pyramid level. This is the inverse of `source_rows` and may include a few rows more than necessary.
+
+    Args:
+        start (int): The first row of the current pyramid level.
+        stop (int): The row after the last row of the current pyramid level.
+        size (int): The size of the axis of the current pyramid level.
+        type (str): The type of pyramid ("gaussian", "subsampled", "mode", "mean" or "max").
+        is_channel_axis (bool): Whether the axis is the channel axis.
+
+    Returns:
+        Tuple[int, int]: The first row and the row after the last row of the next coarser pyramid level.
+    """
+
+    if is_channel_axis:
+        return start, stop
+    out_size = math.ceil(size / 2)
+    if type == "gaussian":
+        scale = size / out_size
+        first = int(math.floor((start - GAUSSIAN_HALO - 1 + 0.5) / scale - 0.5))
+        last = int(math.ceil((stop + GAUSSIAN_HALO + 0.5) / scale - 0.5))
+        return max(first, 0), min(last + 1, out_size)
+    if type in BLOCK_TYPES:
+        return start // 2, min(math.ceil(stop / 2), out_size)
+    return math.ceil(start / 2), min(math.ceil(stop / 2), out_size)
+
+
+def pyramid_region(
+        base: Any,
+        shapes: List[Tuple[int, ...]],
+        region: Tuple[slice, ...],
+        level: int,
+        type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max'],
+        is_seg: bool,
+        channel_axis: Optional[int]
+) -> np.ndarray:
+    """
+    Compute a region of a pyramid level directly from the base level.
+
+    The region of every intermediate level that is needed is computed recursively with `downsample`, so
+    only a small block of the base level around the region is read. The result matches the corresponding
+    region of `Mzarr._create_pyramid` (as float array for the gaussian pyramid).
+
+    Args:
+        base (Any): The base level. Can be any array-like that supports slicing.
+        shapes (List[Tuple[int, ...]]): The shapes of all pyramid levels.
+        region (Tuple[slice, ...]): The region in the coordinates of the pyramid level. Every slice must have
+            explicit start and stop values and a step of 1.
+        level (int): The pyramid level.
+        type (str): The type of pyramid ("gaussian", "subsampled", "mode", "mean" or "max").
+        is_seg (bool): Indicates if the array is a segmentation mask.
+        channel_axis (Optional[int]): The axis representing channels in the array.
+
+    Returns:
+        np.ndarray: The region of the pyramid level.
+    """
+
+    channel_axis = _normalize_axis(channel_axis, len(shapes[0]))
+    if level == 0:
+        return np.asarray(base[region])
+    source_shape = shapes[level - 1]
+    source_region = tuple(slice(*source_rows(key.start, key.stop, size, type, axis == channel_axis)) for axis, (key, size) in enumerate(zip(region, source_shape)))
+    source = RegionWindow(source_shape, source_region, pyramid_region(base, shapes, source_region, level - 1, type, is_seg, channel_axis))
+    return downsample(source, region, type, is_seg, channel_axis)
+
+
+class RegionWindow:
+    def __init__(self, shape: Tuple[int, ...], region: Tuple[slice, ...], data: np.ndarray) -> None:
+        """
+        A region of an array that can be sliced with the global coordinates of the full array, as long as only
+        elements within the region are accessed.
+
+        Args:
+            shape (Tuple[int, ...]): The shape of the full array.
+            region (Tuple[slice, ...]): The region of the data within the full array.
+            data (np.ndarray): The data of the region.
+        """
+
+        self.shape = tuple(shape)
+        self.region = tuple(region)
+        self.data = data
+        self.dtype = data.dtype
+
+    def __getitem__(self, key: Tuple[slice, ...]) -> np.ndarray:
+        local = []
+        for axis, (k, r, size) in enumerate(zip(key, self.region, self.shape)):
+            start, stop, step = k.indices(size)
+            last = start + (len(range(start, stop, step)) - 1) * step
+            if start < r.start or last >= r.stop:
+                raise RuntimeError("Elements [{}, {}] of axis {} are not within the region [{}, {}).".format(start, last, axis, r.start, r.stop))
+            local.append(slice(start - r.start, stop - r.start, step))
+        return self.data[tuple(local)]
+
+
+def level_coordinates(
+        coords: np.ndarray,
+        factor: int,
+        type: Literal['subsampled', 'gaussian', 'mode', 'mean', 'max']
+) -> np.ndarray:
+    """
+    Map continuous coordinates of the base level to continuous coordinates of a pyramid level along a spatial axis.
+
+    An element of a subsampled level is the base element at `factor` times its index, while an element of all
+    other levels represents the center of a block of `factor` base elements.
+
+    Args:
+        coords (np.ndarray): The coordinates in the base level, where the element i is centered at i.
+        factor (int): The downscale factor of the pyramid level along the axis, see `Mzarr.level_scale`.
+        type (str): The type of pyramid ("gaussian", "subsampled", "mode", "mean" or "max").
+
+    Returns:
+        np.ndarray: The coordinates in the pyramid level.
+    """
+
+    if type == "subsampled":
+        return coords / factor
+    return (coords + 0.5) / factor - 0.5
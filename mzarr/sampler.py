@@ -0,0 +1,339 @@
+import numpy as np
+import zarr
+import os
+import contextvars
+from zarr.indexing import BasicIndexer
+from concurrent.futures import Executor, ThreadPoolExecutor, Future
+from collections import deque
+from typing import Optional, List, Tuple, Union, Literal, Callable, Iterable, Iterator, Dict, Set, Any
+from mzarr.mzarr import Mzarr
+from mzarr.cache import ChunkCache, chunk_key
+from mzarr.chunk_io import load_chunk
+from mzarr.chunking import access_patch
+
+
+# Sampling policies of the patch positions
+POLICIES = ("uniform", "foreground")
+
+
+class PatchSampler:
+    def __init__(
+            self,
+            files: Iterable[Union[str, Mzarr]],
+            patch_shape: Tuple[int, ...],
+            level: int = 0,
+            policy: Union[Literal['uniform', 'foreground'], Callable[[Mzarr, np.random.Generator], Tuple[slice, ...]]] = "uniform",
+            foreground: float = 0.33,
+            label: Optional[int] = None,
+            num_patches: Optional[int] = None,
+            seed: Optional[int] = None,
+            workers: Optional[Union[int, Executor]] = 4,
+            group_size: int = 32,
+            prefetch: int = 2,
+            cache: Optional[ChunkCache] = None
+    ) -> None:
+        """
+        Iterate over random patches of many Mzarr files while the next patches are read in the background.
+
+        The patches are planned ahead in groups of `group_size`: for every patch a file is drawn uniformly and a
+        position is drawn with the sampling policy. The chunks that the patches of a group overlap are then
+        collected, so every chunk is decoded only once per group, no matter how many patches of the group share it.
+        The chunks are decoded in a pool of `workers` threads, while the patches of up to `prefetch` further groups
+        are assembled in a background thread. A decoded chunk is released once the last patch of its group that
+        needs it is assembled, so the memory is bounded by the patches of `prefetch + 1` groups and the chunks of
+        the group in assembly. The patches are returned in the planned random order.
+
+        Args:
+            files (Iterable[Union[str, Mzarr]]): The paths to the Mzarr files or opened Mzarr instances. Paths are
+                opened with mode 'r' on first use.
+            patch_shape (Tuple[int, ...]): The shape of the patches in the pyramid level with or without the channel
+                axis. It is clipped to the shape of smaller arrays, see `access_patch`.
+            level (int, optional): The pyramid level the patches are read from. Defaults to 0.
+            policy (Union[str, Callable], optional): How the patch positions are drawn. 'uniform' draws them uniformly,
+                'foreground' centers a fraction of `foreground` patches on a random position inside a chunk with
+                foreground, which is drawn from the statistics index like `Mzarr.sample_patches` does. A callable gets
+                the Mzarr instance and the random generator and returns the region of a patch in the pyramid level.
+                Defaults to "uniform".
+            foreground (float, optional): The probability of a foreground patch for the 'foreground' policy.
+                Defaults to 0.33.
+            label (int, optional): The label that defines the foreground of segmentation masks for the 'foreground'
+                policy. Defaults to None, which treats every nonzero element as foreground.
+            num_patches (int, optional): The number of patches of an iteration. Defaults to None, which iterates
+                endlessly.
+            seed (int, optional): The seed of the random generator. Defaults to None.
+            workers (Union[int, Executor], optional): The number of threads or an existing thread pool used to decode
+                chunks. Defaults to 4.
+            group_size (int, optional): The number of patches that are planned and read together. Defaults to 32.
+            prefetch (int, optional): The number of groups read ahead. Defaults to 2.
+            cache (ChunkCache, optional): A cache of decoded chunks to reuse chunks across groups, e.g. for small
+                datasets or coarse pyramid levels. Defaults to None.
+
+        Raises:
+            RuntimeError: If the policy is unknown or no files are given.
+        """
+
+        if not callable(policy) and policy not in POLICIES:
+            raise RuntimeError("Unknown sampling policy {}. Supported are {} or a callable.".format(policy, POLICIES))
+        self.files = list(files)
+        if not self.files:
+            raise RuntimeError("The patch sampler needs at least one Mzarr file.")
+        self.patch_shape = tuple(patch_shape)
+        self.level = level
+        self.policy = policy
+        self.foreground = foreground
+        self.label = label
+        self.num_patches = num_patches
+        self.workers = workers
+        self.group_size = group_size
+        self.prefetch = prefetch
+        self.cache = cache
+        self.decoded = 0
+        self.reused = 0
+        self._rng = np.random.default_rng(seed)
+        self._mzarrs: Dict[int, Mzarr] = {}
+        self._foreground: Dict[int, Tuple[Any, List[Tuple[int, ...]], np.ndarray]] = {}
+        self._pool = None
+        self._assembler = None
+        self._futures: Set[Future] = set()
+
+    def __iter__(self) -> Iterator[Tuple[int, Tuple[slice, ...], np.ndarray]]:
+        """
+        Iterate over the patches.
+
+        Yields:
+            Tuple[int, Tuple[slice, ...], np.ndarray]: The index of the file, the region of the patch in the pyramid
+                level and the patch.
+        """
+
+        if self._assembler is None:
+            self._assembler = ThreadPoolExecutor(max_workers=1)
+        remaining = self.num_patches
+        pending = deque()
+        try:
+            while True:
+                while len(pending) <= self.prefetch and remaining != 0:
+                    size = self.group_size if remaining is None else min(self.group_size, remaining)
+                    if remaining is not None:
+                        remaining -= size
+                    group = self.plan(size)
+                    # The background threads run in the context of the consumer, so an active profile records them
+                    future = self._assembler.submit(contextvars.copy_context().run, self._read_group, group)
+                    self._futures.add(future)
+                    future.add_done_callback(self._futures.discard)
+                    pending.append((group, future))
+                if not pending:
+                    return
+                group, future = pending.popleft()
+                for (index, region), patch in zip(group, future.result()):
+                    yield index, region, patch
+        finally:
+            # The consumer stopped early
+            for _, future in pending:
+                future.cancel()
+
+    def plan(self, count: int) -> List[Tuple[int, Tuple[slice, ...]]]:
+        """
+        Draw the files and positions of the next patches.
+
+        Args:
+            count (int): The number of patches.
+
+        Returns:
+            List[Tuple[int, Tuple[slice, ...]]]: The index of the file and the region in the pyramid level of every patch.
+        """
+
+        patches = []
+        for _ in range(count):
+            index = int(self._rng.integers(len(self.files)))
+            patches.append((index, self._sample(index)))
+        return patches
+
+    def close(self) -> None:
+        """
+        Shut down the background threads and close the files opened by the sampler.
+        """
+
+        if self._assembler is not None:
+            # Groups that were prefetched but not started are not read, `shutdown(cancel_futures=True)` needs Python 3.9
+            for future in list(self._futures):
+                future.cancel()
+            self._assembler.shutdown(wait=True)
+            self._assembler = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        for index, mzarr in self._mzarrs.items():
+            if not isinstance(self.files[index], Mzarr):
+                mzarr.close()
+        self._mzarrs = {}
+
+    def __enter__(self) -> "PatchSampler":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _open(self, index: int) -> Mzarr:
+        """
+        Get the Mzarr instance of a file and open it on first use.
+
+        Args:
+            index (int): The index of the file.
+
+        Returns:
+            Mzarr: The Mzarr instance.
+        """
+
+        mzarr = self._mzarrs.get(index)
+        if mzarr is None:
+            file = self.files[index]
+            mzarr = self._mzarrs[index] = file if isinstance(file, Mzarr) else Mzarr(file, mode='r')
+        return mzarr
+
+    def _sample(self, index: int) -> Tuple[slice, ...]:
+        """
+        Draw the position of a patch in a file with the sampling policy.
+
+        Args:
+            index (int): The index of the file.
+
+        Returns:
+            Tuple[slice, ...]: The region of the patch in the pyramid level.
+        """
+
+        mzarr = self._open(index)
+        if callable(self.policy):
+            return tuple(self.policy(mzarr, self._rng))
+        shape = mzarr.level(self.level).shape
+        patch = access_patch(shape, self.patch_shape, mzarr.store.attrs.get("channel_axis") if mzarr.store is not None else None)
+        if self.policy == "foreground" and self._rng.random() < self.foreground:
+            if index not in self._foreground:
+                stats = mzarr._stats()
+                self._foreground[index] = (stats,) + stats.foreground_chunks(self.label)
+            stats, chunks, probabilities = self._foreground[index]
+            if len(chunks) > 0:
+                # The chunks of the index are chunks of the base level
+                region = stats.region(chunks[self._rng.choice(len(chunks), p=probabilities)])
+                scale = mzarr.level_scale(self.level)
+                centers = [self._rng.integers(key.start // s, max(key.stop // s, key.start // s + 1)) for key, s in zip(region, scale)]
+                starts = [min(max(center - p // 2, 0), size - p) for center, p, size in zip(centers, patch, shape)]
+                return tuple(slice(int(start), int(start) + p) for start, p in zip(starts, patch))
+        starts = [self._rng.integers(0, size - p + 1) for p, size in zip(patch, shape)]
+        return tuple(slice(int(start), int(start) + p) for start, p in zip(starts, patch))
+
+    def _read_group(self, group: List[Tuple[int, Tuple[slice, ...]]]) -> List[np.ndarray]:
+        """
+        Read the patches of a group, decoding every chunk they overlap only once. Runs in the background thread.
+
+        Args:
+            group (List[Tuple[int, Tuple[slice, ...]]]): The index of the file and the region of every patch.
+
+        Returns:
+            List[np.ndarray]: The patches.
+        """
+
+        # Plan the chunk reads of all patches, so the decoding of all chunks starts before the first patch is assembled
+        plans, chunks, uses = [], {}, {}
+        for index, region in group:
+            array = self._open(index).level(self.level)
+            if not isinstance(array, zarr.Array):
+                plans.append((array, None))
+                continue
+            indexer = BasicIndexer(region, array)
+            plans.append((array, indexer))
+            for chunk_coords, _, _ in indexer:
+                key = (index, chunk_coords)
+                if key in chunks:
+                    self.reused += 1
+                else:
+                    chunks[key] = self._load(index, array, chunk_coords)
+                uses[key] = uses.get(key, 0) + 1
+
+        patches = []
+        for (index, region), (array, indexer) in zip(group, plans):
+            if indexer is None:
+                patches.append(np.array(array[region]))
+                continue
+            out = np.empty(indexer.shape, dtype=array.dtype)
+            for chunk_coords, chunk_selection, out_selection in indexer:
+                key = (index, chunk_coords)
+                chunk = chunks[key].result()
+                if chunk is None:
+                    if array.fill_value is not None:
+                        out[out_selection] = array.fill_value
+                else:
+                    out[out_selection] = chunk[chunk_selection]
+                # Release the decoded chunk after its last use in the group
+                uses[key] -= 1
+                if uses[key] == 0:
+                    del chunks[key]
+            patches.append(out)
+        return patches
+
+    def _load(self, index: int, array: zarr.Array, chunk_coords: Tuple[int, ...]) -> Future:
+        """
+        Start loading a chunk in the pool.
+
+        Args:
+            index (int): The index of the file.
+            array (zarr.Array): The array the chunk belongs to.
+            chunk_coords (Tuple[int, ...]): The chunk coordinates.
+
+        Returns:
+            Future: The future of the decoded chunk or None if the chunk is not stored.
+        """
+
+        key = None
+        if self.cache is not None:
+            key = chunk_key(os.path.abspath(self._open(index).path), array.path, chunk_coords)
+            chunk = self.cache.get(key)
+            if chunk is not None:
+                future = Future()
+                future.set_result(chunk)
+                return future
+        self.decoded += 1
+        executor = self._executor()
+        if executor is None:
+            future = Future()
+            future.set_result(_load_cached(array, chunk_coords, self.cache, key))
+            return future
+        return executor.submit(contextvars.copy_context().run, _load_cached, array, chunk_coords, self.cache, key)
+
+    def _executor(self) -> Optional[Executor]:
+        """
+        Get the pool used to decode chunks, which is created on first use for a number of workers.
+
+        Returns:
+            Optional[Executor]: The pool or None to decode in the background thread.
+        """
+
+        if self.workers is None or isinstance(self.workers, Executor):
+            return self.workers
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+
+def _load_cached(
+        array: zarr.Array,
+        chunk_coords: Tuple[int, ...],
+        cache: Optional[ChunkCache] = None,
+        key: Optional[Any] = None
+) -> Optional[np.ndarray]:
+    """
+    Load a chunk and add it to the cache, see `load_chunk`.
+
+    Args:
+        array (zarr.Array): The array the chunk belongs to.
+        chunk_coords (Tuple[int, ...]): The chunk coordinates.
+        cache (ChunkCache, optional): The cache of decoded chunks. Defaults to None.
+        key (Any, optional): The key of the chunk in the cache. Defaults to None.
+
+    Returns:
+        Optional[np.ndarray]: The decoded chunk or None if the chunk is not stored.
+    """
+
+    chunk = load_chunk(array, chunk_coords)
+    if cache is not None and chunk is not None:
+        cache.put(key, chunk)
+    return chunk
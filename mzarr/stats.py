@@ -0,0 +1,321 @@
+import numpy as np
+import zarr
+from typing import Optional, Tuple, List, Any
+from mzarr.chunk_io import iter_chunks
+import math
+
+
+# Path of the group that holds the index arrays
+STATS_PATH = "stats"
+# Fields of the summary array, one value per chunk each
+SUMMARY_FIELDS = ("count", "nonzero", "min", "max", "sum", "sumsq")
+# Number of bins of the coarse histogram of every chunk
+NUM_BINS = 64
+# Labels from 0 to MAX_LABEL - 1 get their own bit in the label bitmap, all others share a single overflow bit
+MAX_LABEL = 256
+
+
+class ChunkStats:
+    def __init__(
+            self,
+            shape: Tuple[int, ...],
+            chunks: Tuple[int, ...],
+            edges: Tuple[float, float],
+            is_seg: bool = False
+    ) -> None:
+        """
+        An index of statistics of every chunk of the base level.
+
+        For every chunk, the number of finite elements, the number of nonzero elements, the minimum, the maximum, the
+        sum and the sum of squares are stored in a summary array, along with a coarse histogram of 64 bins between fixed
+        edges. Values outside the edges are counted in the outer bins. For segmentation masks, a bitmap records
+        which labels are present in the chunk. The index only takes a few hundred bytes per chunk, so global
+        statistics, the chunks containing a label and foreground-biased patch positions can be answered without
+        decoding any image data.
+
+        Args:
+            shape (Tuple[int, ...]): The shape of the base level.
+            chunks (Tuple[int, ...]): The chunk shape of the base level.
+            edges (Tuple[float, float]): The lower and upper edge of the histogram.
+            is_seg (bool, optional): Whether the array is a segmentation mask, which adds the label bitmap.
+                Defaults to False.
+        """
+
+        self.shape = tuple(shape)
+        self.chunks = tuple(chunks)
+        lower, upper = float(edges[0]), float(edges[1])
+        self.edges = (lower, upper if upper > lower else lower + 1.0)
+        self.is_seg = is_seg
+        grid = tuple(math.ceil(s / c) for s, c in zip(self.shape, self.chunks))
+        self.summary = np.zeros(grid + (len(SUMMARY_FIELDS),), dtype=np.float64)
+        self.histogram = np.zeros(grid + (NUM_BINS,), dtype=np.uint64)
+        self.labels = np.zeros(grid + ((MAX_LABEL + 1 + 7) // 8,), dtype=np.uint8) if is_seg else None
+
+    def update(self, coords: Tuple[int, ...], block: np.ndarray) -> None:
+        """
+        Compute the statistics of a chunk and replace its previous statistics.
+
+        Args:
+            coords (Tuple[int, ...]): The chunk coordinates.
+            block (np.ndarray): The data of the chunk, without padding at the border. Non-finite values (NaN and
+                infinity) are left out of the summary and the histogram.
+        """
+
+        block = np.asarray(block)
+        values = block.ravel()
+        if values.size == 0:
+            return
+        if values.dtype.kind in "fc":
+            values = values[np.isfinite(values)]
+            if values.size == 0:
+                self.summary[coords] = 0
+                self.histogram[coords] = 0
+                if self.labels is not None:
+                    self.labels[coords] = np.packbits(_label_presence(block.ravel()))
+                return
+        self.summary[coords] = (
+            values.size,
+            np.count_nonzero(values),
+            values.min(),
+            values.max(),
+            values.sum(dtype=np.float64),
+            np.dot(values.astype(np.float64), values.astype(np.float64)),
+        )
+        lower, upper = self.edges
+        bins = (values.astype(np.float64) - lower) * (NUM_BINS / (upper - lower))
+        bins = np.clip(bins, 0, NUM_BINS - 1).astype(np.intp)
+        self.histogram[coords] = np.bincount(bins, minlength=NUM_BINS)
+        if self.labels is not None:
+            self.labels[coords] = np.packbits(_label_presence(block.ravel()))
+
+    def write(self, grp: zarr.Group) -> dict:
+        """
+        Write the index arrays to a group, replacing an existing index.
+
+        Args:
+            grp (zarr.Group): The root group of the Mzarr file.
+
+        Returns:
+            dict: The attributes that describe the index, which are stored as 'stats' in the root group.
+        """
+
+        arrays = {"summary": self.summary, "histogram": self.histogram}
+        if self.labels is not None:
+            arrays["labels"] = self.labels
+        for name, data in arrays.items():
+            path = "{}/{}".format(STATS_PATH, name)
+            if path in grp:
+                grp[path][...] = data
+            else:
+                grp.create_dataset(path, data=data, chunks=data.shape, compressor=None)
+        return {
+            "path": STATS_PATH,
+            "chunks": list(self.chunks),
+            "fields": list(SUMMARY_FIELDS),
+            "edges": list(self.edges),
+            "bins": NUM_BINS,
+            "max_label": MAX_LABEL if self.is_seg else None,
+        }
+
+    @classmethod
+    def load(cls, grp: zarr.Group) -> Optional["ChunkStats"]:
+        """
+        Load the index from the root group of a Mzarr file.
+
+        Args:
+            grp (zarr.Group): The root group.
+
+        Returns:
+            Optional[ChunkStats]: The index or None if the file has no index.
+        """
+
+        attrs = grp.attrs.get("stats")
+        if attrs is None:
+            return None
+        stats = cls.__new__(cls)
+        stats.shape = tuple(grp["base"].shape)
+        stats.chunks = tuple(attrs["chunks"])
+        stats.edges = tuple(attrs["edges"])
+        stats.is_seg = attrs["max_label"] is not None
+        stats.summary = grp["{}/summary".format(attrs["path"])][...]
+        stats.histogram = grp["{}/histogram".format(attrs["path"])][...]
+        stats.labels = grp["{}/labels".format(attrs["path"])][...] if stats.is_seg else None
+        return stats
+
+    def global_stats(self) -> dict:
+        """
+        Combine the statistics of all chunks.
+
+        Returns:
+            dict: The 'count', 'nonzero', 'min', 'max', 'mean' and 'std' of the whole array, its 'histogram' and the
+                histogram 'edges' (NUM_BINS + 1 values) and, for segmentation masks, the 'labels' that are present
+                (labels of MAX_LABEL and above are not listed individually).
+        """
+
+        summary = self.summary.reshape(-1, len(SUMMARY_FIELDS))
+        summary = summary[summary[:, 0] > 0]
+        count, nonzero, _, _, total, squares = summary.sum(axis=0)
+        mean = total / max(count, 1)
+        result = {
+            "count": int(count),
+            "nonzero": int(nonzero),
+            "min": float(summary[:, 2].min()) if len(summary) > 0 else math.nan,
+            "max": float(summary[:, 3].max()) if len(summary) > 0 else math.nan,
+            "mean": float(mean),
+            "std": float(math.sqrt(max(squares / max(count, 1) - mean ** 2, 0.0))),
+            "histogram": self.histogram.reshape(-1, NUM_BINS).sum(axis=0),
+            "edges": np.linspace(self.edges[0], self.edges[1], NUM_BINS + 1),
+        }
+        if self.labels is not None:
+            present = np.unpackbits(np.bitwise_or.reduce(self.labels.reshape(-1, self.labels.shape[-1]), axis=0))
+            result["labels"] = [int(label) for label in np.flatnonzero(present[:MAX_LABEL])]
+        return result
+
+    def chunks_with_label(self, label: int) -> List[Tuple[int, ...]]:
+        """
+        Find the chunks that contain a label.
+
+        Labels from MAX_LABEL on share a single bit, so for them the chunks that contain any such label are returned.
+
+        Args:
+            label (int): The label.
+
+        Returns:
+            List[Tuple[int, ...]]: The coordinates of the chunks in C-order.
+
+        Raises:
+            RuntimeError: If the index has no label bitmap, i.e. the array is not a segmentation mask.
+        """
+
+        if self.labels is None:
+            raise RuntimeError("The statistics index has no label bitmap, as the array is not a segmentation mask.")
+        bit = label if 0 <= label < MAX_LABEL else MAX_LABEL
+        present = (self.labels[..., bit // 8] >> (7 - bit % 8)) & 1
+        return [tuple(int(i) for i in coords) for coords in np.argwhere(present)]
+
+    def foreground_chunks(self, label: Optional[int] = None) -> Tuple[List[Tuple[int, ...]], np.ndarray]:
+        """
+        Find the chunks with foreground and weight them by the amount of foreground they contain.
+
+        Args:
+            label (int, optional): Only consider the chunks containing this label, which are weighted equally.
+                Defaults to None, which considers the chunks with nonzero elements weighted by their number.
+
+        Returns:
+            Tuple[List[Tuple[int, ...]], np.ndarray]: The coordinates of the chunks and their sampling probabilities.
+        """
+
+        if label is not None:
+            chunks = self.chunks_with_label(label)
+            return chunks, np.full(len(chunks), 1 / max(len(chunks), 1))
+        nonzero = self.summary[..., 1]
+        chunks = [tuple(int(i) for i in coords) for coords in np.argwhere(nonzero > 0)]
+        weights = np.array([nonzero[coords] for coords in chunks], dtype=np.float64)
+        return chunks, weights / max(weights.sum(), 1)
+
+    def region(self, coords: Tuple[int, ...]) -> Tuple[slice, ...]:
+        """
+        Get the region of a chunk in the base level.
+
+        Args:
+            coords (Tuple[int, ...]): The chunk coordinates.
+
+        Returns:
+            Tuple[slice, ...]: The region of the chunk.
+        """
+
+        return tuple(slice(i * c, min((i + 1) * c, s)) for i, c, s in zip(coords, self.chunks, self.shape))
+
+
+def compute_stats(
+        array: Any,
+        chunks: Tuple[int, ...],
+        is_seg: bool = False,
+        edges: Optional[Tuple[float, float]] = None
+) -> ChunkStats:
+    """
+    Compute the index of an array chunk by chunk.
+
+    Args:
+        array (Any): The base level. Can be any array-like that supports slicing.
+        chunks (Tuple[int, ...]): The chunk shape of the base level.
+        is_seg (bool, optional): Whether the array is a segmentation mask. Defaults to False.
+        edges (Tuple[float, float], optional): The edges of the histogram. Defaults to None, which uses the
+            minimum and maximum of the array and hence reads it twice.
+
+    Returns:
+        ChunkStats: The index.
+    """
+
+    if edges is None:
+        edges = chunked_range(array, chunks)
+    stats = ChunkStats(array.shape, chunks, edges, is_seg)
+    for coords, region in iter_chunks(array.shape, chunks):
+        stats.update(coords, array[region])
+    return stats
+
+
+def chunked_range(array: Any, chunks: Tuple[int, ...]) -> Tuple[float, float]:
+    """
+    Compute the minimum and maximum of the finite values of an array chunk by chunk, see `finite_range`.
+
+    Args:
+        array (Any): The array. Can be any array-like that supports slicing.
+        chunks (Tuple[int, ...]): The shape of the chunks that are read one at a time.
+
+    Returns:
+        Tuple[float, float]: The minimum and maximum, or (0.0, 1.0) if the array has no finite values.
+    """
+
+    edges = (math.inf, -math.inf)
+    for _, region in iter_chunks(array.shape, chunks):
+        lower, upper = finite_range(array[region])
+        edges = (min(edges[0], lower), max(edges[1], upper))
+    if edges[0] > edges[1]:
+        edges = (0.0, 1.0)
+    return edges
+
+
+def finite_range(array: np.ndarray, default: Tuple[float, float] = (math.inf, -math.inf)) -> Tuple[float, float]:
+    """
+    Compute the minimum and maximum of the finite values of an array, e.g. for the edges of the histogram.
+
+    Args:
+        array (np.ndarray): The array.
+        default (Tuple[float, float], optional): The range returned if the array has no finite values. Defaults to
+            (inf, -inf), which is neutral when combining ranges.
+
+    Returns:
+        Tuple[float, float]: The minimum and maximum.
+    """
+
+    values = np.asarray(array)
+    if values.dtype.kind in "fc":
+        values = values[np.isfinite(values)]
+    if values.size == 0:
+        return default
+    return float(values.min()), float(values.max())
+
+
+def _label_presence(values: np.ndarray) -> np.ndarray:
+    """
+    Compute which labels are present in the elements of a chunk.
+
+    Args:
+        values (np.ndarray): The flat elements of the chunk.
+
+    Returns:
+        np.ndarray: MAX_LABEL + 1 booleans, one per label and one for all other labels.
+    """
+
+    presence = np.zeros(MAX_LABEL + 1, dtype=bool)
+    if np.issubdtype(values.dtype, np.integer) and values.min() >= 0 and values.max() <= np.iinfo(np.uint16).max:
+        counts = np.bincount(values.astype(np.intp, copy=False))
+        presence[:min(len(counts), MAX_LABEL)] = counts[:MAX_LABEL] > 0
+        presence[MAX_LABEL] = np.any(counts[MAX_LABEL:])
+        return presence
+    labels = np.unique(values)
+    inside = (labels >= 0) & (labels < MAX_LABEL) & (labels == np.floor(labels))
+    presence[labels[inside].astype(np.intp)] = True
+    presence[MAX_LABEL] = not np.all(inside)
+    return presence
@@ -0,0 +1,885 @@
+import contextlib
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import warnings
+import zipfile
+import zlib
+from typing import Optional, Iterator, Iterable, Dict, Tuple, Union, List
+import numpy as np
+import zarr
+from numcodecs.compat import ensure_contiguous_ndarray
+from zarr.storage import Store, normalize_storage_path, _listdir_from_keys
+from zarr.errors import ReadOnlyError
+from zarr.util import json_dumps
+
+
+# Signature and layout of a zip local file header, see the PKWARE APPNOTE section 4.3.7
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+# Signature and layout of a central directory file header, see section 4.3.12
+_CENTRAL_DIRECTORY = struct.Struct("<4s4B4HL2L5H2L")
+_CENTRAL_DIRECTORY_SIGNATURE = b"PK\001\002"
+# Signature and layout of the end of central directory record and its zip64 counterparts, see section 4.3.14 - 4.3.16
+_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\005\006"
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+_ZIP64_LOCATOR_SIGNATURE = b"PK\006\007"
+_ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4sQ2H2L4Q")
+# Metadata is returned as bytes, as zarr decodes it with the json module
+_METADATA_KEYS = (".zarray", ".zgroup", ".zattrs", ".zmetadata")
+# Key of the consolidated metadata, which is the same as the one of zarr.consolidate_metadata
+CONSOLIDATED_KEY = ".zmetadata"
+# Number of bytes read from the end of a file to reach the consolidated metadata in one read
+TAIL_BYTES = 64 * 1024
+# Fraction of a zip file that stale members must make up before `Mzarr.flush` compacts it by default
+COMPACT_STALE_FRACTION = 0.5
+# Storage layouts of Mzarr files: a single zip file, a directory with a file per chunk or a directory of shard files
+LAYOUTS = ("zip", "directory", "sharded")
+# Name of the file that marks a directory as sharded store and holds its configuration
+SHARDS_KEY = ".zshards"
+# Default number of chunks per shard along every axis
+SHARD_CHUNKS = 4
+# Footer of a shard file with a magic number and the number of index entries, which precede the footer
+_SHARD_FOOTER = struct.Struct("<8sQ")
+_SHARD_MAGIC = b"MZSHARD1"
+_SHARD_EXTENSION = ".shard"
+# Offset of the index entries of chunks that are not stored in a shard
+_MISSING = np.iinfo(np.uint64).max
+# Chunk keys of zarr arrays end with the chunk coordinates separated by dots, e.g. 'base/0.3.1'
+_CHUNK_NAME = re.compile(r"^\d+(\.\d+)*$")
+
+
+class MmapZipStore(Store):
+    def __init__(self, path: str) -> None:
+        """
+        A read-only zarr store of a zip file that memory-maps the archive.
+
+        The central directory is parsed once on initialization. Reading a member then only slices the memory map,
+        so no lock is needed and any number of threads can read in parallel. Uncompressed members, which is
+        how Mzarr files are written, are returned as read-only memoryviews into the memory map without copying.
+        Deflated members are decompressed from the memory map.
+
+        Args:
+            path (str): The path to the zip file.
+        """
+
+        self.path = os.path.abspath(path)
+        self.mode = "r"
+        self._members: Dict[str, Tuple[int, int, int, int]] = {}
+        with open(self.path, "rb") as f:
+            with zipfile.ZipFile(f) as zf:
+                infos = zf.infolist()
+            size = os.fstat(f.fileno()).st_size
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+        self._view = memoryview(self._mmap) if self._mmap is not None else memoryview(b"")
+        for info in infos:
+            header = _LOCAL_HEADER.unpack_from(self._view, info.header_offset)
+            if header[0] != _LOCAL_HEADER_SIGNATURE:
+                raise RuntimeError("Bad local file header of member {} in {}.".format(info.filename, self.path))
+            offset = info.header_offset + _LOCAL_HEADER.size + header[-2] + header[-1]
+            self._members[info.filename] = (offset, info.compress_size, info.file_size, info.compress_type)
+
+    def __getitem__(self, key: str) -> Union[memoryview, bytes]:
+        offset, compress_size, file_size, compress_type = self._members[key]  # will raise KeyError
+        data = self._view[offset:offset + compress_size]
+        if compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS, file_size)
+        elif compress_type != zipfile.ZIP_STORED:
+            raise RuntimeError("Member {} of {} uses the unsupported zip compression {}.".format(key, self.path, compress_type))
+        if key.endswith(_METADATA_KEYS):
+            return bytes(data)
+        return data
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        raise ReadOnlyError()
+
+    def __delitem__(self, key: str) -> None:
+        raise ReadOnlyError()
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._members
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(sorted(self._members))
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def keys(self) -> Iterator[str]:
+        return iter(sorted(self._members))
+
+    def listdir(self, path: Optional[str] = None) -> list:
+        return _listdir_from_keys(self, normalize_storage_path(path))
+
+    def getsize(self, path: Optional[str] = None) -> int:
+        path = normalize_storage_path(path)
+        if path in self._members:
+            return self._members[path][1]
+        prefix = path + "/" if path else ""
+        return sum(member[1] for key, member in self._members.items() if key.startswith(prefix) and "/" not in key[len(prefix):])
+
+    def close(self) -> None:
+        """
+        Release the memory map. Chunks that are still referenced keep it alive until they are freed.
+        """
+
+        _release(self._view, self._mmap)
+
+    def __getstate__(self) -> str:
+        return self.path
+
+    def __setstate__(self, state: str) -> None:
+        self.__init__(state)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, MmapZipStore) and self.path == other.path
+
+    def __enter__(self) -> "MmapZipStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class ShardedStore(Store):
+    def __init__(self, path: str, mode: str = 'a', chunks_per_shard: Optional[int] = None) -> None:
+        """
+        A zarr store of a directory that packs the chunks of every array into shard files.
+
+        Metadata is stored as plain files like in a `zarr.DirectoryStore`. The chunk grid of every array is split into
+        blocks of `chunks_per_shard` chunks along every axis and all chunks of a block are stored in one shard file,
+        e.g. with 4 chunks per shard the chunk 'base/5.2.7' in 'base/1.0.1.shard'. A shard file holds the encoded
+        chunks, followed by an index with the offset and length of every chunk and a footer. This keeps the number
+        of files small, while chunks of different shards are written in parallel and every chunk is read with a
+        single read at a known offset.
+
+        A chunk that is written again is updated in place if it fits into its previous copy and appended to the shard
+        otherwise, which leaves a stale copy behind until the file is repacked, see `Mzarr.repack`. The indexes of
+        the shards are written on `flush` and `close`, so a store opened for writing must be closed. In read-only
+        mode ('r') the shards are memory-mapped and chunks are returned as memoryviews without copying, like
+        `MmapZipStore` does.
+
+        Args:
+            path (str): The path to the directory.
+            mode (str, optional): 'r' means read only (must exist); 'r+' means read/write (must exist);
+                'a' means read/write (create if doesn't exist); 'w' means create (overwrite if exists);
+                'w-' means create (fail if exists). Defaults to 'a'.
+            chunks_per_shard (int, optional): The number of chunks per shard along every axis of a new store.
+                Defaults to None, which uses the configuration of an existing store or SHARD_CHUNKS.
+
+        Raises:
+            RuntimeError: If the mode does not match the existence of the store, or if `chunks_per_shard` differs
+                from the configuration of an existing store.
+        """
+
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._shards: Dict[str, _Shard] = {}
+        config_path = os.path.join(self.path, SHARDS_KEY)
+        exists = os.path.isfile(config_path)
+        if mode in ('r', 'r+') and not exists:
+            raise RuntimeError("No sharded Mzarr file exists under {}".format(path))
+        if mode == 'w-' and os.path.exists(self.path):
+            raise RuntimeError("A file already exists under {}".format(path))
+        if mode == 'w' and os.path.exists(self.path):
+            shutil.rmtree(self.path)
+            exists = False
+        if exists:
+            with open(config_path, "rb") as f:
+                config = json.load(f)
+            if chunks_per_shard is not None and chunks_per_shard != config["chunks_per_shard"]:
+                raise RuntimeError("The sharded Mzarr file under {} uses {} chunks per shard, not {}.".format(path, config["chunks_per_shard"], chunks_per_shard))
+            self.chunks_per_shard = config["chunks_per_shard"]
+        else:
+            self.chunks_per_shard = chunks_per_shard or SHARD_CHUNKS
+            self._write_file(SHARDS_KEY, json_dumps({"version": 1, "chunks_per_shard": self.chunks_per_shard}))
+
+    def __getitem__(self, key: str) -> Union[memoryview, bytes]:
+        location = self._locate(key)
+        if location is None:
+            try:
+                with open(self._file_path(key), "rb") as f:
+                    return f.read()
+            except (FileNotFoundError, IsADirectoryError, NotADirectoryError) as error:
+                raise KeyError(key) from error
+        shard = self._shard(*location[:2])
+        if shard is None:
+            raise KeyError(key)
+        return shard.read(location[2], key)
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        if self.mode == 'r':
+            raise ReadOnlyError()
+        location = self._locate(key)
+        if location is None:
+            self._write_file(key, value)
+        else:
+            self._shard(*location[:2], create=True).write(location[2], ensure_contiguous_ndarray(value).view(np.uint8))
+
+    def __delitem__(self, key: str) -> None:
+        if self.mode == 'r':
+            raise ReadOnlyError()
+        location = self._locate(key)
+        if location is None:
+            try:
+                os.remove(self._file_path(key))
+            except FileNotFoundError as error:
+                raise KeyError(key) from error
+            return
+        shard = self._shard(*location[:2])
+        if shard is None:
+            raise KeyError(key)
+        shard.delete(location[2], key)
+
+    def __contains__(self, key: object) -> bool:
+        if not isinstance(key, str):
+            return False
+        location = self._locate(key)
+        if location is None:
+            return os.path.isfile(self._file_path(key))
+        shard = self._shard(*location[:2])
+        return shard is not None and shard.contains(location[2])
+
+    def __iter__(self) -> Iterator[str]:
+        return self.keys()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.keys())
+
+    def keys(self) -> Iterator[str]:
+        for directory, dirnames, filenames in os.walk(self.path):
+            dirnames.sort()
+            relative = os.path.relpath(directory, self.path)
+            prefix = "" if relative == "." else relative.replace(os.sep, "/") + "/"
+            for name in sorted(filenames):
+                if name.endswith(_SHARD_EXTENSION):
+                    yield from (prefix + chunk for chunk in self._shard_chunks(prefix + name))
+                elif self._is_key(name):
+                    yield prefix + name
+
+    def listdir(self, path: Optional[str] = None) -> List[str]:
+        path = normalize_storage_path(path)
+        directory = self._file_path(path)
+        if not os.path.isdir(directory):
+            return []
+        prefix = path + "/" if path else ""
+        names = []
+        for name in os.listdir(directory):
+            if name.endswith(_SHARD_EXTENSION):
+                names.extend(self._shard_chunks(prefix + name))
+            elif self._is_key(name):
+                names.append(name)
+        return sorted(names)
+
+    def rmdir(self, path: Optional[str] = None) -> None:
+        if self.mode == 'r':
+            raise ReadOnlyError()
+        path = normalize_storage_path(path)
+        prefix = path + "/" if path else ""
+        with self._lock:
+            for shard_key in [shard_key for shard_key in self._shards if shard_key.startswith(prefix)]:
+                self._shards.pop(shard_key).close(write_index=False)
+        directory = self._file_path(path)
+        if not os.path.isdir(directory):
+            return
+        if path:
+            shutil.rmtree(directory)
+            return
+        # The configuration of the root stays
+        for name in os.listdir(directory):
+            if name != SHARDS_KEY:
+                entry = os.path.join(directory, name)
+                if os.path.isdir(entry):
+                    shutil.rmtree(entry)
+                else:
+                    os.remove(entry)
+
+    def getsize(self, path: Optional[str] = None) -> int:
+        path = normalize_storage_path(path)
+        location = self._locate(path) if path else None
+        if location is not None:
+            shard = self._shard(*location[:2])
+            return shard.size(location[2]) if shard is not None else 0
+        file_path = self._file_path(path)
+        if os.path.isfile(file_path):
+            return os.path.getsize(file_path)
+        if os.path.isdir(file_path):
+            self.flush()
+            return sum(os.path.getsize(os.path.join(file_path, name)) for name in os.listdir(file_path) if os.path.isfile(os.path.join(file_path, name)))
+        return 0
+
+    def flush(self) -> None:
+        """
+        Write the indexes of all shards that were written to.
+        """
+
+        with self._lock:
+            shards = list(self._shards.values())
+        for shard in shards:
+            shard.flush()
+
+    def close(self) -> None:
+        """
+        Write the indexes of all shards that were written to and close the shard files. The store can still be used,
+        the shard files are opened again on the next access.
+        """
+
+        with self._lock:
+            shards, self._shards = self._shards, {}
+        for shard in shards.values():
+            shard.close()
+
+    def _locate(self, key: str) -> Optional[Tuple[str, int, int]]:
+        """
+        Find the shard of a chunk key.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            Optional[Tuple[str, int, int]]: The key of the shard file, the number of dimensions and the index of the
+                chunk in the shard, or None if the key is not a chunk key.
+        """
+
+        prefix, _, name = key.rpartition("/")
+        if not _CHUNK_NAME.match(name):
+            return None
+        coords = [int(c) for c in name.split(".")]
+        index = 0
+        for c in coords:
+            index = index * self.chunks_per_shard + c % self.chunks_per_shard
+        shard_name = ".".join(str(c // self.chunks_per_shard) for c in coords) + _SHARD_EXTENSION
+        return (prefix + "/" + shard_name if prefix else shard_name), len(coords), index
+
+    def _shard(self, shard_key: str, ndim: int, create: bool = False) -> Optional["_Shard"]:
+        """
+        Get an opened shard file.
+
+        Args:
+            shard_key (str): The key of the shard file.
+            ndim (int): The number of dimensions of the array.
+            create (bool, optional): Whether to create the shard file if it does not exist. Defaults to False.
+
+        Returns:
+            Optional[_Shard]: The shard or None if it does not exist and is not created.
+        """
+
+        shard = self._shards.get(shard_key)
+        if shard is not None:
+            return shard
+        with self._lock:
+            shard = self._shards.get(shard_key)
+            if shard is None:
+                file_path = self._file_path(shard_key)
+                if not os.path.isfile(file_path):
+                    if not create:
+                        return None
+                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                shard = self._shards[shard_key] = _Shard(file_path, self.chunks_per_shard ** ndim, self.mode == 'r')
+        return shard
+
+    def _shard_chunks(self, shard_key: str) -> List[str]:
+        """
+        List the names of the chunks stored in a shard file.
+
+        Args:
+            shard_key (str): The key of the shard file.
+
+        Returns:
+            List[str]: The names of the chunks without the path of the array, e.g. '5.2.7'.
+        """
+
+        shard_coords = [int(c) for c in shard_key.rpartition("/")[2][:-len(_SHARD_EXTENSION)].split(".")]
+        shard = self._shard(shard_key, len(shard_coords))
+        grid = (self.chunks_per_shard,) * len(shard_coords)
+        chunks = []
+        for index in shard.stored():
+            local = np.unravel_index(index, grid)
+            chunks.append(".".join(str(s * self.chunks_per_shard + int(c)) for s, c in zip(shard_coords, local)))
+        return chunks
+
+    def _is_key(self, name: str) -> bool:
+        # The configuration and temporary files of interrupted writes are not part of the zarr hierarchy
+        return name != SHARDS_KEY and not name.endswith(".partial")
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self.path, *key.split("/")) if key else self.path
+
+    def _write_file(self, key: str, value: bytes) -> None:
+        """
+        Atomically write a file that is not a chunk, e.g. metadata.
+
+        Args:
+            key (str): The key of the file.
+            value (bytes): The content.
+        """
+
+        file_path = self._file_path(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        fd, partial_path = tempfile.mkstemp(suffix=".partial", prefix=".", dir=os.path.dirname(file_path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(ensure_contiguous_ndarray(value))
+            os.replace(partial_path, file_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+    def __getstate__(self) -> Tuple[str, str, int]:
+        self.flush()
+        return self.path, self.mode, self.chunks_per_shard
+
+    def __setstate__(self, state: Tuple[str, str, int]) -> None:
+        path, mode, chunks_per_shard = state
+        # A store that was created by the pickled instance is not created again
+        self.__init__(path, 'a' if mode in ('w', 'w-') else mode, chunks_per_shard)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ShardedStore) and self.path == other.path
+
+    def __enter__(self) -> "ShardedStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class _Shard:
+    def __init__(self, path: str, num_chunks: int, readonly: bool) -> None:
+        """
+        A shard file of a `ShardedStore`.
+
+        Args:
+            path (str): The path to the shard file.
+            num_chunks (int): The number of chunks of the shard.
+            readonly (bool): Whether the shard is memory-mapped for reading.
+
+        Raises:
+            RuntimeError: If the shard file has no valid index.
+        """
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.dirty = False
+        self._file = None
+        self._mmap = None
+        self._view = None
+        # The file stays open (or mapped) until the shard is closed, unless the index is invalid
+        with contextlib.ExitStack() as stack:
+            if readonly:
+                with open(path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+                self._view = memoryview(self._mmap) if self._mmap is not None else memoryview(b"")
+                stack.callback(_release, self._view, self._mmap)
+                tail = self._view
+            else:
+                self._file = stack.enter_context(open(path, "r+b" if os.path.exists(path) else "w+b"))
+                size = self._file.seek(0, os.SEEK_END)
+                index_bytes = num_chunks * 16 + _SHARD_FOOTER.size
+                self._file.seek(max(0, size - index_bytes))
+                tail = self._file.read()
+            if size == 0:
+                self.index = np.full((num_chunks, 2), _MISSING, dtype="<u8")
+                self.end = 0
+            else:
+                magic, count = _SHARD_FOOTER.unpack(tail[len(tail) - _SHARD_FOOTER.size:])
+                if magic != _SHARD_MAGIC or count != num_chunks or size < count * 16 + _SHARD_FOOTER.size:
+                    raise RuntimeError("The shard file {} has no valid index. It was not closed after writing.".format(path))
+                self.end = size - count * 16 - _SHARD_FOOTER.size
+                start = len(tail) - _SHARD_FOOTER.size - count * 16
+                self.index = np.frombuffer(tail[start:start + count * 16], dtype="<u8").reshape(count, 2).copy()
+            stack.pop_all()
+
+    def read(self, index: int, key: str) -> Union[memoryview, bytes]:
+        if self._view is not None:
+            offset, length = self.index[index]
+            if offset == _MISSING:
+                raise KeyError(key)
+            return self._view[offset:offset + length]
+        with self.lock:
+            offset, length = self.index[index]
+            if offset == _MISSING:
+                raise KeyError(key)
+            self._file.seek(int(offset))
+            return self._file.read(int(length))
+
+    def write(self, index: int, data: np.ndarray) -> None:
+        with self.lock:
+            offset, length = self.index[index]
+            if offset == _MISSING or data.nbytes > length:
+                offset = self.end
+                self.end += data.nbytes
+            self._file.seek(int(offset))
+            self._file.write(data)
+            self.index[index] = (offset, data.nbytes)
+            self.dirty = True
+
+    def delete(self, index: int, key: str) -> None:
+        with self.lock:
+            if self.index[index, 0] == _MISSING:
+                raise KeyError(key)
+            self.index[index] = _MISSING
+            self.dirty = True
+
+    def contains(self, index: int) -> bool:
+        return bool(self.index[index, 0] != _MISSING)
+
+    def size(self, index: int) -> int:
+        offset, length = self.index[index]
+        return 0 if offset == _MISSING else int(length)
+
+    def stored(self) -> np.ndarray:
+        return np.flatnonzero(self.index[:, 0] != _MISSING)
+
+    def flush(self) -> None:
+        """
+        Write the index and the footer behind the chunks if the shard was written to.
+        """
+
+        with self.lock:
+            if not self.dirty:
+                return
+            self._file.seek(self.end)
+            self._file.write(self.index.tobytes())
+            self._file.write(_SHARD_FOOTER.pack(_SHARD_MAGIC, len(self.index)))
+            self._file.truncate()
+            self._file.flush()
+            self.dirty = False
+
+    def close(self, write_index: bool = True) -> None:
+        if self._file is not None:
+            if write_index:
+                self.flush()
+            self._file.close()
+            return
+        _release(self._view, self._mmap)
+
+
+def _release(view: memoryview, mapped: Optional[mmap.mmap]) -> None:
+    """
+    Release a view of a memory map and close the memory map.
+
+    Args:
+        view (memoryview): The view of the memory map.
+        mapped (Optional[mmap.mmap]): The memory map or None for an empty file.
+    """
+
+    try:
+        view.release()
+        if mapped is not None:
+            mapped.close()
+    except BufferError:
+        # Chunks that reference the memory map are still alive, it is closed once they are garbage collected
+        pass
+
+
+@contextlib.contextmanager
+def ignore_duplicate_names() -> Iterator[None]:
+    """
+    Ignore the warnings of zipfile about duplicate member names.
+
+    A zip file can only be appended to, so every rewritten member is appended under the same name and the latest
+    copy wins. The stale copies are removed by `compact_zip`.
+    """
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", "Duplicate name", UserWarning)
+        yield
+
+
+def stale_bytes(infos: List[zipfile.ZipInfo]) -> int:
+    """
+    Count the bytes of the stale members of a zip file, i.e. the members that were written again later.
+
+    Args:
+        infos (List[zipfile.ZipInfo]): The members of the zip file in the order of the central directory.
+
+    Returns:
+        int: The compressed size of the stale members.
+    """
+
+    latest = {info.filename: info for info in infos}
+    return sum(info.compress_size for info in infos if latest[info.filename] is not info)
+
+
+def compact_zip(path: str, min_stale_fraction: float = 0.0) -> int:
+    """
+    Remove the stale members of a zip file.
+
+    A zip file can only be appended to, so a member that is written again (e.g. a chunk that is updated) is
+    appended under the same name and the previous copy becomes stale. Readers always use the latest copy.
+    The compaction copies the latest copy of every member into a new file without decoding or encoding it
+    and atomically replaces the original file.
+
+    Args:
+        path (str): The path to the zip file. The file must not be open for writing.
+        min_stale_fraction (float, optional): Only compact the file if the stale members make up at least this
+            fraction of the file. Defaults to 0.0, which compacts every file with stale members.
+
+    Returns:
+        int: The number of bytes that were removed.
+    """
+
+    size = os.path.getsize(path)
+    partial_path = path + ".compact"
+    with zipfile.ZipFile(path) as src:
+        infos = src.infolist()
+        latest = {info.filename: info for info in infos}
+        stale = stale_bytes(infos)
+        if stale == 0 or stale < min_stale_fraction * size:
+            return 0
+        try:
+            with zipfile.ZipFile(partial_path, "w", allowZip64=True) as dst:
+                for info in infos:
+                    if latest[info.filename] is info:
+                        dst.writestr(info, src.read(info))
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+    os.replace(partial_path, path)
+    return size - os.path.getsize(path)
+
+
+def consolidate_zip(store: zarr.ZipStore) -> bool:
+    """
+    Write the metadata of all arrays and groups of a zip store into a single consolidated member.
+
+    The member has the format of `zarr.consolidate_metadata` and is appended as the last member of the zip file, right
+    in front of the central directory, so `read_consolidated` can read it with a single read from the end of the file.
+    It is only written if it is outdated or no longer the last member.
+
+    Args:
+        store (zarr.ZipStore): The zip store opened for writing.
+
+    Returns:
+        bool: Whether the consolidated metadata was written.
+    """
+
+    metadata = _consolidated_metadata(store, store.keys())
+    infos = store.zf.infolist()
+    if infos and infos[-1].filename == CONSOLIDATED_KEY and json.loads(bytes(store[CONSOLIDATED_KEY])) == metadata:
+        return False
+    with ignore_duplicate_names():
+        store[CONSOLIDATED_KEY] = json_dumps(metadata)
+    return True
+
+
+def consolidate(store: Store) -> bool:
+    """
+    Write the consolidated metadata of a store of any layout, see `consolidate_zip`.
+
+    The metadata of the directory layouts is found by walking the directory, so the chunks are not listed.
+
+    Args:
+        store (Store): The zip, directory or sharded store opened for writing.
+
+    Returns:
+        bool: Whether the consolidated metadata was written.
+    """
+
+    if isinstance(store, zarr.ZipStore):
+        return consolidate_zip(store)
+    keys = []
+    for directory, _, filenames in os.walk(store.path):
+        relative = os.path.relpath(directory, store.path)
+        prefix = "" if relative == "." else relative.replace(os.sep, "/") + "/"
+        keys.extend(prefix + name for name in filenames if name in _METADATA_KEYS[:3])
+    metadata = _consolidated_metadata(store, sorted(keys))
+    if CONSOLIDATED_KEY in store and json.loads(bytes(store[CONSOLIDATED_KEY])) == metadata:
+        return False
+    store[CONSOLIDATED_KEY] = json_dumps(metadata)
+    return True
+
+
+def _consolidated_metadata(store: Store, keys: Iterable[str]) -> dict:
+    """
+    Collect the metadata of all arrays and groups in the format of `zarr.consolidate_metadata`.
+
+    Args:
+        store (Store): The store.
+        keys (Iterable[str]): The keys of the store, of which the metadata keys are collected.
+
+    Returns:
+        dict: The consolidated metadata.
+    """
+
+    return {
+        "zarr_consolidated_format": 1,
+        "metadata": {key: json.loads(bytes(store[key])) for key in keys if key.endswith(_METADATA_KEYS[:3])},
+    }
+
+
+def detect_layout(path: str) -> str:
+    """
+    Detect the storage layout of a Mzarr file.
+
+    Args:
+        path (str): The path to the Mzarr file.
+
+    Returns:
+        str: 'sharded' for a directory with a SHARDS_KEY file, 'directory' for any other directory and 'zip' otherwise.
+    """
+
+    if os.path.isdir(path):
+        return "sharded" if os.path.isfile(os.path.join(path, SHARDS_KEY)) else "directory"
+    return "zip"
+
+
+def open_store(path: str, mode: str = 'a', layout: Optional[str] = None) -> Store:
+    """
+    Open the store of a Mzarr file.
+
+    Args:
+        path (str): The path to the Mzarr file.
+        mode (str, optional): The mode in which to open the store ('r', 'r+', 'a', 'w' or 'w-'). Files opened with
+            'r' are memory-mapped, see `MmapZipStore` and `ShardedStore`. Defaults to 'a'.
+        layout (str, optional): The storage layout, one of LAYOUTS. Defaults to None, which detects the layout of
+            an existing file and uses 'zip' for a new file.
+
+    Returns:
+        Store: The zarr store.
+
+    Raises:
+        RuntimeError: If the layout is unknown or a directory that should be read does not exist.
+    """
+
+    if layout is None:
+        layout = detect_layout(path)
+    if layout == "sharded":
+        return ShardedStore(path, mode)
+    if layout == "directory":
+        if mode in ('r', 'r+') and not os.path.isdir(path):
+            raise RuntimeError("No Mzarr directory exists under {}".format(path))
+        return zarr.DirectoryStore(path)
+    if layout == "zip":
+        return MmapZipStore(path) if mode == 'r' else zarr.ZipStore(path, mode=mode, compression=zipfile.ZIP_STORED)
+    raise RuntimeError("Unknown storage layout {}. Supported layouts are {}.".format(layout, ", ".join(LAYOUTS)))
+
+
+def read_consolidated(path: str, tail_bytes: int = TAIL_BYTES) -> Optional[dict]:
+    """
+    Read the consolidated metadata of a zip file without parsing its central directory.
+
+    The end of central directory record is read from the end of the file together with the central directory entry
+    of the last member right in front of it. The consolidated metadata is expected as this last member, see
+    `consolidate_zip`. Usually the tail of `tail_bytes` covers the member too, so the metadata of a file is read with a
+    single read. Otherwise only the member itself is read. If the last member is not the consolidated metadata (e.g.
+    for files written before consolidation or after `Mzarr.flush`), nothing more than the tail is read, so the memory
+    and the reads stay bounded no matter how large the file is.
+    For the directory layouts, the consolidated metadata is a plain file.
+
+    Args:
+        path (str): The path to the zip file or directory.
+        tail_bytes (int, optional): The number of bytes read from the end of the file at once. Defaults to 64 KiB.
+
+    Returns:
+        Optional[dict]: The metadata of every array and group keyed by the metadata key (e.g. 'base/.zarray'), or None
+            if the consolidated metadata is not the last member of the file or the central directory entry of the
+            last member is not in the tail.
+    """
+
+    if os.path.isdir(path):
+        try:
+            with open(os.path.join(path, CONSOLIDATED_KEY), "rb") as f:
+                return json.load(f)["metadata"]
+        except FileNotFoundError:
+            return None
+
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        tail_start = max(0, size - tail_bytes)
+        f.seek(tail_start)
+        tail = f.read()
+
+        def read(start: int, stop: int) -> bytes:
+            if start >= tail_start:
+                return tail[start - tail_start:stop - tail_start]
+            f.seek(start)
+            return f.read(stop - start)
+
+        index = tail.rfind(_END_OF_CENTRAL_DIRECTORY_SIGNATURE, 0, max(len(tail) - _END_OF_CENTRAL_DIRECTORY.size + 4, 0))
+        if index < 0:
+            return None
+        directory_size, directory_offset = _END_OF_CENTRAL_DIRECTORY.unpack_from(tail, index)[5:7]
+        if 0xFFFFFFFF in (directory_size, directory_offset) and index >= _ZIP64_LOCATOR.size:
+            locator = _ZIP64_LOCATOR.unpack_from(tail, index - _ZIP64_LOCATOR.size)
+            if locator[0] == _ZIP64_LOCATOR_SIGNATURE:
+                record = read(locator[2], locator[2] + _ZIP64_END_OF_CENTRAL_DIRECTORY.size)
+                directory_size, directory_offset = _ZIP64_END_OF_CENTRAL_DIRECTORY.unpack(record)[-2:]
+
+        # The central directory entry of the last member ends right in front of the end of central directory records
+        directory_end = directory_offset + directory_size
+        if directory_end < tail_start:
+            return None
+        entries = tail[:directory_end - tail_start]
+        position = len(entries)
+        name = CONSOLIDATED_KEY.encode()
+        while True:
+            position = entries.rfind(_CENTRAL_DIRECTORY_SIGNATURE, 0, position)
+            if position < 0:
+                # The last member is not the consolidated metadata, the file is not read any further
+                return None
+            if len(entries) - position < _CENTRAL_DIRECTORY.size:
+                continue
+            entry = _CENTRAL_DIRECTORY.unpack_from(entries, position)
+            name_start = position + _CENTRAL_DIRECTORY.size
+            extra_start = name_start + entry[12]
+            if extra_start + entry[13] + entry[14] == len(entries):
+                break
+        if entries[name_start:extra_start] != name:
+            return None
+        compress_size, header_offset = entry[10], entry[18]
+        if 0xFFFFFFFF in (entry[10], entry[11], entry[18]):
+            compress_size, header_offset = _zip64_sizes(entries[extra_start:extra_start + entry[13]], entry)
+
+        header = read(header_offset, header_offset + _LOCAL_HEADER.size)
+        if len(header) < _LOCAL_HEADER.size or header[:4] != _LOCAL_HEADER_SIGNATURE:
+            return None
+        header = _LOCAL_HEADER.unpack(header)
+        start = header_offset + _LOCAL_HEADER.size + header[-2] + header[-1]
+        member = read(start, start + compress_size)
+        if entry[6] == zipfile.ZIP_DEFLATED:
+            member = zlib.decompress(member, -zlib.MAX_WBITS)
+        elif entry[6] != zipfile.ZIP_STORED:
+            return None
+        return json.loads(member)["metadata"]
+
+
+def _zip64_sizes(extra: bytes, entry: tuple) -> Tuple[int, int]:
+    """
+    Read the compressed size and the local header offset of a central directory entry from its zip64 extra field.
+
+    Args:
+        extra (bytes): The extra field of the entry.
+        entry (tuple): The unpacked central directory entry, see `_CENTRAL_DIRECTORY`.
+
+    Returns:
+        Tuple[int, int]: The compressed size and the offset of the local header.
+    """
+
+    compress_size, header_offset = entry[10], entry[18]
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<2H", extra, position)
+        if header_id == 1:
+            # The zip64 field only holds the values that overflow in the entry, in this order
+            values = iter(struct.unpack_from("<{}Q".format(size // 8), extra, position + 4))
+            if entry[11] == 0xFFFFFFFF:
+                next(values)
+            if entry[10] == 0xFFFFFFFF:
+                compress_size = next(values)
+            if entry[18] == 0xFFFFFFFF:
+                header_offset = next(values)
+            break
+        position += 4 + size
+    return compress_size, header_offset
@@ -1,4 +1,6 @@
 import argparse
+import contextlib
+import warnings
 from os.path import join
 import os
 from os.path import join
@@ -6,9 +8,53 @@ from natsort import natsorted
 import tifffile
 from mzarr import Mzarr
 import numpy as np
+from typing import Optional, List, Tuple, Iterator
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from mzarr.batch import convert_all
+from mzarr.profiling import IOStats
 
 
-def tiff2mzarr(load_dir: str, save_dir: str, is_seg: bool, lossy: bool) -> None:
+def all_tiff2mzarr(
+        load_dir: str,
+        save_dir: str,
+        is_seg: bool,
+        lossy: bool,
+        workers: Optional[int] = None,
+        processes: int = 1,
+        memory_budget: Optional[int] = None,
+        manifest_filepath: Optional[str] = None,
+        overwrite: bool = False,
+        stats: Optional[IOStats] = None
+) -> List[dict]:
+    """
+    Converts every tiff directory within a directory to a mzarr file.
+
+    Outputs that are newer than all files of their tiff directory are skipped, so an interrupted conversion can be resumed.
+    See `mzarr.batch.convert_all` for the scheduling.
+
+    Args:
+        load_dir (str): Path to the directory containing the tiff directories.
+        save_dir (str): Path to the folder where the mzarr files should be saved.
+        is_seg (bool): Whether the images are segmentations.
+        lossy (bool): Whether lossy JpegXL compression should be used.
+        workers (int, optional): Number of threads used to encode the chunks of each image. Optional.
+        processes (int, optional): Number of images that are converted in parallel. Optional.
+        memory_budget (int, optional): Maximal estimated memory in bytes of all images converted in parallel. Optional.
+        manifest_filepath (str, optional): Path to a JSON lines file with the timing and compression ratio of every image. Optional.
+        overwrite (bool, optional): Whether to convert images with an up-to-date mzarr file again. Optional.
+        stats (IOStats, optional): Collects the instrumentation of all conversions, see `mzarr.profiling`. Optional.
+
+    Returns:
+        The manifest entries of all images.
+    """
+    names = natsorted([name for name in os.listdir(load_dir) if os.path.isdir(join(load_dir, name))])
+    jobs = [(join(load_dir, name), join(save_dir, "{}.mzarr".format(name))) for name in names]
+    convert = partial(tiffdir2mzarr, is_seg=is_seg, lossy=lossy, workers=workers)
+    return convert_all(jobs, convert, processes, tiff_nbytes, memory_budget, manifest_filepath=manifest_filepath, overwrite=overwrite, stats=stats)
+
+
+def tiff2mzarr(load_dir: str, save_dir: str, is_seg: bool, lossy: bool, workers: Optional[int] = None, slab_size: int = 16) -> None:
     """
     Converts a tiff files of an image to a mzarr file.
 
@@ -17,12 +63,150 @@ def tiff2mzarr(load_dir: str, save_dir: str, is_seg: bool, lossy: bool) -> None:
         save_dir (str): Path to the folder where the mzarr file should be saved.
         is_seg (bool): Whether the image is a segmentation.
         lossy (bool): Whether lossy JpegXL compression should be used.
+        workers (int, optional): Number of threads used to encode the chunks. Optional.
+        slab_size (int, optional): Number of slices that are read at once. Optional.
     """
     name = os.path.basename(os.path.normpath(load_dir))
+    tiffdir2mzarr(load_dir, join(save_dir, "{}.mzarr".format(name)), is_seg, lossy, workers, slab_size)
+
+
+def tiffdir2mzarr(load_dir: str, save_filepath: str, is_seg: bool, lossy: bool, workers: Optional[int] = None, slab_size: int = 16) -> None:
+    """
+    Converts a tiff files of an image to a mzarr file at the given path.
+
+    The image is never loaded as a whole. Instead, it is read slab by slab (see `load_tiff_slabs`) and every slab
+    is added to all pyramid levels as it arrives, so the memory is bounded by the slab and chunk size.
+
+    Args:
+        load_dir (str): Path to the tiff directory.
+        save_filepath (str): Path to where the mzarr file should be saved.
+        is_seg (bool): Whether the image is a segmentation.
+        lossy (bool): Whether lossy JpegXL compression should be used.
+        workers (int, optional): Number of threads used to encode the chunks. Optional.
+        slab_size (int, optional): Number of slices that are read at once. Optional.
+    """
     filepaths = load_filepaths(load_dir)
-    image = tifffile.imread(filepaths)
-    image = Mzarr(image)    
-    image.save(join(save_dir, "{}.mzarr".format(name)), is_seg=is_seg, lossless=not lossy)
+    slabs, shape, dtype = load_tiff_slabs(filepaths, slab_size)
+    with ThreadPoolExecutor(workers) if workers is not None and workers > 1 else contextlib.nullcontext() as pool:
+        Mzarr.from_slabs(slabs, shape, dtype).save(save_filepath, is_seg=is_seg, lossless=not lossy, workers=pool)
+
+
+def load_tiff_slabs(filepaths: List[str], slab_size: int = 16) -> Tuple[Iterator[np.ndarray], Tuple[int, ...], np.dtype]:
+    """
+    Reads a tiff stack slab by slab along its first axis, with the same layout as `tifffile.imread(filepaths)`.
+
+    Multiple files are stacked, each file being one slice. A single file is split along the first axis of its
+    image series. Uncompressed and contiguous files are memory-mapped, so only the slices of the current slab are
+    read from disk. Compressed files are read page by page, unless their pages do not split along the first axis
+    (e.g. a single volumetric page), which loads the whole image. The next slab is read in a background thread
+    while the current slab is processed.
+
+    Args:
+        filepaths: The paths of the tiff files.
+        slab_size: Number of slices per slab. Optional.
+
+    Returns:
+        An iterator over the slabs, the shape and the dtype of the full stack.
+    """
+    with tifffile.TiffFile(filepaths[0]) as tif:
+        series = tif.series[0]
+        shape, dtype = tuple(series.shape), np.dtype(series.dtype)
+    if len(filepaths) == 1:
+        slabs = _read_page_slabs(filepaths[0], shape, slab_size)
+    else:
+        slabs = _read_file_slabs(filepaths, shape, dtype, slab_size)
+        shape = (len(filepaths),) + shape
+    return _prefetch(slabs), shape, dtype
+
+
+def tiff_nbytes(load_dir: str) -> int:
+    """
+    Computes the uncompressed size of a tiff directory from the header of its first file without reading the images.
+
+    Args:
+        load_dir: Path to the tiff directory.
+
+    Returns:
+        The uncompressed size in bytes.
+    """
+    filepaths = load_filepaths(load_dir)
+    with tifffile.TiffFile(filepaths[0]) as tif:
+        series = tif.series[0]
+        return int(np.prod(series.shape)) * np.dtype(series.dtype).itemsize * len(filepaths)
+
+
+def _read_page_slabs(filepath: str, shape: Tuple[int, ...], slab_size: int) -> Iterator[np.ndarray]:
+    """
+    Reads the image series of a single tiff file slab by slab.
+
+    Args:
+        filepath: The path of the tiff file.
+        shape: The shape of the image series.
+        slab_size: Number of slices per slab.
+
+    Yields:
+        The slabs.
+    """
+    try:
+        image = tifffile.memmap(filepath, mode="r")
+    except ValueError:
+        # Compressed or non-contiguous data cannot be memory-mapped
+        image = None
+    if image is None:
+        with tifffile.TiffFile(filepath) as tif:
+            pages = len(tif.series[0].pages)
+            if pages % shape[0] == 0:
+                # Every slice along the first axis spans the same number of pages, e.g. the channels of a hyperstack
+                per_slice = pages // shape[0]
+                for start in range(0, shape[0], slab_size):
+                    key = range(start * per_slice, min(start + slab_size, shape[0]) * per_slice)
+                    yield tif.asarray(key=key, series=0).reshape((-1,) + shape[1:])
+                return
+            warnings.warn("The pages of {} do not split along its first axis, so the whole image is loaded into memory.".format(filepath), stacklevel=2)
+            image = tif.asarray()
+    for start in range(0, shape[0], slab_size):
+        yield np.array(image[start:start + slab_size])
+
+
+def _read_file_slabs(filepaths: List[str], shape: Tuple[int, ...], dtype: np.dtype, slab_size: int) -> Iterator[np.ndarray]:
+    """
+    Reads a stack of tiff files slab by slab, each file being one slice.
+
+    Args:
+        filepaths: The paths of the tiff files.
+        shape: The shape of a single file.
+        dtype: The dtype of the files.
+        slab_size: Number of files per slab.
+
+    Yields:
+        The slabs.
+    """
+    for start in range(0, len(filepaths), slab_size):
+        group = filepaths[start:start + slab_size]
+        slab = np.empty((len(group),) + shape, dtype=dtype)
+        for index, filepath in enumerate(group):
+            slab[index] = tifffile.imread(filepath)
+        yield slab
+
+
+def _prefetch(slabs: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+    """
+    Reads the next slab in a background thread while the current slab is processed.
+
+    Args:
+        slabs: The slabs.
+
+    Yields:
+        The slabs.
+    """
+    with ThreadPoolExecutor(1) as executor:
+        future = executor.submit(next, slabs, None)
+        while True:
+            slab = future.result()
+            if slab is None:
+                return
+            future = executor.submit(next, slabs, None)
+            yield slab
 
 
 def load_filepaths(load_dir: str, extension: str = None, return_path: bool = True, return_extension: bool = True) -> np.ndarray:
@@ -78,6 +262,24 @@ if __name__ == '__main__':
     parser.add_argument('-o', "--output", required=True, help="Absolute output path to the folder that should be used for the Mzarr images.")
     parser.add_argument('--seg', required=False, default=False, action="store_true", help="Whether the image is a segmentation.")
     parser.add_argument('--lossy', required=False, default=False, action="store_true", help="Whether lossy JpegXL compression should be used.")
+    parser.add_argument('--workers', required=False, default=None, type=int, help="Number of threads used to encode the chunks.")
+    parser.add_argument('--slab', required=False, default=16, type=int, help="Number of slices that are read at once.")
+    parser.add_argument('--batch', required=False, default=False, action="store_true", help="Whether the input directory contains multiple TIFF directories that should each be converted.")
+    parser.add_argument('--processes', required=False, default=1, type=int, help="Number of images that are converted in parallel. Only used with --batch.")
+    parser.add_argument('--memory', required=False, default=None, type=float, help="Maximal estimated memory in GB of all images converted in parallel. Only used with --batch.")
+    parser.add_argument('--manifest', required=False, default=None, help="Path to a JSON lines file with the timing and compression ratio of every image. Only used with --batch.")
+    parser.add_argument('--overwrite', required=False, default=False, action="store_true", help="Whether to convert images with an up-to-date mzarr file again. Only used with --batch.")
+    parser.add_argument('--profile', required=False, default=False, action="store_true", help="Whether to print where the time of the conversion goes.")
     args = parser.parse_args()
 
-    tiff2mzarr(args.input, args.output, args.seg, args.lossy)
+    stats = IOStats() if args.profile else None
+    if args.batch:
+        memory_budget = None if args.memory is None else int(args.memory * 1024 ** 3)
+        all_tiff2mzarr(args.input, args.output, args.seg, args.lossy, args.workers, args.processes, memory_budget, args.manifest, args.overwrite, stats)
+    elif stats is not None:
+        with stats:
+            tiff2mzarr(args.input, args.output, args.seg, args.lossy, args.workers, args.slab)
+    else:
+        tiff2mzarr(args.input, args.output, args.seg, args.lossy, args.workers, args.slab)
+    if stats is not None:
+        print(stats.summary())
@@ -0,0 +1,267 @@
+import numpy as np
+import numcodecs
+from typing import Optional, List, Tuple, Any
+import itertools
+import argparse
+import zarr
+import math
+import time
+from mzarr.chunk_io import decode_chunk
+from mzarr.storage import open_store
+
+
+# Lossless candidates for the base level and every other level that needs to stay exact
+LOSSLESS_CODECS = [
+    {"id": "imagecodecs_jpegxl", "lossless": True, "effort": 1},
+    {"id": "imagecodecs_jpegxl", "lossless": True, "effort": 3},
+    {"id": "imagecodecs_jpegxl", "lossless": True, "effort": 7},
+    {"id": "blosc", "cname": "zstd", "clevel": 3, "shuffle": numcodecs.Blosc.BITSHUFFLE},
+    {"id": "blosc", "cname": "zstd", "clevel": 9, "shuffle": numcodecs.Blosc.BITSHUFFLE},
+    {"id": "blosc", "cname": "lz4", "clevel": 5, "shuffle": numcodecs.Blosc.SHUFFLE},
+    {"id": "zstd", "level": 3},
+    {"id": "zstd", "level": 9},
+    {"id": "lz4", "acceleration": 1},
+]
+
+# Additional lossy candidates for the coarser pyramid levels. The distance is capped at the JpegXl default of 1.0,
+# so an automatically tuned level is never of lower quality than the default lossy level.
+LOSSY_CODECS = [
+    {"id": "imagecodecs_jpegxl", "lossless": False, "effort": 3, "distance": 0.5},
+    {"id": "imagecodecs_jpegxl", "lossless": False, "effort": 3, "distance": 1.0},
+    {"id": "imagecodecs_jpegxl", "lossless": False, "effort": 7, "distance": 1.0},
+]
+
+
+def benchmark_codecs(
+        sample: np.ndarray,
+        chunks: Optional[Tuple[int, ...]] = None,
+        codecs: Optional[List[dict]] = None,
+        repeats: int = 1
+) -> List[dict]:
+    """
+    Benchmark codecs on a sample of an image.
+
+    The sample is split into chunks, which are encoded and decoded one by one like zarr does. For every codec,
+    the encode and decode throughput (in MB/s of uncompressed data), the compression ratio, the PSNR and the
+    maximal absolute error are measured. Codecs that cannot encode the sample (e.g. JpegXl on unsupported shapes)
+    are skipped.
+
+    Args:
+        sample (np.ndarray): The sample of the image.
+        chunks (Tuple[int, ...], optional): The chunk shape. Defaults to None, which uses the sample as a single chunk.
+        codecs (List[dict], optional): The numcodecs configs of the codecs. Defaults to all lossless and lossy candidates.
+        repeats (int, optional): The number of repetitions, of which the fastest is reported. Defaults to 1.
+
+    Returns:
+        List[dict]: The results of every codec with the keys 'codec', 'encode_mbps', 'decode_mbps', 'ratio',
+            'psnr', 'max_error' and 'lossless'.
+    """
+
+    if codecs is None:
+        codecs = LOSSLESS_CODECS + LOSSY_CODECS
+    if chunks is None:
+        chunks = sample.shape
+    blocks = [np.ascontiguousarray(block) for block in _split(sample, chunks)]
+    nbytes = sum(block.nbytes for block in blocks)
+
+    results = []
+    for config in codecs:
+        codec = numcodecs.get_codec(dict(config))
+        try:
+            encode_seconds, encoded = _timed(lambda codec=codec: [codec.encode(block) for block in blocks], repeats)
+            decode_seconds, decoded = _timed(lambda codec=codec, encoded=encoded: [codec.decode(cdata) for cdata in encoded], repeats)
+        except (ValueError, RuntimeError, TypeError):
+            continue
+        decoded = [decode_chunk(None, d, sample.dtype, block.shape) for d, block in zip(decoded, blocks)]
+        max_error, psnr = _error(blocks, decoded)
+        results.append({
+            "codec": dict(config),
+            "encode_mbps": nbytes / 1e6 / max(encode_seconds, 1e-9),
+            "decode_mbps": nbytes / 1e6 / max(decode_seconds, 1e-9),
+            "ratio": nbytes / max(sum(len(cdata) for cdata in encoded), 1),
+            "psnr": psnr,
+            "max_error": max_error,
+            "lossless": max_error == 0,
+        })
+    return results
+
+
+def select_codec(
+        results: List[dict],
+        lossless: bool = True,
+        min_decode_mbps: Optional[float] = None,
+        min_encode_mbps: Optional[float] = None,
+        min_ratio: Optional[float] = None
+) -> dict:
+    """
+    Select the codec that best meets a target from benchmark results.
+
+    Among the codecs that meet all given minimums, the one with the highest compression ratio is selected,
+    unless only a minimal ratio is given, in which case the one with the fastest decoding is selected.
+    If no codec meets the target, the codec that comes closest to it is selected.
+
+    Args:
+        results (List[dict]): The results of `benchmark_codecs`.
+        lossless (bool, optional): Whether only lossless codecs are allowed. Defaults to True.
+        min_decode_mbps (float, optional): The minimal decode throughput in MB/s. Defaults to None.
+        min_encode_mbps (float, optional): The minimal encode throughput in MB/s. Defaults to None.
+        min_ratio (float, optional): The minimal compression ratio. Defaults to None.
+
+    Returns:
+        dict: The result of the selected codec.
+
+    Raises:
+        RuntimeError: If none of the results is allowed.
+    """
+
+    candidates = [result for result in results if result["lossless"] or not lossless]
+    if len(candidates) == 0:
+        raise RuntimeError("None of the benchmarked codecs is {}.".format("lossless" if lossless else "usable"))
+    targets = [("decode_mbps", min_decode_mbps), ("encode_mbps", min_encode_mbps), ("ratio", min_ratio)]
+    targets = [(key, value) for key, value in targets if value is not None]
+
+    def shortfall(result: dict) -> float:
+        return sum(max(0.0, math.log(value / max(result[key], 1e-9))) for key, value in targets)
+
+    best = min(shortfall(result) for result in candidates)
+    candidates = [result for result in candidates if shortfall(result) == best]
+    if len(targets) == 1 and targets[0][0] == "ratio":
+        return max(candidates, key=lambda result: result["decode_mbps"])
+    return max(candidates, key=lambda result: result["ratio"])
+
+
+def tune(
+        sample: np.ndarray,
+        chunks: Optional[Tuple[int, ...]] = None,
+        lossless: bool = True,
+        target: Optional[dict] = None,
+        codecs: Optional[List[dict]] = None
+) -> dict:
+    """
+    Benchmark the candidate codecs on a sample and select the one that best meets the target.
+
+    Args:
+        sample (np.ndarray): The sample of the image.
+        chunks (Tuple[int, ...], optional): The chunk shape. Defaults to None, which uses the sample as a single chunk.
+        lossless (bool, optional): Whether only lossless codecs are allowed. Defaults to True.
+        target (dict, optional): The keyword arguments of `select_codec`, i.e. 'min_decode_mbps', 'min_encode_mbps'
+            and 'min_ratio'. Defaults to None, which selects the codec with the highest compression ratio.
+        codecs (List[dict], optional): The numcodecs configs of the candidates. Defaults to the lossless candidates
+            and, if lossy compression is allowed, the lossy candidates.
+
+    Returns:
+        dict: The result of the selected codec, see `benchmark_codecs`.
+
+    Raises:
+        RuntimeError: If the target contains unknown keys.
+    """
+
+    target = dict(target or {})
+    unknown = set(target) - {"min_decode_mbps", "min_encode_mbps", "min_ratio"}
+    if unknown:
+        raise RuntimeError("Unknown compression targets {}. Supported are 'min_decode_mbps', 'min_encode_mbps' and 'min_ratio'.".format(sorted(unknown)))
+    if codecs is None:
+        codecs = LOSSLESS_CODECS if lossless else LOSSLESS_CODECS + LOSSY_CODECS
+    return select_codec(benchmark_codecs(sample, chunks, codecs), lossless, **target)
+
+
+def sample_array(array: Any, chunks: Tuple[int, ...], max_chunks: int = 8) -> np.ndarray:
+    """
+    Take a central sample of an array that covers at most a few chunks.
+
+    Args:
+        array (Any): The array. Can be any array-like that supports slicing.
+        chunks (Tuple[int, ...]): The chunk shape of the array.
+        max_chunks (int, optional): The maximal number of chunks in the sample. Defaults to 8.
+
+    Returns:
+        np.ndarray: The sample.
+    """
+
+    per_axis = max(1, int(math.floor(max_chunks ** (1 / len(array.shape)) + 1e-9)))
+    region = []
+    for size, chunk in zip(array.shape, chunks):
+        length = min(size, chunk * per_axis)
+        start = (size - length) // 2
+        region.append(slice(start, start + length))
+    return np.asarray(array[tuple(region)])
+
+
+def _split(array: np.ndarray, chunks: Tuple[int, ...]) -> List[np.ndarray]:
+    """
+    Split an array into full chunks, discarding partial chunks at the border unless no full chunk exists.
+
+    Args:
+        array (np.ndarray): The array.
+        chunks (Tuple[int, ...]): The chunk shape.
+
+    Returns:
+        List[np.ndarray]: The chunks.
+    """
+
+    chunks = tuple(min(c, s) for c, s in zip(chunks, array.shape))
+    ranges = [range(0, max(s - c, 0) + 1, c) for s, c in zip(array.shape, chunks)]
+    return [array[tuple(slice(i, i + c) for i, c in zip(index, chunks))] for index in itertools.product(*ranges)]
+
+
+def _timed(func: Any, repeats: int) -> Tuple[float, Any]:
+    """
+    Run a function several times and measure the fastest run.
+
+    Args:
+        func (Any): The function.
+        repeats (int): The number of runs.
+
+    Returns:
+        Tuple[float, Any]: The duration of the fastest run in seconds and the result of the last run.
+    """
+
+    best, result = float("inf"), None
+    for _ in range(max(repeats, 1)):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _error(blocks: List[np.ndarray], decoded: List[np.ndarray]) -> Tuple[float, float]:
+    """
+    Compute the maximal absolute error and the PSNR between the original and the decoded chunks.
+
+    Args:
+        blocks (List[np.ndarray]): The original chunks.
+        decoded (List[np.ndarray]): The decoded chunks.
+
+    Returns:
+        Tuple[float, float]: The maximal absolute error and the PSNR in dB (infinite for lossless codecs).
+    """
+
+    original = np.concatenate([block.ravel() for block in blocks]).astype(np.float64)
+    result = np.concatenate([block.ravel() for block in decoded]).astype(np.float64)
+    difference = np.abs(original - result)
+    max_error = float(difference.max()) if difference.size > 0 else 0.0
+    mse = float(np.mean(difference ** 2)) if difference.size > 0 else 0.0
+    if mse == 0:
+        return max_error, float("inf")
+    if np.issubdtype(blocks[0].dtype, np.integer):
+        peak = float(np.iinfo(blocks[0].dtype).max)
+    else:
+        peak = float(original.max() - original.min()) or 1.0
+    return max_error, 10 * math.log10(peak ** 2 / mse)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', "--input", required=True, help="Absolute input path to the Mzarr file or directory whose base level is benchmarked.")
+    parser.add_argument('--chunks', required=False, default=8, type=int, help="Maximal number of chunks in the sample.")
+    parser.add_argument('--repeats', required=False, default=3, type=int, help="Number of repetitions of every measurement.")
+    args = parser.parse_args()
+
+    store = open_store(args.input, mode='r')
+    base = zarr.open(store, mode='r')["base"]
+    sample = sample_array(base, base.chunks, args.chunks)
+    print("{:<60} {:>10} {:>10} {:>8} {:>8} {:>10}".format("codec", "enc MB/s", "dec MB/s", "ratio", "psnr", "max error"))
+    for result in benchmark_codecs(sample, base.chunks, repeats=args.repeats):
+        codec = ", ".join("{}={}".format(key, value) for key, value in result["codec"].items())
+        print("{:<60} {:>10.1f} {:>10.1f} {:>8.2f} {:>8.1f} {:>10g}".format(codec, result["encode_mbps"], result["decode_mbps"], result["ratio"], result["psnr"], result["max_error"]))
+    store.close()